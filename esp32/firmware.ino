@@ -49,7 +49,7 @@ U8G2_SH1106_128X64_NONAME_F_HW_I2C u8g2(
 bool g_oledOK = false;
 
 // ======== AUDIO CONFIG (MIC) ========
-#define SAMPLE_RATE       16000
+#define SAMPLE_RATE       16000   // sent in HELLO; server resamples any 8000..96000 Hz to the model rate
 #define SAMPLES_PER_BLOCK 512
 
 // ======== TEXT / SCROLL STATE ========
@@ -66,6 +66,22 @@ bool   g_pauseStream         = false;  // true -> do not send mic (used only whi
 bool   g_audioPlaying        = false;  // true -> reading PCM from server
 size_t g_audioBytesRemaining = 0;
 
+// ======== AUDIO CODECS ========
+// Codecs this firmware can decode, announced in HELLO (most preferred first).
+// Server answers with "__codec__ <name>" when it picks something other than PCM16.
+#define TTS_CODECS "ADPCM,ULAW,PCM16"
+
+enum AudioCodec { CODEC_PCM16, CODEC_ULAW, CODEC_ADPCM };
+AudioCodec g_ttsCodec   = CODEC_PCM16;
+int32_t    g_adpcmPred  = 0;    // IMA-ADPCM decoder state, reset on __speaking_on__
+int        g_adpcmIndex = 0;
+
+// Mic upload format, declared in HELLO. PCM16 = 32 KB/s, ULAW = 16 KB/s, ADPCM = 8 KB/s.
+const AudioCodec MIC_CODEC = CODEC_PCM16;
+int32_t    g_micPred    = 0;    // IMA-ADPCM encoder state, kept for the whole connection
+int        g_micIndex   = 0;
+int        g_micNibble  = -1;   // pending low nibble (ADPCM packs 2 samples per byte)
+
 // ======== LANGUAGE STATE ========
 bool   lang_ru       = true;   // true = Russian, false = English
 bool   lang_selected = false;  // language chosen on startup
@@ -84,6 +100,8 @@ void i2s_install_speaker();
 void ensure_connection();
 void speaker_test_beep();
 void selectLanguageOnce();
+size_t decode_tts(const uint8_t* in, size_t len, int16_t* out);
+size_t encode_mic(const int16_t* in, size_t n, uint8_t* out);
 
 // ================== SETUP ==================
 void setup() {
@@ -165,6 +183,7 @@ void setup() {
 void loop() {
   static int32_t i2s_buffer[SAMPLES_PER_BLOCK];
   static int16_t pcm16[SAMPLES_PER_BLOCK];
+  static uint8_t mic_enc[SAMPLES_PER_BLOCK];
 
   ensure_connection();
   if (!client.connected()) {
@@ -193,8 +212,13 @@ void loop() {
         if (s < -32768) s = -32768;
         pcm16[i] = (int16_t)s;
       }
-      size_t to_send = n * sizeof(int16_t);
-      client.write((uint8_t*)pcm16, to_send);
+      if (MIC_CODEC == CODEC_PCM16) {
+        size_t to_send = n * sizeof(int16_t);
+        client.write((uint8_t*)pcm16, to_send);
+      } else {
+        size_t to_send = encode_mic(pcm16, n, mic_enc);
+        if (to_send > 0) client.write(mic_enc, to_send);
+      }
     }
   }
 
@@ -208,7 +232,13 @@ void loop() {
     int actuallyRead = client.read(buf, toRead);
     if (actuallyRead > 0) {
       size_t written = 0;
-      i2s_write(I2S_SPK_PORT, buf, actuallyRead, &written, 50);
+      if (g_ttsCodec == CODEC_PCM16) {
+        i2s_write(I2S_SPK_PORT, buf, actuallyRead, &written, 50);
+      } else {
+        static int16_t pcm_out[sizeof(buf) * 2];   // ADPCM: 2 samples per byte
+        size_t n = decode_tts(buf, (size_t)actuallyRead, pcm_out);
+        i2s_write(I2S_SPK_PORT, pcm_out, n * sizeof(int16_t), &written, 50);
+      }
 
       if (g_audioBytesRemaining >= (size_t)actuallyRead)
         g_audioBytesRemaining -= (size_t)actuallyRead;
@@ -259,8 +289,19 @@ void loop() {
         continue;
       }
 
+      if (line.startsWith("__codec__")) {
+        String name = line.substring(line.indexOf(' ') + 1);
+        name.trim();
+        if (name == "ULAW")       g_ttsCodec = CODEC_ULAW;
+        else if (name == "ADPCM") g_ttsCodec = CODEC_ADPCM;
+        else                      g_ttsCodec = CODEC_PCM16;
+        continue;
+      }
+
       if (line == "__speaking_on__") {
         g_pauseStream = true;
+        g_adpcmPred   = 0;   // server starts a fresh encoder per utterance
+        g_adpcmIndex  = 0;
         continue;
       }
       if (line == "__speaking_off__") {
@@ -565,6 +606,117 @@ void speaker_test_beep() {
   Serial.println("Speaker test done");
 }
 
+// ================== TTS DECODERS ==================
+// Must match server/audio_codec.py.
+
+static int16_t ulaw_decode(uint8_t u) {
+  u = ~u;
+  int t = (((int)(u & 0x0F)) << 3) + 0x84;
+  t <<= (u & 0x70) >> 4;
+  return (int16_t)((u & 0x80) ? (0x84 - t) : (t - 0x84));
+}
+
+static const int16_t ADPCM_STEPS[89] = {
+  7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+  50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+  253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+  1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+  3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+  11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+  32767
+};
+static const int8_t ADPCM_INDEX_DELTA[16] = {
+  -1, -1, -1, -1, 2, 4, 6, 8, -1, -1, -1, -1, 2, 4, 6, 8
+};
+
+static int16_t adpcm_decode_nibble(uint8_t code) {
+  int step = ADPCM_STEPS[g_adpcmIndex];
+  int vpdiff = step >> 3;
+  if (code & 4) vpdiff += step;
+  if (code & 2) vpdiff += step >> 1;
+  if (code & 1) vpdiff += step >> 2;
+
+  if (code & 8) g_adpcmPred -= vpdiff;
+  else          g_adpcmPred += vpdiff;
+  if (g_adpcmPred > 32767)  g_adpcmPred = 32767;
+  if (g_adpcmPred < -32768) g_adpcmPred = -32768;
+
+  g_adpcmIndex += ADPCM_INDEX_DELTA[code];
+  if (g_adpcmIndex < 0)  g_adpcmIndex = 0;
+  if (g_adpcmIndex > 88) g_adpcmIndex = 88;
+  return (int16_t)g_adpcmPred;
+}
+
+// Decodes len encoded bytes into out; returns number of samples.
+size_t decode_tts(const uint8_t* in, size_t len, int16_t* out) {
+  size_t n = 0;
+  if (g_ttsCodec == CODEC_ULAW) {
+    for (size_t i = 0; i < len; i++) out[n++] = ulaw_decode(in[i]);
+  } else if (g_ttsCodec == CODEC_ADPCM) {
+    for (size_t i = 0; i < len; i++) {
+      out[n++] = adpcm_decode_nibble(in[i] & 0x0F);   // low nibble first
+      out[n++] = adpcm_decode_nibble(in[i] >> 4);
+    }
+  }
+  return n;
+}
+
+// ================== MIC ENCODERS ==================
+// Must match the decoders in server/audio_codec.py.
+
+static uint8_t ulaw_encode(int16_t pcm) {
+  int sign = (pcm < 0) ? 0x80 : 0;
+  int mag  = (pcm < 0) ? -(int)pcm : pcm;
+  if (mag > 32635) mag = 32635;
+  mag += 0x84;
+  int exp = 7;
+  for (int mask = 0x4000; (mag & mask) == 0 && exp > 0; mask >>= 1) exp--;
+  int mant = (mag >> (exp + 3)) & 0x0F;
+  return (uint8_t)~(sign | (exp << 4) | mant);
+}
+
+static uint8_t adpcm_encode_sample(int16_t sample) {
+  int step = ADPCM_STEPS[g_micIndex];
+  int diff = sample - g_micPred;
+  uint8_t code = 0;
+  if (diff < 0) { code = 8; diff = -diff; }
+  int vpdiff = step >> 3;
+  if (diff >= step) { code |= 4; diff -= step; vpdiff += step; }
+  step >>= 1;
+  if (diff >= step) { code |= 2; diff -= step; vpdiff += step; }
+  step >>= 1;
+  if (diff >= step) { code |= 1; vpdiff += step; }
+
+  if (code & 8) g_micPred -= vpdiff;
+  else          g_micPred += vpdiff;
+  if (g_micPred > 32767)  g_micPred = 32767;
+  if (g_micPred < -32768) g_micPred = -32768;
+
+  g_micIndex += ADPCM_INDEX_DELTA[code];
+  if (g_micIndex < 0)  g_micIndex = 0;
+  if (g_micIndex > 88) g_micIndex = 88;
+  return code;
+}
+
+// Encodes n mic samples into out; returns number of bytes to send.
+size_t encode_mic(const int16_t* in, size_t n, uint8_t* out) {
+  size_t len = 0;
+  if (MIC_CODEC == CODEC_ULAW) {
+    for (size_t i = 0; i < n; i++) out[len++] = ulaw_encode(in[i]);
+  } else if (MIC_CODEC == CODEC_ADPCM) {
+    for (size_t i = 0; i < n; i++) {
+      uint8_t code = adpcm_encode_sample(in[i]);
+      if (g_micNibble < 0) {
+        g_micNibble = code;                       // low nibble first
+      } else {
+        out[len++] = (uint8_t)(g_micNibble | (code << 4));
+        g_micNibble = -1;
+      }
+    }
+  }
+  return len;
+}
+
 // ================== TCP ==================
 void ensure_connection() {
   if (client.connected()) return;
@@ -572,7 +724,13 @@ void ensure_connection() {
   Serial.printf("Connecting to server %s:%u...\n", SERVER_IP, SERVER_PORT);
   if (client.connect(SERVER_IP, SERVER_PORT)) {
     Serial.println("Server connected");
-    client.println("HELLO ESP32 PCM16 16000");
+    const char* micFormat =
+        MIC_CODEC == CODEC_ULAW ? "ULAW" : MIC_CODEC == CODEC_ADPCM ? "ADPCM" : "PCM16";
+    client.printf("HELLO ESP32 %s %d TTS=%s\n", micFormat, SAMPLE_RATE, TTS_CODECS);
+    g_ttsCodec  = CODEC_PCM16;   // until the server says otherwise
+    g_micPred   = 0;             // server starts a fresh decoder per connection
+    g_micIndex  = 0;
+    g_micNibble = -1;
     showOledMessage("Server:", "Connected");
     delay(800);
   } else {
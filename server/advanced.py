@@ -356,50 +356,13 @@ def speak(conn: socket.socket, text: str):
             return
         send_line(conn, "__speaking_off__")
         
-import urllib.request
-import urllib.parse
-
-def get_weather_wttr(location: str, lang: str) -> str:
-    location = (location or "").strip()
-    if not location:
-        location = "Astana"
-
-    loc = urllib.parse.quote(location)
-    url = f"https://wttr.in/{loc}?format=3"
+import weather
 
-    try:
-        with urllib.request.urlopen(url, timeout=5) as resp:
-            text = resp.read().decode("utf-8", errors="ignore").strip()
-
-            if not text:
-                return "Пустой ответ от сервиса погоды."
-
-            # ---- локализация ----
-            if lang == "ru":
-                text = (
-                    text.replace("Feels like", "Ощущается как")
-                        .replace("Clear", "Ясно")
-                        .replace("Sunny", "Солнечно")
-                        .replace("Partly cloudy", "Переменная облачность")
-                        .replace("Cloudy", "Облачно")
-                        .replace("Overcast", "Пасмурно")
-                        .replace("Rain", "Дождь")
-                        .replace("Snow", "Снег")
-                        .replace("Mist", "Туман")
-                        .replace("Wind", "Ветер")
-                )
-                return f"Погода: {text}"
-
-            # EN
-            return f"Weather: {text}"
+# cached, pooled wttr.in lookups (see weather.py)
+WEATHER = weather.WeatherService()
 
-    except Exception as e:
-        print("WEATHER ERROR:", e)
-        return (
-            "Не удалось получить погоду."
-            if lang == "ru"
-            else "I couldn't fetch the weather right now."
-    )
+def get_weather_wttr(location: str, lang: str) -> str:
+    return WEATHER.reply(location, lang)
 
 
 
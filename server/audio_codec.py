@@ -0,0 +1,296 @@
+"""
+Audio codecs for the ESP32 link.
+
+PCM16 is the raw little-endian 16-bit stream the server always used.
+ULAW is G.711 mu-law (1 byte per sample, 2x smaller).
+ADPCM is IMA-ADPCM (4 bits per sample, 4x smaller), low nibble first.
+
+Encoders are stateful because TTS audio arrives in chunks: an odd trailing
+byte (or an unpaired ADPCM sample) is carried over to the next call, and
+flush() emits whatever is left at the end of an utterance.
+The matching decoders live in esp32/firmware.ino.
+
+Decoders handle the upstream (microphone) direction: the firmware declares
+its format in HELLO and the server turns it back into PCM16 before Vosk.
+"""
+
+import numpy as np
+
+CODECS = ("PCM16", "ULAW", "ADPCM")
+
+# ===== MU-LAW (G.711) =====
+ULAW_BIAS = 0x84
+ULAW_CLIP = 32635
+
+# exponent for (biased magnitude >> 7), 0..255
+_ULAW_EXP_LUT = np.zeros(256, dtype=np.int32)
+for _i in range(1, 256):
+    _ULAW_EXP_LUT[_i] = _i.bit_length() - 1
+
+
+def ulaw_encode(pcm: bytes) -> bytes:
+    x = np.frombuffer(pcm, dtype="<i2").astype(np.int32)
+    sign = np.where(x < 0, 0x80, 0)
+    mag = np.minimum(np.abs(x), ULAW_CLIP) + ULAW_BIAS
+    exp = _ULAW_EXP_LUT[mag >> 7]
+    mant = (mag >> (exp + 3)) & 0x0F
+    return (~(sign | (exp << 4) | mant) & 0xFF).astype(np.uint8).tobytes()
+
+
+# mu-law byte -> PCM16 sample
+_ULAW_DECODE_LUT = np.zeros(256, dtype="<i2")
+for _u in range(256):
+    _v = ~_u & 0xFF
+    _t = (((_v & 0x0F) << 3) + ULAW_BIAS) << ((_v & 0x70) >> 4)
+    _ULAW_DECODE_LUT[_u] = (ULAW_BIAS - _t) if (_v & 0x80) else (_t - ULAW_BIAS)
+
+
+def ulaw_decode(data: bytes) -> bytes:
+    return _ULAW_DECODE_LUT[np.frombuffer(data, dtype=np.uint8)].tobytes()
+
+
+# ===== IMA-ADPCM =====
+ADPCM_STEPS = (
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767,
+)
+ADPCM_INDEX_DELTA = (-1, -1, -1, -1, 2, 4, 6, 8, -1, -1, -1, -1, 2, 4, 6, 8)
+
+
+class PcmEncoder:
+    name = "PCM16"
+
+    def encode(self, pcm: bytes) -> bytes:
+        return pcm
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class UlawEncoder:
+    name = "ULAW"
+
+    def __init__(self):
+        self._tail = b""
+
+    def encode(self, pcm: bytes) -> bytes:
+        pcm = self._tail + pcm
+        even = len(pcm) & ~1
+        self._tail = pcm[even:]
+        return ulaw_encode(pcm[:even])
+
+    def flush(self) -> bytes:
+        self._tail = b""
+        return b""
+
+
+class AdpcmEncoder:
+    """
+    IMA-ADPCM is a feedback codec (each code depends on the reconstructed
+    previous sample), so encoding is a tight scalar loop over table lookups.
+    State starts at zero for every utterance; the firmware resets its decoder
+    on __speaking_on__.
+    """
+
+    name = "ADPCM"
+
+    def __init__(self):
+        self.predictor = 0
+        self.index = 0
+        self._tail = b""
+
+    def encode(self, pcm: bytes) -> bytes:
+        pcm = self._tail + pcm
+        # two samples per output byte -> consume in 4-byte units
+        usable = len(pcm) & ~3
+        self._tail = pcm[usable:]
+        if not usable:
+            return b""
+
+        samples = np.frombuffer(pcm[:usable], dtype="<i2").tolist()
+        steps = ADPCM_STEPS
+        deltas = ADPCM_INDEX_DELTA
+        pred = self.predictor
+        index = self.index
+        codes = bytearray(len(samples))
+
+        for i, s in enumerate(samples):
+            step = steps[index]
+            diff = s - pred
+            code = 0
+            if diff < 0:
+                code = 8
+                diff = -diff
+            vpdiff = step >> 3
+            if diff >= step:
+                code |= 4
+                diff -= step
+                vpdiff += step
+            step >>= 1
+            if diff >= step:
+                code |= 2
+                diff -= step
+                vpdiff += step
+            step >>= 1
+            if diff >= step:
+                code |= 1
+                vpdiff += step
+
+            if code & 8:
+                pred -= vpdiff
+                if pred < -32768:
+                    pred = -32768
+            else:
+                pred += vpdiff
+                if pred > 32767:
+                    pred = 32767
+
+            index += deltas[code]
+            if index < 0:
+                index = 0
+            elif index > 88:
+                index = 88
+            codes[i] = code
+
+        self.predictor = pred
+        self.index = index
+
+        c = np.frombuffer(bytes(codes), dtype=np.uint8)
+        return (c[0::2] | (c[1::2] << 4)).tobytes()
+
+    def flush(self) -> bytes:
+        # pad an unpaired trailing sample with silence
+        tail = self._tail[: len(self._tail) & ~1]
+        self._tail = b""
+        if not tail:
+            return b""
+        pad = b"\x00" * (4 - len(tail))
+        return self.encode(tail + pad)
+
+
+def _clamped_scan(delta: np.ndarray, start: int, lo: int, hi: int) -> np.ndarray:
+    """
+    Vectorized form of the saturating recurrence
+
+        s[-1] = start;  s[i] = min(max(s[i-1] + delta[i], lo), hi)
+
+    Each step is a clamp function f(x) = min(max(x + a, L), H), and such
+    functions stay in that form under composition, so the whole sequence
+    is a Hillis-Steele prefix scan: log2(n) passes of array ops.
+    Offsets grow up to n * max|delta|; callers keep that within int32.
+    """
+    n = len(delta)
+    a = delta.astype(np.int32)
+    L = np.full(n, lo, dtype=np.int32)
+    H = np.full(n, hi, dtype=np.int32)
+    k = 1
+    while k < n:
+        # compose f[i] after f[i-k]
+        a2, L2, H2 = a[k:], L[k:], H[k:]
+        a_new = a[:-k] + a2
+        L_new = np.minimum(np.maximum(L[:-k] + a2, L2), H2)
+        H_new = np.minimum(np.maximum(H[:-k] + a2, L2), H2)
+        a[k:], L[k:], H[k:] = a_new, L_new, H_new
+        k <<= 1
+    return np.minimum(np.maximum(start + a, L), H)
+
+
+_ADPCM_STEPS_NP = np.array(ADPCM_STEPS, dtype=np.int32)
+_ADPCM_INDEX_DELTA_NP = np.array(ADPCM_INDEX_DELTA, dtype=np.int32)
+
+
+class PcmDecoder:
+    name = "PCM16"
+
+    def __init__(self):
+        self._tail = b""
+
+    def decode(self, data: bytes) -> bytes:
+        # recv() may split a sample; keep the stream 2-byte aligned for Vosk
+        data = self._tail + data
+        even = len(data) & ~1
+        self._tail = data[even:]
+        return data[:even]
+
+
+class UlawDecoder:
+    name = "ULAW"
+
+    def decode(self, data: bytes) -> bytes:
+        return ulaw_decode(data)
+
+
+class AdpcmDecoder:
+    """
+    Both the step index and the predictor follow saturating recurrences whose
+    inputs depend only on the codes, so a chunk decodes with two prefix scans
+    instead of a per-sample loop. State carries across recv() chunks.
+    """
+
+    name = "ADPCM"
+
+    # 8 KB in -> 16384 samples; max |vpdiff| ~61k keeps scan offsets < 2^31
+    BLOCK = 8192
+
+    def __init__(self):
+        self.predictor = 0
+        self.index = 0
+
+    def decode(self, data: bytes) -> bytes:
+        if len(data) > self.BLOCK:
+            return b"".join(
+                self.decode(data[i : i + self.BLOCK])
+                for i in range(0, len(data), self.BLOCK)
+            )
+        if not data:
+            return b""
+        b = np.frombuffer(data, dtype=np.uint8)
+        codes = np.empty(len(b) * 2, dtype=np.int32)
+        codes[0::2] = b & 0x0F  # low nibble first
+        codes[1::2] = b >> 4
+
+        idx_after = _clamped_scan(_ADPCM_INDEX_DELTA_NP[codes], self.index, 0, 88)
+        idx_before = np.empty_like(idx_after)
+        idx_before[0] = self.index
+        idx_before[1:] = idx_after[:-1]
+
+        step = _ADPCM_STEPS_NP[idx_before]
+        vpdiff = (
+            (step >> 3)
+            + np.where(codes & 4, step, 0)
+            + np.where(codes & 2, step >> 1, 0)
+            + np.where(codes & 1, step >> 2, 0)
+        )
+        vpdiff = np.where(codes & 8, -vpdiff, vpdiff)
+        pred = _clamped_scan(vpdiff, self.predictor, -32768, 32767)
+
+        self.predictor = int(pred[-1])
+        self.index = int(idx_after[-1])
+        return pred.astype("<i2").tobytes()
+
+
+_ENCODERS = {
+    "PCM16": PcmEncoder,
+    "ULAW": UlawEncoder,
+    "ADPCM": AdpcmEncoder,
+}
+
+
+def make_encoder(codec: str):
+    return _ENCODERS.get((codec or "").upper(), PcmEncoder)()
+
+
+_DECODERS = {
+    "PCM16": PcmDecoder,
+    "ULAW": UlawDecoder,
+    "ADPCM": AdpcmDecoder,
+}
+
+
+def make_decoder(codec: str):
+    return _DECODERS.get((codec or "").upper(), PcmDecoder)()
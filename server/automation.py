@@ -0,0 +1,237 @@
+"""
+AppleScript runners.
+
+Every run_osascript() call used to start a fresh `osascript` process, which
+then compiled the script from scratch: tens of ms per action, paid again on
+every iteration of the YouTube polling loop.
+
+HostRunner keeps one interpreter alive and talks to it over stdin/stdout with
+one JSON object per line:
+
+    -> {"id": 7, "scripts": ["<applescript>", ...]}
+    <- {"id": 7, "results": [{"ok": true, "out": "..."}, ...]}
+
+Several scripts in one request run back to back in a single round trip
+(run_batch). The default host is a JXA program run by osascript that compiles
+each distinct script once with NSAppleScript and keeps it. Any program that
+speaks the same protocol can stand in for it (automation_standin.py does, for
+running this on Linux).
+
+SubprocessRunner is the old one-process-per-script behaviour, same interface.
+"""
+
+import abc
+import itertools
+import json
+import queue
+import subprocess
+import threading
+from typing import NamedTuple
+
+import log
+
+TIMEOUT_S = 10.0  # per request; a host that takes longer is killed and restarted
+
+LOG = log.get("automation")
+
+HOST_JXA = r"""
+ObjC.import('Foundation');
+
+const CACHE_LIMIT = 256;
+
+function errorText(err) {
+  const info = err[0];
+  if (!info || info.isNil()) return "error";
+  const msg = ObjC.unwrap(info.objectForKey('NSAppleScriptErrorMessage')) || "error";
+  const num = ObjC.unwrap(info.objectForKey('NSAppleScriptErrorNumber'));
+  return num === undefined ? msg : msg + " (" + num + ")";
+}
+
+function runScript(cache, src) {
+  let script = cache[src];
+  if (!script) {
+    script = $.NSAppleScript.alloc.initWithSource(src);
+    const err = Ref();
+    if (!script.compileAndReturnError(err)) return {ok: false, out: errorText(err)};
+    if (Object.keys(cache).length >= CACHE_LIMIT) for (const k in cache) delete cache[k];
+    cache[src] = script;
+  }
+  const err = Ref();
+  const res = script.executeAndReturnError(err);
+  if (!res || res.isNil()) return {ok: false, out: errorText(err)};
+  const text = res.coerceToDescriptorType(0x75747874);  // 'utxt'
+  const out = text && !text.isNil() ? ObjC.unwrap(text.stringValue) : "";
+  return {ok: true, out: out || ""};
+}
+
+function run() {
+  const stdin = $.NSFileHandle.fileHandleWithStandardInput;
+  const stdout = $.NSFileHandle.fileHandleWithStandardOutput;
+  const pending = $.NSMutableData.data;
+  const cache = {};
+  let buf = "";
+
+  while (true) {
+    const data = stdin.availableData;
+    if (data.length === 0) return;  // server went away
+    pending.appendData(data);
+    const chunk = $.NSString.alloc.initWithDataEncoding(pending, $.NSUTF8StringEncoding);
+    if (chunk.isNil()) continue;  // split inside a UTF-8 sequence; wait for the rest
+    pending.setLength(0);
+    buf += ObjC.unwrap(chunk);
+
+    let nl;
+    while ((nl = buf.indexOf("\n")) >= 0) {
+      const line = buf.slice(0, nl);
+      buf = buf.slice(nl + 1);
+      if (!line.trim()) continue;
+      const req = JSON.parse(line);
+      const results = req.scripts.map(src => {
+        try { return runScript(cache, src); } catch (e) { return {ok: false, out: String(e)}; }
+      });
+      const reply = JSON.stringify({id: req.id, results: results}) + "\n";
+      stdout.writeData($(reply).dataUsingEncoding($.NSUTF8StringEncoding));
+    }
+  }
+}
+"""
+
+HOST_ARGV = ("osascript", "-l", "JavaScript", "-e", HOST_JXA)
+
+
+class ActionResult(NamedTuple):
+    ok: bool
+    out: str  # script result, or the error text when ok is False
+
+
+class Runner(abc.ABC):
+    def run(self, script: str) -> ActionResult:
+        return self.run_batch([script])[0]
+
+    @abc.abstractmethod
+    def run_batch(self, scripts) -> list:
+        """One ActionResult per script, in order."""
+
+    def close(self):
+        pass
+
+
+class SubprocessRunner(Runner):
+    """One interpreter process per script."""
+
+    def __init__(self, argv=("osascript", "-e")):
+        self.argv = list(argv)
+
+    def run_batch(self, scripts) -> list:
+        out = []
+        for script in scripts:
+            try:
+                p = subprocess.run(self.argv + [script], capture_output=True, text=True)
+            except Exception as e:
+                out.append(ActionResult(False, f"EXCEPTION: {e}"))
+                continue
+            if p.returncode != 0:
+                out.append(ActionResult(False, (p.stderr or p.stdout or "").strip()))
+            else:
+                out.append(ActionResult(True, (p.stdout or "").strip()))
+        return out
+
+
+class HostRunner(Runner):
+    """One long-lived interpreter process, started on first use."""
+
+    def __init__(self, argv=HOST_ARGV, timeout_s: float = TIMEOUT_S):
+        self.argv = list(argv)
+        self.timeout_s = timeout_s
+        self._lock = threading.Lock()  # one request in flight at a time
+        self._ids = itertools.count(1)
+        self._proc = None
+        self._replies = None
+        self.restarts = 0  # hosts killed after dying, hanging or close()
+
+    def _start(self):
+        self._proc = subprocess.Popen(
+            self.argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+        )
+        self._replies = queue.Queue()
+        threading.Thread(
+            target=self._read_loop, args=(self._proc, self._replies), daemon=True
+        ).start()
+
+    @staticmethod
+    def _read_loop(proc, replies):
+        for line in proc.stdout:
+            try:
+                replies.put(json.loads(line))
+            except ValueError:
+                LOG.warning("automation host: bad reply", line=line.strip()[:200])
+        replies.put(None)  # host exited
+
+    def _kill(self):
+        if self._proc is not None:
+            self.restarts += 1
+            try:
+                self._proc.kill()
+            except OSError:
+                pass
+            self._proc = None
+
+    def _send(self, scripts: list) -> int:
+        req_id = next(self._ids)
+        line = json.dumps({"id": req_id, "scripts": scripts}) + "\n"
+        for attempt in (1, 2):
+            if self._proc is not None and self._proc.poll() is not None:
+                self._kill()
+            if self._proc is None:
+                self._start()
+            try:
+                self._proc.stdin.write(line)
+                self._proc.stdin.flush()
+                return req_id
+            except OSError:
+                # died since the last request; nothing ran, so resending is safe
+                self._kill()
+                if attempt == 2:
+                    raise
+
+    def _wait(self, req_id: int) -> list:
+        while True:
+            reply = self._replies.get(timeout=self.timeout_s)
+            if reply is None:
+                raise OSError("automation host exited")
+            if reply.get("id") == req_id:
+                return [ActionResult(bool(r.get("ok")), r.get("out") or "") for r in reply["results"]]
+            # a late reply to a request that already timed out; skip it
+
+    def run_batch(self, scripts) -> list:
+        scripts = list(scripts)
+        with self._lock:
+            try:
+                return self._wait(self._send(scripts))
+            except queue.Empty:
+                # a hung script: get a fresh host next time, don't rerun it
+                self._kill()
+                error = "automation host timed out"
+            except (OSError, ValueError) as e:
+                self._kill()
+                error = str(e)
+        return [ActionResult(False, f"EXCEPTION: {error}")] * len(scripts)
+
+    def close(self):
+        with self._lock:
+            if self._proc is not None and self._proc.poll() is None:
+                try:
+                    self._proc.stdin.close()
+                    self._proc.wait(timeout=1.0)
+                except (OSError, subprocess.TimeoutExpired):
+                    pass
+            self._kill()
+
+
+def make_runner(persistent: bool = True) -> Runner:
+    return HostRunner() if persistent else SubprocessRunner()
@@ -0,0 +1,63 @@
+# Stand-in for osascript, so automation.py runs on machines without macOS.
+#
+#   python automation_standin.py               host mode, JSON lines on stdin/stdout
+#   python automation_standin.py -e SCRIPT     one script, like `osascript -e`
+#
+# It does not run AppleScript. A script whose last line is `return "text"`
+# returns that text, `error "msg"` fails with msg, anything else returns "".
+# --compile-ms N sleeps N ms the first time the host sees a script (every time
+# in -e mode), to stand in for AppleScript compilation.
+
+import json
+import re
+import sys
+import time
+
+RETURN_RE = re.compile(r'^\s*return\s+"(.*)"\s*$')
+ERROR_RE = re.compile(r'^\s*error\s+"(.*)"\s*$')
+
+
+def interpret(script: str) -> dict:
+    lines = [ln for ln in script.strip().splitlines() if ln.strip()]
+    last = lines[-1] if lines else ""
+    m = ERROR_RE.match(last)
+    if m:
+        return {"ok": False, "out": m.group(1)}
+    m = RETURN_RE.match(last)
+    return {"ok": True, "out": m.group(1) if m else ""}
+
+
+def main():
+    args = sys.argv[1:]
+    compile_s = 0.0
+    if "--compile-ms" in args:
+        i = args.index("--compile-ms")
+        compile_s = float(args[i + 1]) / 1000.0
+        del args[i : i + 2]
+
+    if args and args[0] == "-e":
+        time.sleep(compile_s)
+        r = interpret(args[1])
+        if not r["ok"]:
+            print(r["out"], file=sys.stderr)
+            sys.exit(1)
+        print(r["out"])
+        return
+
+    compiled = set()
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        req = json.loads(line)
+        results = []
+        for script in req["scripts"]:
+            if script not in compiled:
+                time.sleep(compile_s)
+                compiled.add(script)
+            results.append(interpret(script))
+        sys.stdout.write(json.dumps({"id": req["id"], "results": results}) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
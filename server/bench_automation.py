@@ -0,0 +1,50 @@
+# AppleScript runner benchmark. Run: python server/bench_automation.py [--standin]
+# Times the same polling-style script (the YouTube loop sends one over and over)
+# through a process per call, the persistent host, and the host with batching.
+# On macOS it uses osascript; --standin (or any other OS) uses
+# automation_standin.py with a simulated 20 ms compile instead.
+
+import os
+import sys
+import time
+
+import automation
+
+N = 30
+BATCH = 5
+SCRIPT = 'return "CLICKED_FIRST"'
+
+
+def timed(runner, batch: int = 1) -> float:
+    runner.run(SCRIPT)  # warm-up (starts the host)
+    t0 = time.perf_counter()
+    for _ in range(N // batch):
+        results = runner.run_batch([SCRIPT] * batch)
+        assert all(r.ok and r.out == "CLICKED_FIRST" for r in results), results
+    return (time.perf_counter() - t0) * 1000.0 / N
+
+
+def main():
+    standin = "--standin" in sys.argv or sys.platform != "darwin"
+    if standin:
+        tool = [sys.executable, os.path.join(os.path.dirname(__file__), "automation_standin.py"), "--compile-ms", "20"]
+        spawn = automation.SubprocessRunner(tool + ["-e"])
+        host = automation.HostRunner(tool)
+    else:
+        spawn = automation.SubprocessRunner()
+        host = automation.HostRunner()
+
+    print(f"{'runner':<22} {'ms/action':>10}")
+    try:
+        for name, runner, batch in (
+            ("process per action", spawn, 1),
+            ("persistent host", host, 1),
+            (f"host, batches of {BATCH}", host, BATCH),
+        ):
+            print(f"{name:<22} {timed(runner, batch):>10.2f}")
+    finally:
+        host.close()
+
+
+if __name__ == "__main__":
+    main()
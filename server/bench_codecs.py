@@ -0,0 +1,90 @@
+# Codec throughput benchmark. Run: python server/bench_codecs.py
+# Reports MB/s of input consumed and of PCM16 produced/consumed per codec.
+
+import time
+
+import numpy as np
+
+import audio_codec
+
+SECONDS = 30  # of 16 kHz test audio
+RATE = 16000
+CHUNK = 1024  # bytes per recv(), same as handle_client
+
+
+def make_pcm(seconds: int, rate: int) -> bytes:
+    rng = np.random.default_rng(0)
+    t = np.arange(seconds * rate) / rate
+    x = 8000 * np.sin(2 * np.pi * 220 * t) * np.sin(2 * np.pi * 0.5 * t)
+    x += rng.normal(0, 600, len(t))
+    return np.clip(x, -32768, 32767).astype("<i2").tobytes()
+
+
+def adpcm_decode_scalar(data: bytes) -> bytes:
+    # straight per-sample loop, for comparison with the vectorized decoder
+    steps = audio_codec.ADPCM_STEPS
+    deltas = audio_codec.ADPCM_INDEX_DELTA
+    pred, index = 0, 0
+    out = []
+    for b in data:
+        for code in (b & 0x0F, b >> 4):
+            step = steps[index]
+            vpdiff = step >> 3
+            if code & 4:
+                vpdiff += step
+            if code & 2:
+                vpdiff += step >> 1
+            if code & 1:
+                vpdiff += step >> 2
+            pred = pred - vpdiff if code & 8 else pred + vpdiff
+            pred = max(-32768, min(32767, pred))
+            index = max(0, min(88, index + deltas[code]))
+            out.append(pred)
+    return np.array(out, dtype="<i2").tobytes()
+
+
+def timed(fn, data: bytes, chunk: int) -> tuple[float, int]:
+    t0 = time.perf_counter()
+    produced = 0
+    for i in range(0, len(data), chunk):
+        produced += len(fn(data[i : i + chunk]))
+    return time.perf_counter() - t0, produced
+
+
+def report(name: str, seconds: float, consumed: int, produced: int, pcm_bytes: int):
+    print(
+        f"{name:<28} {consumed / seconds / 1e6:8.2f} MB/s in "
+        f"{produced / seconds / 1e6:8.2f} MB/s out "
+        f"{pcm_bytes / seconds / (2 * RATE):8.0f}x realtime"
+    )
+
+
+def main():
+    pcm = make_pcm(SECONDS, RATE)
+    ulaw = audio_codec.ulaw_encode(pcm)
+    enc = audio_codec.AdpcmEncoder()
+    adpcm = enc.encode(pcm) + enc.flush()
+
+    print(f"{SECONDS}s of {RATE} Hz audio, {CHUNK}-byte chunks")
+
+    for name in ("ULAW", "ADPCM"):
+        e = audio_codec.make_encoder(name)
+        dt, n = timed(e.encode, pcm, CHUNK)
+        report(f"{name} encode", dt, len(pcm), n, len(pcm))
+
+    for name, data in (("PCM16", pcm), ("ULAW", ulaw), ("ADPCM", adpcm)):
+        d = audio_codec.make_decoder(name)
+        dt, n = timed(d.decode, data, CHUNK)
+        report(f"{name} decode", dt, len(data), n, n)
+
+    # one device sends ~1 KB per recv; also show a larger batch
+    d = audio_codec.make_decoder("ADPCM")
+    dt, n = timed(d.decode, adpcm, 16 * CHUNK)
+    report("ADPCM decode (16 KB chunks)", dt, len(adpcm), n, n)
+
+    dt, n = timed(adpcm_decode_scalar, adpcm[: len(adpcm) // 10], CHUNK)
+    report("ADPCM decode (scalar loop)", dt, len(adpcm) // 10, n, n)
+
+
+if __name__ == "__main__":
+    main()
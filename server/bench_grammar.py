@@ -0,0 +1,118 @@
+# Command grammar benchmark.
+# Run: python server/bench_grammar.py <vosk model dir> <ru|en> clip1.wav clip2.wav ...
+# Each clip should hold one spoken command (16-bit PCM WAV, any rate, mono).
+# Decodes every clip twice the way handle_client does: free-form recognizer
+# only, then free-form + grammar recognizer, and prints decode CPU per second of
+# audio and command-turn latency (end of speech -> FINAL, audio time).
+# Imports final.py, so vosk and openai must be installed.
+
+import json
+import sys
+import time
+import wave
+
+from vosk import KaldiRecognizer, Model, SetLogLevel
+
+import endpointer
+import final
+import resample
+
+CHUNK = 1024  # bytes per recv() in handle_client
+
+
+def load_pcm(path: str) -> bytes:
+    with wave.open(path, "rb") as w:
+        if w.getsampwidth() != 2 or w.getnchannels() != 1:
+            raise SystemExit(f"{path}: need 16-bit mono")
+        rate, pcm = w.getframerate(), w.readframes(w.getnframes())
+    return resample.make_resampler(rate, final.SAMPLE_RATE).process_bytes(pcm)
+
+
+def decode(model, lang: str, pcm: bytes, grammar: bool) -> dict:
+    rec = KaldiRecognizer(model, final.SAMPLE_RATE)
+    cmd_rec = final.make_command_recognizer(model, lang) if grammar else None
+    endpoint = endpointer.Endpointer(
+        final.SAMPLE_RATE, final.ENDPOINT_SILENCE_MS, final.ENDPOINT_COMMAND_SILENCE_MS
+    )
+    have_partial = False
+    cpu = 0.0
+
+    # trailing silence so the endpointer can fire on tightly cut clips
+    pcm = pcm + bytes(final.SAMPLE_RATE * 2)
+    for i in range(0, len(pcm), CHUNK):
+        data = pcm[i : i + CHUNK]
+        t0 = time.process_time()
+        speech_over = endpoint.feed(data)
+
+        res, source = None, ""
+        if cmd_rec is not None:
+            if cmd_rec.AcceptWaveform(data):
+                command = final.command_grammar_hit(json.loads(cmd_rec.Result()))
+            elif speech_over and have_partial:
+                command = final.command_grammar_hit(json.loads(cmd_rec.FinalResult()))
+            else:
+                command = ""
+            if command:
+                res, source = {"text": command}, "grammar"
+
+        if res is None:
+            if rec.AcceptWaveform(data):
+                res, source = json.loads(rec.Result()), "vosk"
+            elif speech_over and have_partial:
+                res, source = json.loads(rec.FinalResult()), "endpointer"
+            else:
+                pres = json.loads(rec.PartialResult())
+                pnorm = final.normalize_text(pres.get("partial", ""))
+                if pnorm:
+                    have_partial = True
+                    endpoint.command_mode = final.looks_like_command(pnorm)
+        cpu += time.process_time() - t0
+
+        if res is not None and res.get("text"):
+            latency = None
+            if endpoint.speech_end is not None:
+                latency = endpoint.now_ms - endpoint.speech_end
+            audio_s = (i + len(data)) / 2 / final.SAMPLE_RATE
+            return dict(text=res["text"], source=source, latency=latency, cpu=cpu, audio_s=audio_s)
+
+    audio_s = len(pcm) / 2 / final.SAMPLE_RATE
+    return dict(text="", source="none", latency=None, cpu=cpu, audio_s=audio_s)
+
+
+def summarize(name: str, runs: list):
+    audio = sum(r["audio_s"] for r in runs) or 1.0
+    cpu = sum(r["cpu"] for r in runs)
+    lat = [r["latency"] for r in runs if r["latency"] is not None]
+    commands = sum(final.ROUTER.match(final.normalize_text(r["text"])) is not None for r in runs)
+    mean_lat = sum(lat) / len(lat) if lat else 0.0
+    print(
+        f"{name:<10} cpu {cpu * 1000 / audio:6.1f} ms per audio s   "
+        f"latency mean {mean_lat:5.0f} ms   commands {commands}/{len(runs)}"
+    )
+
+
+def main():
+    if len(sys.argv) < 4 or sys.argv[2] not in ("ru", "en"):
+        raise SystemExit("usage: bench_grammar.py <model dir> <ru|en> clip.wav ...")
+    model_dir, lang, paths = sys.argv[1], sys.argv[2], sys.argv[3:]
+
+    SetLogLevel(-1)
+    t0 = time.perf_counter()
+    model = Model(model_dir)
+    print(f"model loaded in {time.perf_counter() - t0:.1f}s, grammar: {len(final.command_phrases(lang))} phrases")
+
+    single, dual = [], []
+    for path in paths:
+        pcm = load_pcm(path)
+        a = decode(model, lang, pcm, grammar=False)
+        b = decode(model, lang, pcm, grammar=True)
+        single.append(a)
+        dual.append(b)
+        print(f"{path}\n  single: {a['text']!r} ({a['source']})\n  dual:   {b['text']!r} ({b['source']})")
+
+    summarize("single", single)
+    summarize("dual", dual)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# Intent classifier benchmark. Run: python server/bench_intent.py
+# Runs a labelled set of utterances (commands said the table's way, commands
+# paraphrased, and ordinary questions) through the router alone and through
+# final.command_match() (router + intent classifier), and prints how many LLM calls the
+# classifier saves, how many commands it gets wrong, how many questions it
+# steals from the LLM, and the time per classification.
+# Imports final.py, so vosk and openai must be installed (models are not loaded).
+
+import time
+
+import final
+
+# (utterance, command it should run) -- None = should go to the LLM
+LABELLED = [
+    # said the way the table has them
+    ("open telegram", "open telegram"),
+    ("volume up", "volume up"),
+    ("next track", "next track"),
+    ("открой телеграм", "открой телеграм"),
+    ("громче", "громче"),
+    ("закрой вкладку", "закрой вкладку"),
+    ("turn on lofi beats", "turn on lofi beats"),
+    ("погода", "погода"),
+    # paraphrased
+    ("could you open telegram", "open telegram"),
+    ("can you open discord please", "open discord"),
+    ("please open notes", "open notes"),
+    ("open the terminal", "open terminal"),
+    ("open up safari", "open safari"),
+    ("open spotify app", "open spotify app"),  # not an allowed app: the router says so
+    ("could you close telegram", "close telegram"),
+    ("close the finder", "close finder"),
+    ("quit discord please", "quit discord"),
+    ("switch over to chrome", "switch to chrome"),
+    ("can you turn it up", "volume up"),
+    ("turn the volume up a bit", "volume up"),
+    ("make it a bit louder", "volume up"),
+    ("a little quieter", "volume down"),
+    ("turn volume down please", "volume down"),
+    ("mute the sound", "mute"),
+    ("skip this track", "next track"),
+    ("go to the previous track", "previous track"),
+    ("take a screenshot please", "screenshot"),
+    ("make a screenshot", "screenshot"),
+    ("close this tab please", "close tab"),
+    ("close the chrome window", "close chrome window"),
+    ("could you turn on some jazz", "turn on some jazz"),
+    ("please search for cheap flights", "search for cheap flights"),
+    ("can you press enter", "press enter"),
+    ("press the escape key", "press escape"),
+    ("открой пожалуйста телеграм", "открой телеграм"),
+    ("можешь открыть телеграм", "открой телеграм"),
+    ("открой-ка дискорд", "открой дискорд"),
+    ("открой мне заметки", "открой заметки"),
+    ("запусти телеграм", None),
+    ("закрой пожалуйста сафари", "закрой сафари"),
+    ("закрой ка хром", "закрой хром"),
+    ("сделай погромче пожалуйста", "громче"),
+    ("сделай музыку громче", "громче"),
+    ("сделай потише", "тише"),
+    ("убавь громкость", "тише"),
+    ("выключи звук пожалуйста", "без звука"),
+    ("следующую песню пожалуйста", "следующий трек"),
+    ("предыдущую песню", "предыдущий трек"),
+    ("сделай скрин", "скриншот"),
+    ("закрой эту вкладку пожалуйста", "закрой вкладку"),
+    ("включи пожалуйста джаз", "включи пожалуйста джаз"),  # YouTube search ignores the filler
+    ("какая погода сегодня", "погода"),
+    ("какая погода в москве", "погода в москве"),  # keeps the city, not bare "погода"
+    ("нажми пожалуйста энтер", "нажми энтер"),
+    # questions and chat
+    ("what is the capital of france", None),
+    ("how do i open a terminal on linux", None),
+    ("tell me a joke", None),
+    ("who wrote war and peace", None),
+    ("what time is it in tokyo", None),
+    ("translate good morning to spanish", None),
+    ("how much is a flight to paris", None),
+    ("explain quantum computing simply", None),
+    ("why is the sky blue", None),
+    ("give me a recipe for pancakes", None),
+    ("is it going to rain tomorrow in london", None),
+    ("what is the weather on mars", None),
+    ("recommend a good book", None),
+    ("how do you say thank you in kazakh", None),
+    ("don't close chrome", None),
+    ("never mind", None),
+    ("thank you very much", None),
+    ("who are you", None),
+    ("tell me about the music of the seventies", None),
+    ("what can you do", None),
+    ("расскажи анекдот", None),
+    ("какая столица франции", None),
+    ("сколько будет два плюс два", None),
+    ("как дела", None),
+    ("почему небо голубое", None),
+    ("что такое квантовый компьютер", None),
+    ("переведи привет на английский", None),
+    ("посоветуй хорошую книгу", None),
+    ("не закрывай хром", None),
+    ("спасибо большое", None),
+    ("кто написал войну и мир", None),
+    ("сколько стоит билет в москву", None),
+    ("расскажи про музыку семидесятых", None),
+    ("напомни мне купить молоко", None),
+    ("какой сегодня день", None),
+    # close to a command, but not one
+    ("what's the time", None),
+    ("what's the weather in london", None),
+    ("next time", None),
+    ("go back", None),
+    ("stop it", None),
+    ("open the window", None),  # not "close chrome window"
+    ("open the tab", None),
+    ("i like the weather", None),
+]
+
+N_TIMING = 2000
+
+
+def runs(command: str | None):
+    """What a command text would do: (handler, argument), apps resolved."""
+    if not command:
+        return None
+    m = final.ROUTER.match(command)
+    if m.route.tag == "app":
+        return m.route.handler, final._resolve_app(m.arg, ru_aliases=True)
+    return m.route.handler, m.arg
+
+
+def main():
+    commands = [(u, c) for u, c in LABELLED if c is not None]
+    questions = [u for u, c in LABELLED if c is None]
+    before = after = wrong = stolen = 0
+    llm_before = llm_after = 0
+    for u, c in LABELLED:
+        norm = final.normalize_text(u)
+        m = final.ROUTER.match(norm)
+        if m is None:
+            llm_before += 1
+        elif runs(m.text) == runs(c):
+            before += 1
+
+        m = final.command_match(norm)
+        if m is None:
+            llm_after += 1
+        elif runs(m.text) == runs(c):
+            after += 1
+        elif c is None and not final._runnable(m):
+            pass  # "open the window": the router's own "not in the list" reply, nothing runs
+        elif c is None:
+            stolen += 1
+            print(f"  question taken as a command: {u!r} -> {m.text!r}")
+        else:
+            wrong += 1
+            print(f"  wrong command: {u!r} -> {m.text!r} (want {c!r})")
+
+    print(f"{len(commands)} commands, {len(questions)} questions")
+    print(f"router alone:      {before}/{len(commands)} commands right, {llm_before} LLM calls")
+    print(
+        f"router + intents:  {after}/{len(commands)} commands right, {llm_after} LLM calls "
+        f"({llm_before - llm_after} saved), {wrong} wrong command, {stolen} questions taken"
+    )
+
+    texts = [final.normalize_text(u) for u, _ in LABELLED]
+    t0 = time.perf_counter()
+    for i in range(N_TIMING):
+        final.INTENTS.classify(texts[i % len(texts)])
+    print(f"classify: {(time.perf_counter() - t0) * 1e6 / N_TIMING:.0f} us per utterance")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Keyword spotting benchmark. Run: python server/bench_keywords.py
+# Replays N_UTTERANCES generated utterances the way Vosk delivers them: a
+# PARTIAL every ~100 ms that grows one word at a time (repeated while the word
+# is still being spoken), then the FINAL. For each one it runs the same
+# vocabulary checks handle_client() does (wake, sleep, language switch,
+# command match, LLM candidate) and prints CPU time per partial and per
+# utterance. Imports final.py, so vosk and openai must be installed (models are not loaded).
+
+import random
+import statistics
+import time
+
+import final
+
+N_UTTERANCES = 2000
+PARTIALS_PER_WORD = 3  # ~300 ms per word at Vosk's partial rate
+
+WAKE = ["джарвис", "jarvis", "джервис", "", "", ""]
+HEADS = [
+    "открой", "закрой", "open", "close", "включи", "turn on", "what is", "расскажи про",
+    "сколько стоит", "как приготовить", "переключись на", "говори по", "switch to", "спи", "",
+]
+WORDS = (
+    "телеграм telegram хром chrome safari сафари спотифай музыку погоду погода новости "
+    "английский русский english russian mode режим сегодня завтра в астане москве пасту "
+    "борщ кофе дискорд discord notes заметки терминал terminal weather the a of please "
+    "пожалуйста быстро тихо громче playlist плейлист chill morning jazz лофи"
+).split()
+
+
+def utterances(n: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        words = [rng.choice(WAKE), rng.choice(HEADS)]
+        words += rng.sample(WORDS, rng.randint(1, 5))
+        out.append(" ".join(w for w in words if w))
+    return out
+
+
+def on_partial(ptext: str):
+    pnorm = final.normalize_text(ptext)
+    final.looks_like_command(pnorm)
+    final.detect_wake(pnorm)
+    final.llm_candidate(pnorm)
+
+
+def on_final(text: str):
+    norm = final.normalize_text(text)
+    final.llm_candidate(norm)
+    final.detect_wake(norm)
+    norm = final.strip_leading_wake(norm) or norm
+    final.detect_sleep(norm)
+    final.lang_switch_target(norm)
+    final.ROUTER.match(norm)
+
+
+def main():
+    corpus = utterances(N_UTTERANCES)
+    per_utt = []
+    partials = 0
+    for text in corpus:
+        words = text.split()
+        t0 = time.process_time()
+        for i in range(1, len(words) + 1):
+            for _ in range(PARTIALS_PER_WORD):
+                on_partial(" ".join(words[:i]))
+                partials += 1
+        on_final(text)
+        per_utt.append((time.process_time() - t0) * 1e6)
+
+    total = sum(per_utt)
+    q = statistics.quantiles(per_utt, n=20)
+    print(f"{N_UTTERANCES} utterances, {partials} partials")
+    print(
+        f"CPU per utterance: mean {total / N_UTTERANCES:.0f} us  p50 {q[9]:.0f} us  "
+        f"p95 {q[18]:.0f} us   per partial {total / (partials + N_UTTERANCES):.1f} us"
+    )
+
+
+if __name__ == "__main__":
+    main()
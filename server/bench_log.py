@@ -0,0 +1,61 @@
+# Logging benchmark. Run: python server/bench_log.py
+# Writes N_LINES PARTIAL-style lines back to back
+# to a sink that takes SINK_DELAY_MS per write, like a stdout pipe nobody is
+# draining fast enough. Compares the time the calling thread spends per line
+# with print() against log.py (queued, and rate-limited), and the worst stall.
+
+import io
+import statistics
+import time
+
+import log
+
+N_LINES = 300
+SINK_DELAY_MS = 2.0
+
+
+class SlowSink(io.StringIO):
+    def write(self, s):
+        time.sleep(SINK_DELAY_MS / 1000.0)
+        return super().write(s)
+
+    def flush(self):
+        time.sleep(SINK_DELAY_MS / 1000.0)
+
+
+def run(emit) -> list:
+    costs = []
+    for i in range(N_LINES):
+        t0 = time.perf_counter()
+        emit(i)
+        costs.append((time.perf_counter() - t0) * 1e6)
+    return costs
+
+
+def show(label: str, costs: list):
+    print(
+        f"{label:<24} {statistics.mean(costs):8.1f} us/line mean, "
+        f"p99 {sorted(costs)[int(len(costs) * 0.99)]:8.1f} us, max {max(costs):8.1f} us"
+    )
+
+
+def main():
+    sink = SlowSink()
+    show("print (flush=True)", run(lambda i: print(f"[ru] PARTIAL: word {i}", file=sink, flush=True)))
+
+    log.configure("DEBUG")
+    log._stream = SlowSink()
+    LOG = log.get("bench")
+    log.set_context(device="ESP32@10.0.0.5")
+    show("log.debug", run(lambda i: LOG.debug("PARTIAL", lang="ru", text=f"word {i}")))
+    log.flush(10.0)
+    show("log.debug every_s=0.25", run(lambda i: LOG.debug("PARTIAL", every_s=0.25, lang="ru", text=f"word {i}")))
+    log.flush(10.0)
+
+    log.configure("INFO")
+    show("log.debug, level INFO", run(lambda i: LOG.debug("PARTIAL", lang="ru", text=f"word {i}")))
+    print(f"dropped: {log.dropped}")
+
+
+if __name__ == "__main__":
+    main()
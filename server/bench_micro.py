@@ -0,0 +1,213 @@
+# Microbenchmarks for the per-utterance and per-chunk hot paths.
+# Run: python server/bench_micro.py [--json out.json] [--compare base.json] [--threshold 10] [NAME ...]
+#      python server/bench_micro.py --compare base.json new.json [--threshold 10]
+# Times text normalization, the wake/sleep vocabulary checks, command routing
+# (hits, paraphrases and fall-throughs to GPT), TTS cache lookups and the audio
+# codecs, resampler and __audio_len__ framing, and prints ns per call (best of
+# REPEAT runs, plus the median). --json writes the results; --compare checks
+# them (or a second JSON file) against a saved run and flags anything slower
+# by more than --threshold percent, exiting 1 if something regressed.
+# NAME arguments keep only benchmarks whose name contains one of them.
+# Routing is timed with ROUTER.match / command_match, which is what
+# parse_and_execute_command() does before it runs the command.
+# Imports final.py, so vosk and openai must be installed (models are not loaded).
+
+import itertools
+import json
+import os
+import platform
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import audio_codec
+import disk_cache
+import final
+import log
+import resample
+
+REPEAT = 5
+MIN_RUN_S = 0.05  # each run loops at least this long
+THRESHOLD_PCT = 10.0
+
+UTTERANCES = [
+    "Джарвис", "jarvis what time is it", "джарвис открой телеграм", "open telegram", "Громче!",
+    "what is the capital of france", "включи лофи", "сплю", "go to sleep", "расскажи анекдот",
+    "could you open discord please", "сделай погромче пожалуйста", "tell me a joke", "next track",
+    "джервис какая погода", "switch to english",
+]
+COMMANDS = ["open telegram", "громче", "next track", "закрой вкладку", "turn on lofi beats", "погода"]
+PARAPHRASES = ["could you open telegram", "сделай погромче пожалуйста", "skip this track", "close this tab please"]
+QUESTIONS = ["what is the capital of france", "расскажи анекдот", "how do i open a terminal on linux", "почему небо голубое"]
+
+
+def cycling(fn, inputs):
+    """A no-argument callable that runs fn on the next input each call."""
+    it = itertools.cycle(inputs)
+    return lambda: fn(next(it))
+
+
+def uncached(fn, *caches):
+    def run(x):
+        for c in caches:
+            c.cache_clear()
+        return fn(x)
+
+    return run
+
+
+def benchmarks() -> dict:
+    """name -> no-argument callable."""
+    norms = [final.normalize_text(u) for u in UTTERANCES]
+    b = {
+        "text.normalize_text": cycling(final.normalize_text, UTTERANCES),
+        "text.tokens": cycling(final.tokens, norms),
+        "vocab.detect_wake": cycling(final.detect_wake, UTTERANCES),
+        "vocab.detect_wake uncached": cycling(uncached(final.detect_wake, final.vocab_scan), UTTERANCES),
+        "vocab.detect_sleep": cycling(final.detect_sleep, UTTERANCES),
+        "vocab.strip_leading_wake": cycling(final.strip_leading_wake, UTTERANCES),
+        "vocab.strip_leading_wake uncached": cycling(uncached(final.strip_leading_wake, final.vocab_scan), UTTERANCES),
+        "route.router hit": cycling(final.ROUTER.match, COMMANDS),
+        "route.router miss": cycling(final.ROUTER.match, QUESTIONS),
+        "route.command_match hit": cycling(final.command_match, COMMANDS),
+        "route.command_match paraphrase": cycling(final.command_match, PARAPHRASES),
+        "route.command_match miss": cycling(final.command_match, QUESTIONS),
+        "route.command_match miss uncached": cycling(uncached(final.command_match, final.intent_command), QUESTIONS),
+        "route.looks_like_command": cycling(final.looks_like_command, norms),
+        "route.llm_candidate": cycling(final.llm_candidate, norms),
+    }
+
+    # TTS cache: one cached reply in a scratch directory; misses go nowhere (OFFLINE)
+    cache_dir = tempfile.mkdtemp(prefix="bench_tts_")
+    final.TTS_CACHE = disk_cache.DiskCache(cache_dir, ".pcm")
+    final.OFFLINE = True
+    with open(final.get_tts_cache_path("Да?"), "wb") as f:
+        f.write(bytes(24000))
+    b["tts.cache path"] = cycling(final.get_tts_cache_path, UTTERANCES)
+    b["tts.cache hit first chunk"] = lambda: next(final.tts_bytes_stream("Да?"))
+    b["tts.cache miss"] = cycling(lambda t: next(final.tts_bytes_stream(t), None), UTTERANCES)
+
+    # audio: one 4096-byte TTS chunk down, one 512-sample mic block up
+    tts_chunk = bytes((i * 37) & 0xFF for i in range(4096))
+    mic_block = bytes((i * 11) & 0xFF for i in range(1024))
+    for codec in audio_codec.CODECS:
+        enc, dec = audio_codec.make_encoder(codec), audio_codec.make_decoder(codec)
+        mic = audio_codec.make_encoder(codec).encode(mic_block)
+        b[f"audio.encode {codec} 4096B"] = lambda enc=enc: enc.encode(tts_chunk)
+        b[f"audio.decode {codec} mic block"] = lambda dec=dec, mic=mic: dec.decode(mic)
+    for rate in (44100, 48000):
+        r = resample.make_resampler(rate, final.SAMPLE_RATE)
+        block = bytes(int(1024 * rate / 16000) & ~1)
+        b[f"audio.resample {rate}->16000 mic block"] = lambda r=r, block=block: r.process_bytes(block)
+
+    # framing: __audio_len__ header + payload into a socket someone drains
+    ours, theirs = socket.socketpair()
+
+    def drain():
+        try:
+            while theirs.recv(1 << 16):
+                pass
+        except OSError:
+            pass
+
+    threading.Thread(target=drain, daemon=True).start()
+    payload = audio_codec.make_encoder("ADPCM").encode(tts_chunk)
+    b["audio.frame+send ADPCM chunk"] = lambda: final.send_audio_chunk(ours, payload)
+    return b
+
+
+def measure(fn) -> dict:
+    fn()  # warm-up (caches, lazy builds)
+    loops = 1
+    while True:
+        t0 = time.perf_counter_ns()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter_ns() - t0
+        if elapsed >= MIN_RUN_S * 1e9:
+            break
+        loops = max(loops * 2, int(loops * MIN_RUN_S * 1e9 / max(elapsed, 1)))
+    runs = [elapsed / loops]
+    for _ in range(REPEAT - 1):
+        t0 = time.perf_counter_ns()
+        for _ in range(loops):
+            fn()
+        runs.append((time.perf_counter_ns() - t0) / loops)
+    return {"ns": min(runs), "median_ns": statistics.median(runs), "loops": loops}
+
+
+def run(names: list) -> dict:
+    results = {}
+    for name, fn in benchmarks().items():
+        if names and not any(n in name for n in names):
+            continue
+        r = results[name] = measure(fn)
+        print(f"{name:<40} {r['ns']:>12,.0f} ns   (median {r['median_ns']:,.0f})", flush=True)
+    return {
+        "meta": {
+            "python": platform.python_version(), "platform": platform.platform(),
+            "machine": platform.machine(), "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(base: dict, new: dict, threshold_pct: float, names: list = ()) -> int:
+    """Prints the change per benchmark; returns how many got slower than the threshold."""
+    regressions = 0
+    print(f"\n{'benchmark':<40} {'base ns':>12} {'new ns':>12} {'change':>8}")
+    for name, r in new["results"].items():
+        old = base["results"].get(name)
+        if old is None:
+            print(f"{name:<40} {'-':>12} {r['ns']:>12,.0f}      new")
+            continue
+        change = (r["ns"] / old["ns"] - 1.0) * 100.0 if old["ns"] else 0.0
+        flag = ""
+        if change > threshold_pct:
+            flag, regressions = "  REGRESSION", regressions + 1
+        elif change < -threshold_pct:
+            flag = "  faster"
+        print(f"{name:<40} {old['ns']:>12,.0f} {r['ns']:>12,.0f} {change:>+7.1f}%{flag}")
+    for name in sorted(base["results"].keys() - new["results"].keys()):
+        if names and not any(n in name for n in names):
+            continue  # filtered out on purpose
+        print(f"{name:<40} missing from the new run")
+    print(f"{regressions} regression(s) over {threshold_pct:g}%")
+    return regressions
+
+
+def main():
+    args = sys.argv[1:]
+
+    def opt(name, default=None):
+        if name not in args:
+            return default
+        i = args.index(name)
+        value = args[i + 1]
+        del args[i : i + 2]
+        return value
+
+    out = opt("--json")
+    base_path = opt("--compare")
+    threshold = float(opt("--threshold", THRESHOLD_PCT))
+    log.configure("WARNING")  # TTS misses would log a line per call
+
+    if base_path and args and args[0].endswith(".json") and os.path.exists(args[0]):
+        with open(base_path) as f, open(args[0]) as g:
+            sys.exit(1 if compare(json.load(f), json.load(g), threshold) else 0)
+
+    new = run(args)
+    if out:
+        with open(out, "w") as f:
+            json.dump(new, f, indent=1)
+        print(f"wrote {out}")
+    if base_path:
+        with open(base_path) as f:
+            sys.exit(1 if compare(json.load(f), new, threshold, args) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# Vosk model benchmark. Run: python server/bench_models.py <corpus dir> <model dir> [<model dir> ...]
+# The corpus is 16-bit mono WAVs (any rate) with the reference text either in
+# a same-named .txt next to each one or in <corpus dir>/transcripts.tsv
+# (file<TAB>text per line). Every model is measured in its own process, so
+# one model's memory doesn't count against the next:
+#   load      seconds to load the model
+#   RSS       peak resident memory of that process, in MB (+ what loading the model added)
+#   RTF       decode CPU time / audio time on one core (1.0 = just keeps up)
+#   WER       word error rate against the references, after normalize_text()
+#   cmd err   references that are commands (final.command_match) whose
+#             transcript runs a different command or none
+#   false cmd references that are not commands whose transcript is one
+# Audio is fed in handle_client's 1024-byte chunks, free-form recognizer only
+# (bench_grammar.py measures the command grammar).
+# Imports final.py, so vosk and openai must be installed.
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import wave
+
+CHUNK = 1024  # bytes per recv() in handle_client
+
+
+def load_corpus(corpus: str) -> list:
+    """[(wav path, reference text)]"""
+    tsv = os.path.join(corpus, "transcripts.tsv")
+    if os.path.exists(tsv):
+        with open(tsv, encoding="utf-8") as f:
+            rows = [line.rstrip("\n").split("\t", 1) for line in f if "\t" in line]
+        return [(os.path.join(corpus, name), text) for name, text in rows]
+    items = []
+    for name in sorted(os.listdir(corpus)):
+        if name.endswith(".wav"):
+            txt = os.path.join(corpus, name[:-4] + ".txt")
+            if os.path.exists(txt):
+                with open(txt, encoding="utf-8") as f:
+                    items.append((os.path.join(corpus, name), f.read().strip()))
+    return items
+
+
+def word_errors(ref: list, hyp: list) -> int:
+    """Word-level edit distance (substitutions + insertions + deletions)."""
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1]
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024.0  # bytes on macOS, KB on Linux
+
+
+def measure(model_dir: str, corpus: str) -> dict:
+    """One model over the whole corpus (runs in the child process)."""
+    from vosk import KaldiRecognizer, Model, SetLogLevel
+
+    import final
+    import resample
+
+    def runs(norm: str):
+        m = final.command_match(norm)
+        return None if m is None else (m.route.handler.__name__, m.arg)
+
+    SetLogLevel(-1)
+    items = load_corpus(corpus)
+    rss_base = peak_rss_mb()
+    t0 = time.perf_counter()
+    model = Model(model_dir)
+    load_s = time.perf_counter() - t0
+
+    audio_s = cpu_s = 0.0
+    errors = ref_words = 0
+    commands = cmd_errors = false_cmds = 0
+    worst = []
+    for path, ref in items:
+        with wave.open(path, "rb") as w:
+            if w.getsampwidth() != 2 or w.getnchannels() != 1:
+                raise SystemExit(f"{path}: need 16-bit mono")
+            rate, pcm = w.getframerate(), w.readframes(w.getnframes())
+        pcm = resample.make_resampler(rate, final.SAMPLE_RATE).process_bytes(pcm)
+        audio_s += len(pcm) / 2 / final.SAMPLE_RATE
+
+        t0 = time.process_time()
+        rec = KaldiRecognizer(model, final.SAMPLE_RATE)
+        parts = []
+        for i in range(0, len(pcm), CHUNK):
+            if rec.AcceptWaveform(pcm[i : i + CHUNK]):
+                parts.append(json.loads(rec.Result()).get("text", ""))
+        parts.append(json.loads(rec.FinalResult()).get("text", ""))
+        cpu_s += time.process_time() - t0
+
+        ref_norm = final.normalize_text(ref)
+        hyp_norm = final.normalize_text(" ".join(p for p in parts if p))
+        e = word_errors(ref_norm.split(), hyp_norm.split())
+        errors += e
+        ref_words += len(ref_norm.split())
+        if e:
+            worst.append((e, ref_norm, hyp_norm))
+
+        want, got = runs(ref_norm), runs(hyp_norm)
+        if want is not None:
+            commands += 1
+            cmd_errors += got != want
+        elif got is not None:
+            false_cmds += 1
+
+    worst.sort(reverse=True)
+    return {
+        "model": model_dir, "utterances": len(items), "audio_s": audio_s, "load_s": load_s,
+        "rss_mb": peak_rss_mb(), "rss_base_mb": rss_base, "cpu_s": cpu_s, "rtf": cpu_s / audio_s if audio_s else 0.0,
+        "wer": errors / ref_words if ref_words else 0.0,
+        "commands": commands, "cmd_errors": cmd_errors, "false_cmds": false_cmds,
+        "worst": worst[:5],
+    }
+
+
+def main():
+    if len(sys.argv) >= 4 and sys.argv[1] == "--one":
+        # tagged: final.py's log lines may share stdout
+        print("RESULT " + json.dumps(measure(sys.argv[2], sys.argv[3]), ensure_ascii=False), flush=True)
+        return
+    if len(sys.argv) < 3:
+        raise SystemExit("usage: bench_models.py <corpus dir> <model dir> [<model dir> ...]")
+    corpus, models = sys.argv[1], sys.argv[2:]
+    n = len(load_corpus(corpus))
+    if not n:
+        raise SystemExit(f"{corpus}: no .wav with a .txt next to it, and no transcripts.tsv")
+    print(f"{n} utterances in {corpus}")
+
+    results = []
+    for model_dir in models:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--one", model_dir, corpus],
+            capture_output=True, text=True,
+        )
+        if out.returncode != 0:
+            print(f"{model_dir}: failed\n{out.stderr.strip()[-2000:]}")
+            continue
+        r = json.loads(next(ln for ln in out.stdout.splitlines() if ln.startswith("RESULT "))[7:])
+        results.append(r)
+        for e, ref, hyp in r["worst"]:
+            print(f"  {os.path.basename(model_dir)}: {e} error(s)  {ref!r} -> {hyp!r}")
+
+    print(f"\n{'model':<36} {'load':>6} {'RSS':>13} {'RTF':>6} {'WER':>6} {'cmd err':>9} {'false cmd':>9}")
+    for r in results:
+        cmd = f"{r['cmd_errors']}/{r['commands']}"
+        rss = f"{r['rss_mb']:.0f}M (+{r['rss_mb'] - r['rss_base_mb']:.0f})"
+        print(
+            f"{os.path.basename(r['model'].rstrip('/')):<36} {r['load_s']:5.1f}s {rss:>13} "
+            f"{r['rtf']:6.3f} {r['wer'] * 100:5.1f}% {cmd:>9} {r['false_cmds']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
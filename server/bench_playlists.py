@@ -0,0 +1,86 @@
+# Playlist index benchmark. Run: python server/bench_playlists.py
+# Builds a PlaylistIndex over a fake library of N_PLAYLISTS generated names,
+# then resolves "misheard" versions of real names (letters dropped, swapped or
+# replaced, words lost) and prints how many resolve to the right playlist,
+# lookup time, and the cost of a full build vs. an incremental refresh.
+
+import random
+import time
+
+import playlists
+
+N_PLAYLISTS = 2000
+N_QUERIES = 2000
+
+WORDS = (
+    "chill morning evening night drive workout gym focus study rain summer winter road trip "
+    "party dance deep house techno jazz classic rock indie acoustic lofi beats hits mix "
+    "travis scott drake weeknd eminem kanye queen nirvana metallica daft punk "
+    "утро вечер ночь дорога спорт учеба дождь лето зима хиты рок русский рэп танцы любимое"
+).split()
+
+
+class FakeLibrary:
+    def __init__(self, n: int, seed: int = 1):
+        rng = random.Random(seed)
+        names = set()
+        while len(names) < n:
+            names.add(" ".join(rng.sample(WORDS, rng.randint(1, 3))).title())
+        self.items = [(f"{i:016X}", name) for i, name in enumerate(sorted(names))]
+
+    def __call__(self):
+        return list(self.items)
+
+
+def mishear(name: str, rng: random.Random) -> str:
+    s = name.lower()
+    kind = rng.randrange(4)
+    i = rng.randrange(len(s))
+    if kind == 0:  # dropped letter
+        return s[:i] + s[i + 1 :]
+    if kind == 1:  # wrong letter
+        return s[:i] + rng.choice("aeioulnrstаеиоу") + s[i + 1 :]
+    if kind == 2 and i + 1 < len(s):  # swapped letters
+        return s[:i] + s[i + 1] + s[i] + s[i + 2 :]
+    words = s.split()
+    if len(words) > 2:  # lost a word
+        del words[rng.randrange(len(words))]
+    return " ".join(words)
+
+
+def main():
+    lib = FakeLibrary(N_PLAYLISTS)
+    index = playlists.PlaylistIndex(lib)
+
+    t0 = time.perf_counter()
+    index.refresh()
+    print(f"build {len(index)} playlists: {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    rng = random.Random(2)
+    targets = [rng.choice(lib.items) for _ in range(N_QUERIES)]
+    queries = [mishear(name, rng) for _, name in targets]
+
+    t0 = time.perf_counter()
+    found = [index.resolve(q) for q in queries]
+    per_us = (time.perf_counter() - t0) * 1e6 / N_QUERIES
+    right = sum(f is not None and f.pid == pid for f, (pid, _) in zip(found, targets))
+    missed = sum(f is None for f in found)
+    print(
+        f"misheard names: {right}/{N_QUERIES} right ({100 * right / N_QUERIES:.1f}%), "
+        f"{missed} unresolved, {per_us:.0f} us per lookup"
+    )
+
+    t0 = time.perf_counter()
+    for _, name in targets[:500]:
+        index.resolve(name)
+    print(f"exact names: {(time.perf_counter() - t0) * 1e6 / 500:.1f} us per lookup")
+
+    # incremental refresh: 10 playlists removed, 10 added
+    del lib.items[:10]
+    lib.items += [(f"NEW{i:013X}", f"New Playlist {i}") for i in range(10)]
+    added, removed = index.refresh()
+    print(f"refresh +{added} -{removed}: {index.last_refresh_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
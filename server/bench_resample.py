@@ -0,0 +1,55 @@
+# Resampler benchmark. Run: python server/bench_resample.py
+# Reports input samples per CPU-second (one core) for each device rate,
+# feeding 1 KB recv()-sized chunks like handle_client, and for batched streams.
+
+import time
+
+import numpy as np
+
+import resample
+
+MODEL_RATE = 16000
+DEVICE_RATES = (8000, 22050, 44100, 48000)
+SECONDS = 20
+CHUNK_SAMPLES = 512  # 1 KB of PCM16
+BATCH = 32  # streams resampled together in the batched run
+
+
+def cpu_rate(fn, total_samples: int) -> float:
+    t0 = time.process_time()
+    fn()
+    dt = time.process_time() - t0
+    return total_samples / dt if dt > 0 else float("inf")
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{SECONDS}s per stream, {CHUNK_SAMPLES}-sample chunks, -> {MODEL_RATE} Hz")
+    print(f"{'rate':>6} {'taps':>5} {'1 stream':>14} {'x realtime':>11} {f'{BATCH} batched':>14}")
+
+    for rate in DEVICE_RATES:
+        pcm = (rng.normal(0, 3000, SECONDS * rate)).astype("<i2").tobytes()
+        r = resample.Resampler(rate, MODEL_RATE)
+
+        def single():
+            step = CHUNK_SAMPLES * 2
+            for i in range(0, len(pcm), step):
+                r.process_bytes(pcm[i : i + step])
+
+        x = rng.normal(0, 3000, (BATCH, SECONDS * rate)).astype(np.float32)
+        rb = resample.Resampler(rate, MODEL_RATE, streams=BATCH)
+
+        def batched():
+            for i in range(0, x.shape[1], CHUNK_SAMPLES):
+                rb.process(x[:, i : i + CHUNK_SAMPLES])
+
+        s1 = cpu_rate(single, SECONDS * rate)
+        sb = cpu_rate(batched, BATCH * SECONDS * rate)
+        print(
+            f"{rate:>6} {r.taps:>5} {s1 / 1e6:>10.2f} M/s {s1 / rate:>10.0f}x "
+            f"{sb / 1e6:>10.2f} M/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
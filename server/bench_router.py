@@ -0,0 +1,135 @@
+# Command routing benchmark. Run: python server/bench_router.py
+# Compares final.ROUTER.match() with the old parse_and_execute_command if-chain
+# (conditions only, copied below; no actions run) on command hits and on
+# fall-through utterances that end up at GPT.
+# Imports final.py, so vosk and openai must be installed (models are not loaded).
+
+import time
+
+import final
+
+N = 20000
+
+
+def legacy_route(t: str):
+    # the pre-router chain, in its original order, returning a label per branch
+    if t == "weather" or t.startswith("weather "):
+        return "weather"
+    if t.startswith("open playlist ") and len(t) > len("open playlist "):
+        return "playlist"
+    if t.startswith("open "):
+        return "open"
+    if t.startswith("switch to "):
+        return "switch"
+    if t.startswith("search for "):
+        return "search"
+    if t.startswith("turn on ") and len(t) > len("turn on "):
+        return "youtube"
+    if t.startswith("type "):
+        return "type"
+    if t.startswith("press "):
+        return "press"
+    if t in ("volume up", "louder"):
+        return "volume"
+    if t in ("volume down", "quieter"):
+        return "volume"
+    if t == "mute":
+        return "mute"
+    if t in ("play", "pause", "post", "stop", "play/pause"):
+        return "playpause"
+    if t in ("close tab", "close the tab", "close this tab"):
+        return "close tab"
+    if t in ("next track", "next"):
+        return "next"
+    if t in ("previous track", "previous", "back"):
+        return "previous"
+    if t in ("screenshot", "take screenshot"):
+        return "screenshot"
+    if t.startswith("close "):
+        if t in ("close tab", "закрой эту вкладку", "закрой таб", "закрой вкладку в хроме", "close chrome tab"):
+            return "close tab"
+        if t in ("close window", "close chrome window"):
+            return "close window"
+        if t in ("close chrome", "close google", "close google chrome"):
+            return "close chrome"
+        return "close app"
+    if t.startswith("quit "):
+        return "quit"
+    if t.startswith("launch ") and len(t) > len("launch "):
+        return "youtube"
+    if t.startswith("play ") and len(t) > len("play "):
+        return "youtube"
+    if t == "погода" or t.startswith("погода "):
+        return "weather"
+    if t.startswith("включи ") and len(t) > len("включи "):
+        return "youtube"
+    if t.startswith("поставь ") and len(t) > len("поставь "):
+        return "youtube"
+    if t.startswith("открой плейлист ") and len(t) > len("открой плейлист "):
+        return "playlist"
+    if t.startswith("открой "):
+        return "open"
+    if t.startswith("переключись на "):
+        return "switch"
+    if t.startswith("поиск "):
+        return "search"
+    if t.startswith("напечатай "):
+        return "type"
+    if t.startswith("нажми "):
+        return "press"
+    if t in ("громче", "погромче"):
+        return "volume"
+    if t in ("тише", "потише"):
+        return "volume"
+    if t in ("без звука", "мут"):
+        return "mute"
+    if t in ("плей", "играй", "пауза", "плей пауза", "включи"):
+        return "playpause"
+    if t in ("следующий трек", "следующая", "дальше"):
+        return "next"
+    if t in ("предыдущий трек", "предыдущая", "назад"):
+        return "previous"
+    if t in ("скриншот", "сделай скриншот"):
+        return "screenshot"
+    if t.startswith("закрой "):
+        if t in ("закрой вкладку", "закрой эту вкладку", "закрой таб", "закрой вкладку в хроме", "закрой вкладку хром"):
+            return "close tab"
+        if t in ("закрой окно", "закрой окно хром", "закрой окно в хроме"):
+            return "close window"
+        if t in ("закрой хром", "закрой хром полностью", "закрой все вкладки", "выйди из хрома"):
+            return "close chrome"
+        return "close app"
+    return None
+
+
+CASES = {
+    "early hit (weather)": "weather london",
+    "mid hit (volume up)": "volume up",
+    "late hit (RU close tab)": "закрой вкладку",
+    "late hit (RU app)": "закрой телеграмм",
+    "fall-through EN": "what is the capital of france and why is it so big",
+    "fall-through RU": "расскажи мне что-нибудь интересное про космос",
+}
+
+
+def per_call_ns(fn, text: str) -> float:
+    t0 = time.perf_counter_ns()
+    for _ in range(N):
+        fn(text)
+    return (time.perf_counter_ns() - t0) / N
+
+
+def main():
+    # sanity: both must agree on command vs. not-a-command
+    for text in CASES.values():
+        assert (legacy_route(text) is None) == (final.ROUTER.match(text) is None), text
+
+    print(f"{'case':<26} {'if-chain':>10} {'router':>10} {'speedup':>8}")
+    for name, text in CASES.items():
+        old = per_call_ns(legacy_route, text)
+        new = per_call_ns(final.ROUTER.match, text)
+        print(f"{name:<26} {old:>8.0f}ns {new:>8.0f}ns {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
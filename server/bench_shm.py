@@ -0,0 +1,120 @@
+# Audio transport between processes. Run: python server/bench_shm.py [--seconds 600] [--chunk 1024] [--work none|endpoint]
+# Sends --seconds of 16 kHz PCM16 in --chunk byte pieces (handle_client's
+# recv size) from this process to a child process three ways:
+#   queue   multiprocessing.Queue (pickled, through a feeder thread and a pipe)
+#   pipe    Connection.send_bytes (the bytes themselves through a pipe)
+#   shm     shm_ring: copied once into shared memory, 8-byte notification per chunk;
+#           a receiver that is behind gets everything written since in one piece
+# The child runs --work on every chunk: nothing, or the endpointer (the part of
+# the decode path that needs no model). Prints throughput and CPU per chunk on
+# each side, so the transport can be compared with the work it feeds.
+
+import multiprocessing
+import sys
+import time
+
+import endpointer
+import shm_ring
+
+RATE = 16000
+
+
+def make_work(work: str):
+    if work == "endpoint":
+        ep = endpointer.Endpointer(RATE, 600, 300)
+        return ep.feed
+    return lambda data: None
+
+
+def consume_queue(q, results, work: str):
+    feed = make_work(work)
+    t0 = time.process_time()
+    n = 0
+    while (data := q.get()) is not None:
+        feed(data)
+        n += len(data)
+    results.put((n, time.process_time() - t0))
+
+
+def consume_pipe(conn, results, work: str):
+    feed = make_work(work)
+    t0 = time.process_time()
+    n = 0
+    while data := conn.recv_bytes():
+        feed(data)
+        n += len(data)
+    results.put((n, time.process_time() - t0))
+
+
+def consume_shm(args, results, work: str):
+    feed = make_work(work)
+    reader = shm_ring.RingReader(*args)
+    t0 = time.process_time()
+    n = 0
+    while (view := reader.read()) is not None:
+        feed(view)
+        n += len(view)
+        reader.release(len(view))
+        del view
+    results.put((n, time.process_time() - t0))
+    reader.close()
+
+
+def run(kind: str, chunk: bytes, count: int, work: str) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    if kind == "queue":
+        q = ctx.Queue(maxsize=256)
+        child = ctx.Process(target=consume_queue, args=(q, results, work))
+        send, done = q.put, lambda: q.put(None)
+    elif kind == "pipe":
+        theirs, ours = ctx.Pipe(duplex=False)
+        child = ctx.Process(target=consume_pipe, args=(theirs, results, work))
+        send, done = ours.send_bytes, lambda: ours.send_bytes(b"")
+    else:
+        ring = shm_ring.RingWriter()
+        child = ctx.Process(target=consume_shm, args=(ring.reader_args(), results, work))
+
+        def send(data):
+            while not ring.write(data):
+                time.sleep(0.0005)  # reader behind; a real front-end would drop
+
+        done = ring.close
+    child.start()
+    time.sleep(0.5)  # let it import
+
+    t0, c0 = time.perf_counter(), time.process_time()
+    for _ in range(count):
+        send(chunk)
+    done()
+    received, child_cpu = results.get()
+    wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+    child.join()
+    if received != count * len(chunk):
+        raise SystemExit(f"{kind}: received {received} of {count * len(chunk)} bytes")
+    return {"wall": wall, "sender_cpu": cpu, "receiver_cpu": child_cpu}
+
+
+def main():
+    args = sys.argv[1:]
+
+    def opt(name, default):
+        return type(default)(args[args.index(name) + 1]) if name in args else default
+
+    seconds = opt("--seconds", 600.0)
+    size = opt("--chunk", 1024)
+    work = opt("--work", "none")
+    chunk = bytes((i * 7) & 0xFF for i in range(size))
+    count = int(seconds * RATE * 2 / size)
+    print(f"{count} chunks of {size} bytes ({seconds:g}s of audio), receiver work: {work}")
+    print(f"{'transport':<8} {'chunks/s':>10} {'realtime':>9} {'sender':>12} {'receiver':>12}")
+    for kind in ("queue", "pipe", "shm"):
+        r = run(kind, chunk, count, work)
+        print(
+            f"{kind:<8} {count / r['wall']:10,.0f} {seconds / r['wall']:8,.0f}x "
+            f"{r['sender_cpu'] * 1e6 / count:9.1f} us {r['receiver_cpu'] * 1e6 / count:9.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
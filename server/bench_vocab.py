@@ -0,0 +1,119 @@
+# Fuzzy vocabulary benchmark. Run: python server/bench_vocab.py
+# Generates likely mis-hearings of every wake/sleep/language/app entry (one
+# sound swapped: д/т, з/с, е/и, v/f, doubled or dropped letters...) and a list
+# of ordinary words that must NOT match, then prints match rate, false
+# positives and lookup time for final.vocab_scan() vs. plain exact lookups.
+# Imports final.py, so vosk and openai must be installed (models are not loaded).
+
+import time
+
+import final
+
+SWAPS = (
+    ("д", "т"), ("т", "д"), ("з", "с"), ("с", "з"), ("б", "п"), ("в", "ф"), ("г", "к"),
+    ("ж", "ш"), ("е", "и"), ("и", "е"), ("о", "а"), ("а", "о"), ("э", "е"), ("ь", ""),
+    ("d", "t"), ("t", "d"), ("s", "z"), ("v", "f"), ("g", "k"), ("c", "k"), ("e", "i"),
+    ("i", "e"), ("a", "e"), ("o", "a"), ("ee", "i"), ("ck", "k"),
+)
+
+NEGATIVES = """
+hello what time is it today weather open close play next back good morning thanks
+please tell me about the news service travel harvest service versus jars visit
+привет как дела сколько времени сегодня хорошо спасибо расскажи новости кот собака
+дом работа спит сани семена ассорти телега дорога город машина вечер утро ночь
+assistance assistants terminals ассистента ассистенту русские
+""".split()
+
+N_TIMING = 20000
+
+
+def entries():
+    for w in final.WAKE_WORDS_EN | final.WAKE_WORDS_RU:
+        yield "wake", w, None
+    for w in final.SLEEP_WORDS_EN | final.SLEEP_WORDS_RU:
+        yield "sleep", w, None
+    for w in final.LANG_EN_WORDS | final.LANG_EN_WORDS_RU:
+        yield "lang_en", w, None
+    for w in final.LANG_RU_WORDS:
+        yield "lang_ru", w, None
+    for w in final.APP_ALIASES:
+        yield "app", w, w
+    for w, key in final.RU_APP_ALIASES.items():
+        yield "app_ru", w, key
+
+
+def variants(word: str):
+    out = set()
+    for a, b in SWAPS:
+        i = word.find(a)
+        if i >= 0:
+            out.add(word[:i] + b + word[i + len(a) :])
+    for i, ch in enumerate(word):
+        if ch.isalpha():
+            out.add(word[:i] + ch + word[i:])  # doubled letter
+    return out - {word}
+
+
+def exact_kinds(text: str) -> set:
+    # what the pre-fuzzy code could recognize
+    kinds = set()
+    tks = set(final.tokens(text))
+    if tks & (final.WAKE_WORDS_EN | final.WAKE_WORDS_RU):
+        kinds.add("wake")
+    if tks & (final.SLEEP_WORDS_EN | final.SLEEP_WORDS_RU):
+        kinds.add("sleep")
+    if text in final.LANG_EN_WORDS or text in final.LANG_EN_WORDS_RU:
+        kinds.add("lang_en")
+    if text in final.LANG_RU_WORDS:
+        kinds.add("lang_ru")
+    if text in final.APP_ALIASES:
+        kinds.add("app")
+    if text in final.RU_APP_ALIASES:
+        kinds.add("app_ru")
+    return kinds
+
+
+def fuzzy_kinds(text: str) -> set:
+    scan = final.vocab_scan(text)
+    kinds = set(scan.whole)
+    for _, k in scan.tokens:
+        kinds |= set(k) & {"wake", "sleep"}
+    return kinds
+
+
+def main():
+    all_words = {w for _, w, _ in entries()}
+    cases = [(kind, v) for kind, w, _ in entries() for v in variants(w) if v not in all_words]
+
+    print(f"{len(cases)} misheard variants, {len(NEGATIVES)} ordinary words")
+    for name, fn in (("exact", exact_kinds), ("fuzzy", fuzzy_kinds)):
+        final.vocab_scan.cache_clear()
+        hit = sum(kind in fn(v) for kind, v in cases)
+        false = [w for w in NEGATIVES if fn(w)]
+        print(
+            f"{name:<6} matched {hit}/{len(cases)} ({100 * hit / len(cases):.0f}%)   "
+            f"false positives {len(false)}/{len(NEGATIVES)} {false if false else ''}"
+        )
+
+    utterance = "джарвис открой пожалуйста телеграм"
+    t0 = time.perf_counter()
+    for _ in range(N_TIMING):
+        exact_kinds(utterance)
+    exact_us = (time.perf_counter() - t0) * 1e6 / N_TIMING
+
+    t0 = time.perf_counter()
+    for _ in range(N_TIMING // 10):
+        final.vocab_scan.cache_clear()
+        final.vocab_scan(utterance)
+    fuzzy_us = (time.perf_counter() - t0) * 1e6 / (N_TIMING // 10)
+
+    t0 = time.perf_counter()
+    for _ in range(N_TIMING):
+        final.vocab_scan(utterance)
+    cached_us = (time.perf_counter() - t0) * 1e6 / N_TIMING
+
+    print(f"per utterance: exact {exact_us:.1f} us, fuzzy scan {fuzzy_us:.1f} us, cached {cached_us:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Weather service benchmark. Run: python server/bench_weather.py
+# Starts a local stand-in for wttr.in (keep-alive HTTP/1.1, DELAY_S per request)
+# and measures WeatherService: a cold miss, a miss over a pooled connection,
+# a cache hit, and N_CONCURRENT identical lookups at once (single-flight).
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import weather
+
+DELAY_S = 0.05  # stand-in server think time
+N_HITS = 100000
+N_CONCURRENT = 20
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+    requests = 0
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StandIn.connections += 1
+
+    def do_GET(self):
+        StandIn.requests += 1
+        time.sleep(DELAY_S)
+        city = self.path.split("?")[0].strip("/") or "Astana"
+        body = f"{city}: Partly cloudy +12°C".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def ms(t0: float) -> float:
+    return (time.perf_counter() - t0) * 1000.0
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    svc = weather.WeatherService(base_url=f"http://127.0.0.1:{server.server_port}")
+
+    t0 = time.perf_counter()
+    svc.lookup("London")
+    print(f"cold miss (new connection):  {ms(t0):8.2f} ms")
+
+    t0 = time.perf_counter()
+    svc.lookup("Paris")
+    print(f"miss (pooled connection):    {ms(t0):8.2f} ms")
+
+    t0 = time.perf_counter()
+    for _ in range(N_HITS):
+        svc.lookup("London")
+    print(f"cache hit:                   {ms(t0) * 1000.0 / N_HITS:8.2f} us")
+
+    before = StandIn.requests
+    threads = [threading.Thread(target=svc.lookup, args=("Tokyo",)) for _ in range(N_CONCURRENT)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(
+        f"{N_CONCURRENT} concurrent lookups:      {ms(t0):8.2f} ms, "
+        f"{StandIn.requests - before} upstream request(s)"
+    )
+    print(f"connections opened: {StandIn.connections} for {StandIn.requests} requests")
+    print(svc.report())
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
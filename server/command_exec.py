@@ -0,0 +1,175 @@
+"""
+Runs voice commands off the audio thread.
+
+handle_client has to keep calling recv(): a command that blocks it (YouTube
+polling, a slow weather request) stalls STT, and the device's TCP buffer
+overflows and drops audio. CommandRunner runs handlers on a small bounded
+thread pool instead, gives each job a deadline and hands the reply to a
+callback (speak() in final.py).
+
+Threads cannot be killed, so cancellation is cooperative: long-running
+actions call command_exec.sleep() / check() between steps, which raise
+Cancelled once the job has been cancelled (barge-in, sleep, disconnect) or
+its deadline has passed. A job that never checks still runs to the end, but
+its reply is dropped.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import log
+import profiling
+import stats
+import tracing
+
+WORKERS = 2
+MAX_PENDING = 4  # queued + running; more is refused instead of piling up
+
+LOG = log.get("command")
+
+
+class Cancelled(Exception):
+    pass
+
+
+_local = threading.local()
+
+
+class Job:
+    def __init__(self, owner, name: str, deadline_s: float):
+        self.owner = owner
+        self.name = name
+        self.deadline = time.monotonic() + deadline_s
+        self.state = "running"  # -> done | failed | cancelled | timeout
+        self._cancel = threading.Event()
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set() or self.remaining() <= 0
+
+
+def current_job() -> Job | None:
+    return getattr(_local, "job", None)
+
+
+def check():
+    """Raises Cancelled if the calling command should stop. No-op outside a job."""
+    job = current_job()
+    if job is not None and job.cancelled:
+        raise Cancelled(job.name)
+
+
+def sleep(seconds: float):
+    """time.sleep() that wakes up and raises Cancelled when the job is cancelled."""
+    job = current_job()
+    if job is None:
+        time.sleep(seconds)
+        return
+    job._cancel.wait(max(0.0, min(seconds, job.remaining())))
+    check()
+
+
+class CommandRunner:
+    def __init__(self, workers: int = WORKERS, max_pending: int = MAX_PENDING):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="command")
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._jobs = set()
+
+        self.counts = {"done": 0, "failed": 0, "cancelled": 0, "timeout": 0, "rejected": 0}
+        self.latency = stats.Histogram()  # submit -> reply delivered, ms
+
+    def submit(self, owner, name: str, fn, deadline_s: float, on_done, on_timeout=None) -> Job | None:
+        """
+        Runs fn() in the background. on_done(result) gets its return value
+        unless the job was cancelled or timed out first; on_timeout() is
+        called when the deadline passes. Returns None if the runner is full.
+        """
+        with self._lock:
+            if len(self._jobs) >= self.max_pending:
+                self.counts["rejected"] += 1
+                return None
+            job = Job(owner, name, deadline_s)
+            self._jobs.add(job)
+
+        timer = threading.Timer(deadline_s, self._expire, (job, on_timeout))
+        timer.daemon = True
+        timer.start()
+        trace = tracing.capture()  # the job's spans (and its reply) go to the caller's turn
+        self.executor.submit(self._run, job, fn, on_done, on_timeout, timer, time.monotonic(), trace)
+        return job
+
+    def cancel(self, owner=None, reason: str = "cancelled") -> int:
+        """Cancels every unfinished job of `owner` (all jobs if None)."""
+        n = 0
+        with self._lock:
+            jobs = [j for j in self._jobs if owner is None or j.owner is owner]
+        for job in jobs:
+            if self._settle(job, "cancelled"):
+                LOG.info("command cancelled", command=job.name, reason=reason)
+                n += 1
+        return n
+
+    def busy(self, owner=None) -> bool:
+        with self._lock:
+            return any(
+                j.state == "running" and (owner is None or j.owner is owner)
+                for j in self._jobs
+            )
+
+    def _settle(self, job: Job, state: str) -> bool:
+        # exactly one of finish / cancel / timeout wins
+        with self._lock:
+            if job.state != "running":
+                return False
+            job.state = state
+            self.counts[state] += 1
+        if state in ("cancelled", "timeout"):
+            job._cancel.set()
+        return True
+
+    def _expire(self, job: Job, on_timeout):
+        if self._settle(job, "timeout"):
+            LOG.warning("command deadline passed", command=job.name)
+            if on_timeout is not None:
+                on_timeout()
+
+    def _run(self, job: Job, fn, on_done, on_timeout, timer, submitted: float, trace=None):
+        profiling.tick()
+        with tracing.bind(trace):
+            self._run_job(job, fn, on_done, on_timeout, timer, submitted)
+        profiling.tick()
+
+    def _run_job(self, job: Job, fn, on_done, on_timeout, timer, submitted: float):
+        _local.job = job
+        result, state = None, "done"
+        try:
+            check()  # may have been cancelled while queued
+            with tracing.span(f"command {job.name}", "command"):
+                result = fn()
+        except Cancelled:
+            if job.remaining() <= 0 and not job._cancel.is_set():
+                state = "timeout"  # the deadline passed before the timer fired
+        except Exception as e:
+            LOG.error("command error", command=job.name, error=e)
+            state = "failed"
+        finally:
+            _local.job = None
+            timer.cancel()
+            with self._lock:
+                self._jobs.discard(job)
+
+        if state == "timeout":
+            self._expire(job, on_timeout)
+        elif self._settle(job, state) and state == "done":
+            self.latency.observe((time.monotonic() - submitted) * 1000.0)
+            if result is not None:
+                on_done(result)
+
+    def report(self) -> str:
+        counts = " ".join(f"{k}={v}" for k, v in self.counts.items())
+        return f"commands: {counts}\n" + self.latency.render("command latency")
@@ -0,0 +1,133 @@
+"""
+Table-driven command routing.
+
+Commands are registered once as data: exact phrases go into a hash table,
+prefix commands ("open <app>", "включи <query>") into a word-level trie.
+match() is one dict lookup plus a walk over the first few words, instead of
+a linear scan over every pattern, and has no side effects (the handler is
+only called by dispatch()).
+
+Rules, same as the old if-chain:
+- an exact phrase wins over any prefix;
+- the longest matching prefix wins ("open playlist x" before "open x");
+- a prefix command needs an argument unless registered with optional_arg.
+
+phrases() lists every complete command the table can produce from a closed
+vocabulary (exact phrases, plus prefix + each `vocab` argument), e.g. to
+build a grammar for a restricted recognizer.
+"""
+
+from typing import Callable, NamedTuple
+
+
+class Route(NamedTuple):
+    handler: Callable
+    phrase: str  # the phrase or prefix that matched, normalized
+    tag: str  # free-form label ("app", "media", ...) for callers that inspect routes
+    optional_arg: bool
+    vocab: tuple  # known arguments for phrases(); empty = free-form argument
+
+
+class Match(NamedTuple):
+    route: Route
+    text: str  # normalized utterance
+    arg: str  # normalized words after the prefix ("" for exact matches)
+    raw_arg: str  # same words, original casing
+
+
+_ROUTE = "\0route"  # trie node key holding the Route ending at this node
+
+
+class CommandRouter:
+    def __init__(self):
+        self.exact_routes = {}
+        self.trie = {}
+        self.max_prefix_words = 0
+
+    def exact(self, phrases, handler: Callable, tag: str = ""):
+        for p in phrases:
+            p = " ".join(p.split())
+            # first registration wins, like the first branch in an if-chain
+            self.exact_routes.setdefault(p, Route(handler, p, tag, False, ()))
+
+    def prefix(
+        self,
+        prefixes,
+        handler: Callable,
+        tag: str = "",
+        optional_arg: bool = False,
+        vocab=(),
+    ):
+        vocab = tuple(vocab)
+        for p in prefixes:
+            words = p.split()
+            node = self.trie
+            for w in words:
+                node = node.setdefault(w, {})
+            node.setdefault(_ROUTE, Route(handler, " ".join(words), tag, optional_arg, vocab))
+            self.max_prefix_words = max(self.max_prefix_words, len(words))
+
+    def routes(self):
+        yield from self.exact_routes.values()
+        stack = [self.trie]
+        while stack:
+            node = stack.pop()
+            for k, v in node.items():
+                if k == _ROUTE:
+                    yield v
+                else:
+                    stack.append(v)
+
+    def phrases(self) -> list:
+        """Every complete command with a closed-vocabulary argument, sorted."""
+        out = set()
+        for r in self.routes():
+            if r.phrase in self.exact_routes or r.optional_arg:
+                out.add(r.phrase)
+            for v in r.vocab:
+                out.add(f"{r.phrase} {v}")
+        return sorted(out)
+
+    def match(self, text: str, raw_text: str = "") -> Match | None:
+        """text: normalized utterance. raw_text: same utterance before lowercasing."""
+        route = self.exact_routes.get(text)
+        if route is not None:
+            return Match(route, text, "", "")
+
+        if "  " in text:
+            key = " ".join(text.split())
+            route = self.exact_routes.get(key)
+            if route is not None:
+                return Match(route, key, "", "")
+
+        # only the first few words can start a prefix command
+        head = text.split(None, self.max_prefix_words)
+
+        # walk the trie; the deepest prefix that ends along the way wins
+        best = None
+        node = self.trie
+        for i, w in enumerate(head):
+            node = node.get(w)
+            if node is None:
+                break
+            r = node.get(_ROUTE)
+            if r is not None and (i + 1 < len(head) or r.optional_arg):
+                best = (i + 1, r)
+        if best is None:
+            return None
+
+        n, r = best
+        rest = text.split(None, n)
+        arg = rest[n] if len(rest) > n else ""
+        raw_arg = arg
+        if raw_text and raw_text != text:
+            rest = raw_text.split(None, n)
+            raw_arg = rest[n] if len(rest) > n else ""
+        return Match(r, text, arg, raw_arg)
+
+    def dispatch(self, text: str, raw_text: str, *args):
+        """Runs the matched handler as handler(match, *args). None if no route."""
+        m = self.match(text, raw_text)
+        if m is None:
+            return None
+        return m.route.handler(m, *args)
@@ -0,0 +1,56 @@
+"""
+A directory of files keyed by text, safe to share between processes.
+
+Each entry is one file named after the md5 of its key. put() writes a
+temporary file (named after the writing process and thread) and renames it
+into place, so a reader in any process sees the old entry, the new one or
+none, never half of one. A reader that opened an entry keeps reading it even
+if another process replaces it meanwhile. With ttl_s, older entries count as
+misses (and are overwritten by the next put()).
+
+    TTS_CACHE = DiskCache("tts_cache", ".pcm")
+    f = TTS_CACHE.open(text)        # binary file or None
+    TTS_CACHE.put(text, audio)
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+
+class DiskCache:
+    def __init__(self, directory: str, suffix: str = "", ttl_s: float = 0.0):
+        self.dir = directory
+        self.suffix = suffix
+        self.ttl_s = ttl_s
+        os.makedirs(directory, exist_ok=True)  # several workers may start at once
+
+    def path(self, key: str) -> str:
+        h = hashlib.md5(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.dir, h + self.suffix)
+
+    def open(self, key: str):
+        """The entry opened for reading, or None (missing or expired)."""
+        try:
+            f = open(self.path(key), "rb")
+        except FileNotFoundError:
+            return None
+        if self.ttl_s and time.time() - os.fstat(f.fileno()).st_mtime > self.ttl_s:
+            f.close()
+            return None
+        return f
+
+    def get(self, key: str) -> bytes | None:
+        f = self.open(key)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def put(self, key: str, data: bytes):
+        path = self.path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
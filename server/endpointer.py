@@ -0,0 +1,106 @@
+"""
+Server-side end-of-utterance detection.
+
+Vosk only returns a FINAL when its own endpointing decides the utterance is
+over, which often waits out hundreds of ms of trailing silence. The
+Endpointer runs a cheap energy VAD over the same PCM16 stream and reports
+when speech has been followed by `silence_ms` of silence, so handle_client
+can force rec.FinalResult() instead of waiting.
+
+Time is counted in audio samples, not wall clock, so results are the same
+whether audio arrives live or is replayed from disk.
+"""
+
+import numpy as np
+
+FRAME_MS = 20
+
+SILENCE_MS = 600          # free-form speech / questions
+COMMAND_SILENCE_MS = 300  # partial already looks like a command
+MIN_SPEECH_MS = 120       # ignore clicks and short bursts
+
+# speech = frame RMS above max(ABS_THRESHOLD, noise floor * NOISE_RATIO)
+ABS_THRESHOLD = 300.0
+NOISE_RATIO = 3.0
+NOISE_ADAPT = 0.05  # EMA weight for the noise floor (silence frames only)
+
+
+class Endpointer:
+    def __init__(
+        self,
+        rate: int,
+        silence_ms: int = SILENCE_MS,
+        command_silence_ms: int = COMMAND_SILENCE_MS,
+    ):
+        self.rate = rate
+        self.frame = rate * FRAME_MS // 1000
+        self.silence_ms = silence_ms
+        self.command_silence_ms = command_silence_ms
+        self.command_mode = False
+        self.noise = ABS_THRESHOLD / NOISE_RATIO
+        self.samples = 0  # total samples seen (audio clock)
+        self._buf = np.zeros(0, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        """Start a new utterance (call after every FINAL)."""
+        self.speech_ms = 0
+        self.silence_run_ms = 0
+        self.speech_end = None  # audio time (ms) of the last speech frame
+        self.command_mode = False
+        self._fired = False
+
+    @property
+    def now_ms(self) -> float:
+        return self.samples * 1000.0 / self.rate
+
+    @property
+    def in_speech(self) -> bool:
+        return self.speech_ms >= MIN_SPEECH_MS and self.silence_run_ms == 0
+
+    def window_ms(self) -> int:
+        return self.command_silence_ms if self.command_mode else self.silence_ms
+
+    def feed(self, pcm: bytes) -> bool:
+        """
+        Consumes PCM16 audio. Returns True once per utterance, when speech
+        has been followed by window_ms() of silence.
+        """
+        x = np.frombuffer(pcm[: len(pcm) & ~1], dtype="<i2").astype(np.float32)
+        self.samples += len(x)
+        x = np.concatenate([self._buf, x])
+        n = len(x) // self.frame
+        self._buf = x[n * self.frame :]
+        if n == 0:
+            return False
+
+        frames = x[: n * self.frame].reshape(n, self.frame)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+
+        # t = audio time (ms) at the end of the current frame
+        frame_ms = self.frame * 1000.0 / self.rate
+        t = (self.samples - len(self._buf)) * 1000.0 / self.rate - n * frame_ms
+
+        fired = False
+        for r in rms.tolist():
+            t += frame_ms
+            if r > max(ABS_THRESHOLD, self.noise * NOISE_RATIO):
+                self.speech_ms += FRAME_MS
+                self.silence_run_ms = 0
+                self.speech_end = None
+                self._fired = False
+                continue
+
+            self.noise += NOISE_ADAPT * (r - self.noise)
+            if self.speech_ms < MIN_SPEECH_MS:
+                self.speech_ms = 0
+                continue
+
+            if self.silence_run_ms == 0:
+                self.speech_end = t - frame_ms  # end of the last speech frame
+            self.silence_run_ms += FRAME_MS
+            if self.silence_run_ms >= self.window_ms() and not self._fired:
+                self._fired = True
+                fired = True
+
+        return fired
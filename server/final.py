@@ -1,42 +1,220 @@
 import socket
+import contextlib
 import json
+import re
 import threading
+import time
 import config
 from vosk import Model, KaldiRecognizer
 from openai import OpenAI
 import subprocess
 import urllib.parse
-import time
 import queue
-import urllib.request
-
-
-client = OpenAI(api_key=config.OPENAI_API_KEY)
+import audio_codec
+import protocol
+import resample
+import endpointer
+import stats
+import speculation
+import command_router
+import command_exec
+import automation
+import readiness
+import weather
+import playlists
+import fuzzy
+import keywords
+import intent
+import turns
+import log
+import tracing
+import metrics
+import profiling
+import recording
+import disk_cache
+import supervisor
+import functools
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+
+
+# "" = api.openai.com; point it at mock_openai.py (e.g. "http://127.0.0.1:8099/v1") for load tests
+OPENAI_BASE_URL = ""
+client = OpenAI(api_key=config.OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
 
 # ===== MODELS =====
 MODEL_RU = "/Users/seitovmaulet/Downloads/vosk-model-small-ru-0.22"
 MODEL_EN = "/Users/seitovmaulet/Downloads/vosk-model-small-en-us-0.15"
-SAMPLE_RATE = 16000
+SAMPLE_RATE = 16000  # model rate; devices may send any rate, see resample.py
 
 # ===== TCP CONFIG =====
 HOST = "0.0.0.0"
 PORT = 6000
+LISTEN_BACKLOG = 128  # connections waiting for accept(); a fleet reconnecting at once needs more than 1
+
+# Loaded by load_models() from main(), so tools (bench_router.py) can import
+# this file without the Vosk models.
+model_ru = None
+model_en = None
+
+DEFAULT_LANG = "ru"  # a device's language until it switches
+LAST_LANG = {}  # device -> language it switched to, kept for when it reconnects
+
+# conn -> that connection's Conversation (wake state, language, GPT history)
+CONVERSATIONS = {}
+
+# conn -> (free-form recognizer, grammar-restricted command recognizer or None),
+# created by reset_recognizer(); every connection decodes its own audio
+RECOGNIZERS = {}
+
+# conn -> that connection's speech queue, emptied by its own speak_worker
+SPEAK_QUEUES = {}
+
+# ===== WORKERS =====
+# WORKERS > 1: a supervisor (supervisor.py) runs that many server processes on
+# PORT (SO_REUSEPORT), each with its own models, sessions, wake state and
+# history; only the TTS and reply caches on disk are shared. METRICS_PORT then
+# serves every worker's metrics; the profiling port is off (signals still work).
+# kill -HUP the supervisor for a rolling restart: old workers close each
+# session once it is idle (the device reconnects) or after WORKER_DRAIN_S.
+WORKERS = 0
+WORKER_DRAIN_S = 30.0
+WORKER_STATS_S = 10.0
+DRAINING = threading.Event()  # set in a worker that is stopping
+SESSIONS = []  # live handle_client threads started by serve()
+ACCEPTED = 0
+
+# ===== DOWNSTREAM AUDIO CODEC =====
+# Codecs the server may use for TTS audio. The device lists the ones it can
+# decode in its HELLO line (see protocol.py); anything else gets raw PCM16.
+TTS_CODECS = ("ADPCM", "ULAW", "PCM16")
+
+# conn -> parsed HELLO info (+ negotiated "tts_codec")
+DEVICE_INFO = {}
+
+# ===== METRICS =====
+# Per-turn stage latencies (turns.py) for every device, plus the endpointing
+# histograms, as Prometheus text on http://METRICS_HOST:METRICS_PORT/metrics.
+# METRICS_PORT = 0 turns the endpoint off (the numbers are still printed on disconnect).
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+TURNS = turns.TurnTracker()
+
+# ===== TRACING =====
+# TRACE = True writes one Chrome trace-event file per turn to TRACE_DIR
+# (tracing.py); open it in https://ui.perfetto.dev or chrome://tracing.
+TRACE = False
+TRACE_DIR = "traces"
+
+# ===== LOGGING =====
+# Lines go through log.py's queue and are written by a background thread, so a
+# slow stdout never stalls the audio loop. PARTIAL lines (several per second
+# while someone talks) are off in production; LOG_FORMAT = "json" for one JSON
+# object per line, LOG_FILE = "" for stdout.
+PRODUCTION = True
+LOG_LEVEL = "INFO" if PRODUCTION else "DEBUG"
+LOG_PARTIALS = not PRODUCTION
+LOG_PARTIAL_EVERY_S = 0.25  # at most one PARTIAL line per this many seconds
+LOG_FORMAT = "text"
+LOG_FILE = ""
+LOG = log.get("final")
+
+# ===== PROFILING =====
+# Control socket for profiling the live server (profiling.py):
+#   echo "sample 10" | nc 127.0.0.1 9109      (stacks, cprofile N, mem snap, ...)
+# Results go to PROFILE_DIR. SIGUSR1 dumps thread stacks, SIGUSR2 samples for 10 s.
+# PROFILE_PORT = 0 leaves only the signals.
+PROFILE_HOST = "127.0.0.1"
+PROFILE_PORT = 9109
+PROFILE_DIR = "profiles"
+
+# ===== RECORDING / REPLAY =====
+# RECORD = True saves every session's raw upstream bytes (audio + markers) to
+# RECORD_DIR; replay.py feeds them back through handle_client. DRY_RUN routes
+# commands as usual but does not run them; OFFLINE answers questions with a
+# placeholder instead of calling GPT and skips TTS (replay.py turns both on,
+# loadgen.py wants DRY_RUN). STAGE_CPU adds up handle_client's CPU per stage.
+RECORD = False
+RECORD_DIR = "recordings"
+DRY_RUN = False
+OFFLINE = False
+STAGE_CPU = stats.StageCPU()
+
+# OpenAI "pcm" TTS output, used to tell when the device finishes playing a reply
+TTS_PCM_RATE = 24000
+TTS_PCM_BYTES = 2
+
+# ===== ENDPOINTING =====
+# Force a FINAL after this much trailing silence instead of waiting for Vosk.
+# The shorter window applies when the partial is already a complete command.
+ENDPOINT_SILENCE_MS = 600
+ENDPOINT_COMMAND_SILENCE_MS = 300
+
+# end of speech -> FINAL, by which side produced the FINAL
+ENDPOINT_LATENCY = {
+    "vosk": stats.Histogram(),
+    "endpointer": stats.Histogram(),
+    "grammar": stats.Histogram(),
+}
 
+# ===== COMMAND GRAMMAR =====
+# While awake, a second recognizer restricted to the command phrases (built
+# from ROUTER and the alias tables, see command_grammar()) hears the same
+# audio. If it returns a whole command with every word at or above
+# COMMAND_GRAMMAR_MIN_CONF, that becomes the FINAL without waiting for the
+# free-form recognizer. Grammars need a model with a dynamic graph (the
+# "small" Vosk models); set False for big models.
+COMMAND_GRAMMAR = True
+COMMAND_GRAMMAR_MIN_CONF = 0.85
+
+# ===== COMMAND EXECUTION =====
+# Commands run on COMMANDS (see command_exec.py) so handle_client never stops
+# reading audio. Deadline per route tag, in seconds ("" = everything else).
+# A new command or question cancels the running one, and so does sleep.
+COMMAND_DEADLINE_S = {"": 5.0, "youtube": 25.0, "playlist": 10.0, "weather": 8.0, "search": 8.0}
+COMMANDS = command_exec.CommandRunner()
+
+# ===== AUTOMATION =====
+# AppleScript goes to one long-lived osascript host that keeps compiled
+# scripts (see automation.py). False = a new osascript process per script.
+AUTOMATION_HOST = True
+ACTIONS = automation.make_runner(AUTOMATION_HOST)
+
+# ===== WEATHER =====
+# Cached, pooled wttr.in lookups (see weather.py). With prefetch on, the
+# default city ("погода" with no location) is refreshed in the background.
+WEATHER = weather.WeatherService(ttl_s=600.0, default_location="Astana")
+WEATHER_PREFETCH = False
+
+# ===== APPLE MUSIC PLAYLISTS =====
+# Playlist names are loaded once, refreshed in the background and matched
+# locally, so "open playlist <misheard name>" still finds the playlist.
+PLAYLISTS = playlists.PlaylistIndex(
+    lambda: playlists.music_library(ACTIONS.run), refresh_s=300.0, min_score=0.55
+)
+
+# ===== SPECULATION =====
+# Send the LLM request once a partial has been stable this long, before the
+# FINAL arrives (see speculation.py). Wasted requests are dropped on mismatch.
+SPECULATE = True
+SPECULATE_STABLE_MS = 250
+SPECULATE_TTS = False  # also synthesize the reply early (a miss wastes a TTS call)
+SPECULATION_EXECUTOR = ThreadPoolExecutor(max_workers=2)
 
-print("Loading RU model...")
-model_ru = Model(MODEL_RU)
-print("Loading EN model...")
-model_en = Model(MODEL_EN)
 
-current_lang = "ru"
-rec = KaldiRecognizer(model_ru, SAMPLE_RATE)
+# ===== SIMPLE MEMORY =====
+HISTORY_LIMIT = 10
 
-SPEAK_QUEUE = queue.Queue(maxsize=10)
 
+class Conversation:
+    """One connection's state: awake or not, its language, its GPT history."""
 
-# ===== SIMPLE MEMORY =====
-conversation_history = []
-HISTORY_LIMIT = 10
+    def __init__(self, device: str, lang: str):
+        self.device = device
+        self.lang = lang
+        self.awake = False
+        self.skip_next_final_after_wake = False
+        self.history = []
 
 # ===== WAKE/SLEEP WORDS =====
 WAKE_WORDS_EN = {"jarvis", "assistant"}
@@ -45,9 +223,6 @@ WAKE_WORDS_RU = {"джарвис", "жарвис", "ассистент", "тар
 SLEEP_WORDS_EN = {"sleep"}
 SLEEP_WORDS_RU = {"слип", "усни", "спи", "засни", "спать"}
 
-is_awake = False
-skip_next_final_after_wake = False
-
 
 # ====================================================================================================
 # MAC CONTROL FUNCTIONS
@@ -111,17 +286,11 @@ KEY_ALIASES_RU = {
 
 
 def run_osascript(script: str) -> bool:
-    try:
-        r = subprocess.run(["osascript", "-e", script], capture_output=True, text=True)
-        if r.returncode != 0:
-            err = (r.stderr or r.stdout or "").strip()
-            if err:
-                print("osascript error:", err)
-            return False
-        return True
-    except Exception as e:
-        print("osascript exception:", e)
-        return False
+    with tracing.span("osascript", "automation"):
+        r = ACTIONS.run(script)
+    if not r.ok and r.out:
+        LOG.warning("osascript error", out=r.out)
+    return r.ok
 
 
 def run_osascript_out(script: str) -> str:
@@ -129,13 +298,14 @@ def run_osascript_out(script: str) -> str:
     Выполняет AppleScript и возвращает stdout (строкой).
     Если ошибка — возвращает текст ошибки.
     """
-    try:
-        p = subprocess.run(["osascript", "-e", script], capture_output=True, text=True)
-        if p.returncode != 0:
-            return (p.stderr or "").strip()
-        return (p.stdout or "").strip()
-    except Exception as e:
-        return f"EXCEPTION: {e}"
+    with tracing.span("osascript", "automation"):
+        return ACTIONS.run(script).out
+
+
+def run_osascript_batch(scripts) -> list:
+    """Runs several scripts in one round trip; one ActionResult per script."""
+    with tracing.span("osascript batch", "automation", scripts=len(scripts)):
+        return ACTIONS.run_batch(scripts)
 
 
 def _as_escape(s: str) -> str:
@@ -147,7 +317,7 @@ def mac_open_url(url: str) -> bool:
         subprocess.run(["open", url], check=True)
         return True
     except Exception as e:
-        print("open url error:", e)
+        LOG.error("open url error", error=e)
         return False
 
 
@@ -176,6 +346,11 @@ def mac_open_app(app_name: str) -> bool:
     return run_osascript(script)
 
 
+def mac_quit_app(app_name: str) -> bool:
+    script = f'tell application "{app_name}" to quit'
+    return run_osascript(script)
+
+
 def mac_type_text(text: str) -> bool:
     # Types into the currently focused app.
     # Requires Accessibility permission.
@@ -214,7 +389,7 @@ def mac_search_web(query: str) -> bool:
         subprocess.run(["open", url], check=True)
         return True
     except Exception as e:
-        print("open url error:", e)
+        LOG.error("open url error", error=e)
         return False
 
 
@@ -224,20 +399,24 @@ def mac_screenshot() -> bool:
         subprocess.run(["screencapture", "-x", "~/Desktop/Screens Trash"], check=False)
         return True
     except Exception as e:
-        print("screencapture error:", e)
+        LOG.error("screencapture error", error=e)
         return False
 
 
-def chrome_execute_js(js: str) -> str:
+def chrome_js_script(js: str) -> str:
+    """AppleScript that runs `js` in Chrome's active tab and returns its result."""
     js_escaped = js.replace("\\", "\\\\").replace('"', '\\"')
-    script = f"""
+    return f"""
     tell application "Google Chrome"
         if (count of windows) = 0 then return "NO_WINDOW"
         set t to active tab of front window
         return execute t javascript "{js_escaped}"
     end tell
     """
-    return run_osascript_out(script)
+
+
+def chrome_execute_js(js: str) -> str:
+    return run_osascript_out(chrome_js_script(js))
 
 
 def chrome_activate() -> bool:
@@ -322,9 +501,7 @@ def normalize_text(s: str) -> str:
 
 
 def tokens(s: str):
-    s = s.replace(",", " ").replace(".", " ").replace("!", " ").replace("?", " ")
-    s = s.replace(":", " ").replace(";", " ").replace("-", " ")
-    return [t for t in s.split() if t]
+    return keywords.tokenize(s)
 
 
 def contains_any_token(text: str, vocab: set) -> bool:
@@ -333,126 +510,229 @@ def contains_any_token(text: str, vocab: set) -> bool:
 
 
 def detect_wake(text: str) -> bool:
-    t = normalize_text(text)
-    return contains_any_token(t, WAKE_WORDS_EN) or contains_any_token(t, WAKE_WORDS_RU)
+    return any("wake" in kinds for _, kinds in vocab_scan(normalize_text(text)).tokens)
 
 
 def detect_sleep(text: str) -> bool:
-    t = normalize_text(text)
-    return contains_any_token(t, SLEEP_WORDS_EN) or contains_any_token(
-        t, SLEEP_WORDS_RU
-    )
+    return any("sleep" in kinds for _, kinds in vocab_scan(normalize_text(text)).tokens)
 
 
 def strip_leading_wake(text: str) -> str:
-    tks = tokens(text)
-    if not tks:
-        return ""
-    wake_vocab = WAKE_WORDS_EN.union(WAKE_WORDS_RU)
+    tks = vocab_scan(normalize_text(text)).tokens
     i = 0
-    while i < len(tks) and tks[i] in wake_vocab:
+    while i < len(tks) and "wake" in tks[i][1]:
         i += 1
-    return " ".join(tks[i:]).strip()
+    return " ".join(t for t, _ in tks[i:]).strip()
 
 
-def reset_recognizer():
-    global rec, current_lang
-    if current_lang == "ru":
-        rec = KaldiRecognizer(model_ru, SAMPLE_RATE)
-    else:
-        rec = KaldiRecognizer(model_en, SAMPLE_RATE)
+def lang_switch_target(text: str) -> str | None:
+    """'en' / 'ru' if the whole utterance asks to switch language."""
+    whole = vocab_scan(normalize_text(text)).whole
+    if "lang_en" in whole:
+        return "en"
+    if "lang_ru" in whole:
+        return "ru"
+    return None
+
+
+def load_models():
+    global model_ru, model_en
+    LOG.info("loading RU model")
+    model_ru = Model(MODEL_RU)
+    LOG.info("loading EN model")
+    model_en = Model(MODEL_EN)
+
+
+def reset_recognizer(conn: socket.socket):
+    """Fresh recognizers for `conn`, in its conversation's language."""
+    lang = CONVERSATIONS[conn].lang
+    model = model_ru if lang == "ru" else model_en
+    RECOGNIZERS[conn] = (
+        KaldiRecognizer(model, SAMPLE_RATE),
+        make_command_recognizer(model, lang) if COMMAND_GRAMMAR else None,
+    )
+
+
+def lang_of(conn: socket.socket) -> str:
+    """`conn`'s language (DEFAULT_LANG once it disconnected)."""
+    conv = CONVERSATIONS.get(conn)
+    return conv.lang if conv is not None else DEFAULT_LANG
+
+
+def use_language(conn: socket.socket, lang: str):
+    conv = CONVERSATIONS[conn]
+    conv.lang = LAST_LANG[conv.device] = lang
+    reset_recognizer(conn)
 
 
 def send_line(conn: socket.socket, s: str):
     try:
-        conn.sendall((s + "\n").encode("utf-8"))
+        with tracing.span("send line", "io", line=s[:40]):
+            conn.sendall((s + "\n").encode("utf-8"))
     except OSError:
         pass
 
 
-def handle_lang_markers(conn: socket.socket, data: bytes):
-    global current_lang, rec
+def read_hello(conn: socket.socket) -> tuple[dict, bytes]:
+    """
+    Reads the HELLO line the firmware sends right after connecting.
+    Returns (device info, bytes received after the line).
+    If the stream does not start with HELLO, everything is returned as audio.
+    """
+    data = b""
+    while b"\n" not in data and len(data) < 256:
+        chunk = conn.recv(1024)
+        if not chunk:
+            break
+        data += chunk
+        if not data.startswith(b"HELLO"[: len(data)]):
+            break
+
+    if not data.startswith(b"HELLO") or b"\n" not in data:
+        return protocol.parse_hello(""), data
 
+    line, _, rest = data.partition(b"\n")
+    return protocol.parse_hello(line.decode("utf-8", errors="ignore")), rest
+
+
+def handle_lang_markers(conn: socket.socket, data: bytes):
     if b"__lang_ru__" in data:
         data = data.replace(b"__lang_ru__", b"")
-        current_lang = "ru"
-        rec = KaldiRecognizer(model_ru, SAMPLE_RATE)
-        print("LANG -> RU")
+        use_language(conn, "ru")
+        LOG.info("LANG -> RU")
         send_line(conn, "LANG_RU_OK")
 
     if b"__lang_en__" in data:
         data = data.replace(b"__lang_en__", b"")
-        current_lang = "en"
-        rec = KaldiRecognizer(model_en, SAMPLE_RATE)
-        print("LANG -> EN")
+        use_language(conn, "en")
+        LOG.info("LANG -> EN")
         send_line(conn, "LANG_EN_OK")
 
     return data
 
 
 def set_awake(conn: socket.socket, awake: bool):
-    global is_awake, conversation_history, skip_next_final_after_wake
-
-    is_awake = awake
-    conversation_history = []
+    conv = CONVERSATIONS[conn]
+    conv.awake = awake
+    conv.history = []
 
-    if is_awake:
-        print("STATE -> AWAKE")
+    if awake:
+        LOG.info("STATE -> AWAKE")
         send_line(conn, "__awake__")
         send_line(conn, "__listening_off__")
-        skip_next_final_after_wake = True
-        reset_recognizer()
+        conv.skip_next_final_after_wake = True
+        reset_recognizer(conn)
     else:
-        print("STATE -> SLEEPING")
+        COMMANDS.cancel(conn, "sleep")
+        LOG.info("STATE -> SLEEPING")
         send_line(conn, "__sleeping__")
         send_line(conn, "__listening_off__")
-        skip_next_final_after_wake = False
-        reset_recognizer()
+        conv.skip_next_final_after_wake = False
+        reset_recognizer(conn)
 
 
-def generate_reply(text: str) -> str:
-    text = text.strip()
-    if not text:
-        return ""
+SYSTEM_PROMPT = (
+    "You are a real-time voice assistant. "
+    "Use the same language as the user. "
+    "If unsure about facts, clearly say you don't know. "
+    "Do not invent people, games or places if you are not sure. "
+    "Short, clear sentences. Year is 2026. No markdown, no lists."
+    "Answer in one short sentence. Max 10 words"
+)
 
-    conversation_history.append({"role": "user", "content": text})
-    recent = conversation_history[-HISTORY_LIMIT:]
 
-    system_prompt = (
-        "You are a real-time voice assistant. "
-        "Use the same language as the user. "
-        "If unsure about facts, clearly say you don't know. "
-        "Do not invent people, games or places if you are not sure. "
-        "Short, clear sentences. Year is 2026. No markdown, no lists."
-        "Answer in one short sentence. Max 10 words"
-    )
+def request_reply(text: str, history: list, turn=None) -> str:
+    """
+    One LLM round trip for `text` on top of `history`. Does not change history.
+    Streamed, so `turn` (turns.Turn) can record the first token.
+    """
+    recent = (history + [{"role": "user", "content": text}])[-HISTORY_LIMIT:]
+    if OFFLINE:
+        return f"(offline) {text}"
+
+    key = json.dumps([SYSTEM_PROMPT, recent], ensure_ascii=False)
+    if REPLY_CACHE_TTL_S:
+        cached = REPLY_CACHE.get(key)
+        if cached is not None:
+            LOG.debug("reply cache hit", text=text)
+            if turn is not None:
+                turn.mark("llm_first")
+                turn.mark("llm_done")
+            return cached.decode("utf-8")
 
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": system_prompt}, *recent],
-            temperature=0.1,
-            max_tokens=30,
-        )
-        reply = completion.choices[0].message.content.strip()
-        return reply.replace("\n", " ")
+        with tracing.span("openai chat", "openai", model="gpt-4o-mini"):
+            stream = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "system", "content": SYSTEM_PROMPT}, *recent],
+                temperature=0.1,
+                max_tokens=30,
+                stream=True,
+            )
+            parts = []
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if not parts:
+                        tracing.instant("llm first token", "openai")
+                        if turn is not None:
+                            turn.mark("llm_first")
+                    parts.append(delta)
+        if turn is not None:
+            turn.mark("llm_done")
+        reply = "".join(parts).strip().replace("\n", " ")
     except Exception as e:
-        print("LLM error:", e)
+        LOG.error("LLM error", error=e)
         return "Кешір, жауап генерациясында қате болды."
+    if REPLY_CACHE_TTL_S and reply:
+        try:
+            REPLY_CACHE.put(key, reply.encode("utf-8"))
+        except OSError as e:
+            LOG.warning("reply cache write failed", error=e)
+    return reply
+
+
+def generate_reply(conv: Conversation, text: str, turn=None) -> str:
+    text = text.strip()
+    if not text:
+        return ""
 
+    reply = request_reply(text, conv.history, turn)
+    conv.history.append({"role": "user", "content": text})
+    return reply
 
-# ===== TTS CACHE =====
-TTS_CACHE_DIR = "tts_cache"
-import hashlib
-import os
 
-if not os.path.exists(TTS_CACHE_DIR):
-    os.makedirs(TTS_CACHE_DIR)
+def speculative_reply(conv: Conversation, text: str):
+    """
+    Runs on SPECULATION_EXECUTOR. Returns (reply, history length it was
+    based on) so a reply built on stale history is not committed.
+    """
+    history = list(conv.history)
+    reply = request_reply(text, history)
+    if SPECULATE_TTS and reply:
+        for _ in tts_bytes_stream(reply):  # fills the TTS cache
+            pass
+    return reply, len(history)
+
+
+# ===== TTS AND REPLY CACHES =====
+# On disk and shared by every worker process (see disk_cache.py). Nothing
+# from another endpoint (mock_openai.py) lands in the real caches.
+# The reply cache is off by default. A reply is keyed by the whole request
+# (system prompt, history since the wake word, question), so it only saves a
+# call when the same conversation repeats; but then the answer is frozen for
+# REPLY_CACHE_TTL_S, even to "what's the news" or "tell me a joke".
+_ENDPOINT = ""
+if OPENAI_BASE_URL:
+    _ENDPOINT = "_" + re.sub(r"\W+", "_", urllib.parse.urlsplit(OPENAI_BASE_URL).netloc)
+TTS_CACHE_DIR = "tts_cache" + _ENDPOINT
+TTS_CACHE = disk_cache.DiskCache(TTS_CACHE_DIR, ".pcm")
+REPLY_CACHE_TTL_S = 0  # e.g. 6 * 3600
+REPLY_CACHE = disk_cache.DiskCache("reply_cache" + _ENDPOINT, ".txt", REPLY_CACHE_TTL_S)
 
 
 def get_tts_cache_path(text: str) -> str:
-    h = hashlib.md5(text.encode("utf-8")).hexdigest()
-    return os.path.join(TTS_CACHE_DIR, f"{h}.pcm")
+    return TTS_CACHE.path(text)
 
 
 def tts_bytes_stream(text: str):
@@ -464,10 +744,12 @@ def tts_bytes_stream(text: str):
     if not text:
         return
 
-    cache_path = get_tts_cache_path(text)
-    if os.path.exists(cache_path):
-        print(f"TTS CACHE HIT: {text}")
-        with open(cache_path, "rb") as f:
+    with tracing.span("tts cache lookup", "cache") as sp:
+        cached = TTS_CACHE.open(text)
+        sp.set(hit=cached is not None)
+    if cached is not None:
+        LOG.debug("TTS cache hit", text=text)
+        with cached as f:
             while True:
                 chunk = f.read(4096)
                 if not chunk:
@@ -475,98 +757,75 @@ def tts_bytes_stream(text: str):
                 yield chunk
         return
 
-    print(f"TTS CACHE MISS: {text}")
+    LOG.info("TTS cache miss", text=text)
+    if OFFLINE:
+        return
     try:
         # We'll save the full audio to cache while streaming
         full_audio = bytearray()
         
-        with client.audio.speech.with_streaming_response.create(
-            model="gpt-4o-mini-tts",
-            voice="onyx",
-            input=text,
-            response_format="pcm",
-        ) as response:
+        with contextlib.ExitStack() as stack:
+            # entering returns once the response headers are in
+            with tracing.span("openai tts request", "openai", chars=len(text)):
+                response = stack.enter_context(
+                    client.audio.speech.with_streaming_response.create(
+                        model="gpt-4o-mini-tts",
+                        voice="onyx",
+                        input=text,
+                        response_format="pcm",
+                    )
+                )
             for chunk in response.iter_bytes(chunk_size=4096):
                 full_audio.extend(chunk)
                 yield chunk
         
         # Save to cache after successful stream
-        with open(cache_path, "wb") as f:
-            f.write(full_audio)
+        TTS_CACHE.put(text, bytes(full_audio))
             
     except Exception as e:
-        print("TTS STREAM ERROR:", e)
+        LOG.error("TTS stream error", error=e)
 
 
-def speak(conn, text):
+def speak(conn, text, turn=None):
+    """Queues `text` for speak_worker. turn: the turn it answers (default: conn's latest)."""
     text = (text or "").strip()
     if not text:
         return
+    q = SPEAK_QUEUES.get(conn)
+    if q is None:
+        return  # disconnected
+    if turn is None:
+        turn = TURNS.current(conn)
     # drop backlog: keep only latest
-    try:
-        while True:
-            SPEAK_QUEUE.get_nowait()
-            SPEAK_QUEUE.task_done()
-    except queue.Empty:
-        pass
+    _drain_speech(q)
 
+    trace = tracing.capture()
     try:
-        SPEAK_QUEUE.put_nowait((conn, text))
+        q.put_nowait((conn, text, turn, trace))
     except queue.Full:
-        pass
+        tracing.release(trace)
 
 
-def wait_js(predicate_js: str, timeout: float = 2.0, step: float = 0.1) -> bool:
-    deadline = time.time() + timeout
-    while time.time() < deadline:
-        res = chrome_execute_js(predicate_js)
-        if (res or "").strip() in ("1", "true", "TRUE", "OK"):
-            return True
-        time.sleep(step)
-    return False
-
+def _drain_speech(q: queue.Queue):
+    try:
+        while True:
+            dropped = q.get_nowait()
+            if dropped is not None:
+                tracing.release(dropped[3])
+            q.task_done()
+    except queue.Empty:
+        pass
 
-def get_weather_wttr(location: str, lang: str) -> str:
-    location = (location or "").strip()
-    if not location:
-        location = "Astana"
 
-    loc = urllib.parse.quote(location)
-    url = f"https://wttr.in/{loc}?format=3"
+def wait_js(predicate_js: str, timeout: float = 2.0, step: float = 0.05, name: str = "js") -> bool:
+    def ready():
+        return (chrome_execute_js(predicate_js) or "").strip() in ("1", "true", "TRUE", "OK")
 
-    try:
-        with urllib.request.urlopen(url, timeout=5) as resp:
-            text = resp.read().decode("utf-8", errors="ignore").strip()
-
-            if not text:
-                return "Пустой ответ от сервиса погоды."
-
-            # ---- локализация ----
-            if lang == "ru":
-                text = (
-                    text.replace("Feels like", "Ощущается как")
-                    .replace("Clear", "Ясно")
-                    .replace("Sunny", "Солнечно")
-                    .replace("Partly cloudy", "Переменная облачность")
-                    .replace("Cloudy", "Облачно")
-                    .replace("Overcast", "Пасмурно")
-                    .replace("Rain", "Дождь")
-                    .replace("Snow", "Снег")
-                    .replace("Mist", "Туман")
-                    .replace("Wind", "Ветер")
-                )
-                return f"Погода: {text}"
+    return readiness.wait_until(ready, timeout, name, first_delay_s=step).ok
 
-            # EN
-            return f"Weather: {text}"
 
-    except Exception as e:
-        print("WEATHER ERROR:", e)
-        return (
-            "Не удалось получить погоду."
-            if lang == "ru"
-            else "I couldn't fetch the weather right now."
-        )
+def get_weather_wttr(location: str, lang: str) -> str:
+    return WEATHER.reply(location, lang)
 
 
 # ===== LANG SWITCH =======================================================
@@ -611,75 +870,194 @@ LANG_EN_WORDS_RU = {
 }
 
 
-def set_language(conn: socket.socket | None, lang: str) -> bool:
+# ===== FUZZY VOCABULARY =====
+# Wake and sleep words, language phrases and app names also match when Vosk
+# mishears them a little ("джервис", "телеграм", "дескорд"); see
+# fuzzy.PhoneticIndex. Exact phrases are found in one pass by keywords.Spotter.
+# Minimum score per vocabulary, 1.0 = exact only.
+VOCAB_MIN_SCORE = {
+    "wake": 0.85,
+    "sleep": 0.85,
+    "lang_en": 0.9,  # a whole utterance switches the language
+    "lang_ru": 0.9,
+    "app": 0.8,  # APP_ALIASES names
+    "app_ru": 0.8,  # RU_APP_ALIASES names
+}
+
+VOCAB = fuzzy.PhoneticIndex()
+SPOTTER = keywords.Spotter()
+
+
+def _add_vocab(phrase: str, kind: str, value=None):
+    VOCAB.add(phrase, kind, value)
+    SPOTTER.add(phrase, kind, value)
+
+
+for _w in WAKE_WORDS_EN | WAKE_WORDS_RU:
+    _add_vocab(_w, "wake")
+for _w in SLEEP_WORDS_EN | SLEEP_WORDS_RU:
+    _add_vocab(_w, "sleep")
+for _w in LANG_EN_WORDS | LANG_EN_WORDS_RU:
+    _add_vocab(_w, "lang_en")
+for _w in LANG_RU_WORDS:
+    _add_vocab(_w, "lang_ru")
+for _w in APP_ALIASES:
+    _add_vocab(_w, "app", _w)
+for _w, _key in RU_APP_ALIASES.items():
+    _add_vocab(_w, "app_ru", _key)
+
+
+class VocabScan(NamedTuple):
+    tokens: tuple  # (token, {kind: VocabHit}) for every word
+    whole: dict  # kind -> VocabHit for the utterance as a whole
+    spots: tuple  # keywords.Spot for every exact phrase, with token positions
+
+
+@functools.lru_cache(maxsize=4096)
+def vocab_kinds(phrase: str) -> dict:
+    """Fuzzy vocabulary hits for one word or phrase, best per kind."""
+    out = {}
+    for hit in VOCAB.lookup(phrase):  # best first
+        if hit.kind not in out and hit.score >= VOCAB_MIN_SCORE[hit.kind]:
+            out[hit.kind] = hit
+    return out
+
+
+@functools.lru_cache(maxsize=512)
+def vocab_scan(norm: str) -> VocabScan:
+    """
+    Every vocabulary lookup for one utterance, done once: detect_wake,
+    detect_sleep, strip_leading_wake, lang_switch_target and _resolve_app all
+    read from the cached result.
+
+    The text is tokenized once and SPOTTER finds every exact phrase in a
+    single pass; only words it did not recognize go to the fuzzy index, and
+    those results are cached per word, since each new partial repeats the
+    words of the previous one.
+    """
+    tks = tokens(norm)
+    spots = tuple(SPOTTER.scan(tks))
+    exact = [{} for _ in tks]
+    whole = {}
+    for s in spots:
+        hit = fuzzy.VocabHit(1.0, s.kind, s.value, s.phrase)
+        if s.end - s.start == 1:
+            exact[s.start].setdefault(s.kind, hit)
+        if s.start == 0 and s.end == len(tks):
+            whole.setdefault(s.kind, hit)
+    # a mis-hearing may split a word in two, hence the + 1
+    if not whole and len(tks) <= SPOTTER.longest + 1:
+        whole = vocab_kinds(" ".join(tks))
+    per_token = tuple((t, exact[i] or vocab_kinds(t)) for i, t in enumerate(tks))
+    return VocabScan(per_token, whole, spots)
+
+
+def set_language(conn: socket.socket, lang: str) -> bool:
     """
     lang: 'ru' or 'en'
-    Updates recognizer immediately.
-    Optionally notifies client (OLED) with a short marker line.
+    Updates conn's recognizer immediately and tells the client (OLED)
+    with a short marker line.
     """
-    global current_lang, rec
-
     lang = (lang or "").strip().lower()
     if lang not in ("ru", "en"):
         return False
 
-    if current_lang == lang:
+    if lang_of(conn) == lang:
         return True
 
-    current_lang = lang
-    rec = KaldiRecognizer(model_ru if lang == "ru" else model_en, SAMPLE_RATE)
+    use_language(conn, lang)
 
-    print(f"LANG -> {current_lang.upper()}")
+    LOG.info(f"LANG -> {lang.upper()}")
 
-    # Optional: tell ESP32 (OLED) about language change
-    if conn is not None:
-        send_line(conn, "LANG_RU_OK" if lang == "ru" else "LANG_EN_OK")
+    # tell ESP32 (OLED) about language change
+    send_line(conn, "LANG_RU_OK" if lang == "ru" else "LANG_EN_OK")
 
     return True
 
 
-def speak_worker():
+def send_audio_chunk(conn: socket.socket, payload: bytes) -> bool:
+    try:
+        with tracing.span("send audio", "io", bytes=len(payload)):
+            conn.sendall(f"__audio_len__ {len(payload)}\n".encode("utf-8"))
+            conn.sendall(payload)
+        return True
+    except OSError:
+        return False
+
+
+def speak_worker(q: queue.Queue):
+    """Speaks one connection's queue in order; a None item stops it."""
     while True:
-        conn, text = SPEAK_QUEUE.get()
+        item = q.get()
+        if item is None:
+            q.task_done()
+            return
+        conn, text, turn, trace = item
+        profiling.tick()
         try:
-            if conn is None:
-                continue
-
-            # We use a generator to get chunks as they arrive
-            # But we only send the text to OLED when we have the FIRST chunk ready
-            # to ensure perfect synchronization.
-            
-            first_chunk = True
-            
-            for chunk in tts_bytes_stream(text):
-                if first_chunk:
-                    # Sync: OLED text sent exactly when audio starts
-                    try:
-                        conn.sendall((text + "\n").encode("utf-8"))
-                        send_line(conn, "__speaking_on__")
-                    except OSError:
-                        pass
-                    first_chunk = False
-                
-                # Send chunk header + chunk
-                header = f"__audio_len__ {len(chunk)}\n"
-                try:
-                    conn.sendall(header.encode("utf-8"))
-                    conn.sendall(chunk)
-                except OSError:
-                    break
-            
-            if not first_chunk:
-                send_line(conn, "__speaking_off__")
-            else:
-                # If no audio was generated (e.g. error), still show text
-                try:
-                    conn.sendall((text + "\n").encode("utf-8"))
-                except OSError:
-                    pass
-                    
+            with tracing.bind(trace), tracing.span("speak", "tts", text=text[:60]):
+                speak_now(conn, text, turn)
         finally:
-            SPEAK_QUEUE.task_done()
+            q.task_done()
+
+
+def speak_now(conn, text: str, turn=None):
+    """TTS for `text`, streamed to the device (runs on speak_worker)."""
+    # Fresh encoder per utterance; the device resets its decoder on
+    # __speaking_on__. Cached and fresh TTS go through the same path.
+    codec = DEVICE_INFO.get(conn, {}).get("tts_codec", "PCM16")
+    encoder = audio_codec.make_encoder(codec)
+
+    # We use a generator to get chunks as they arrive
+    # But we only send the text to OLED when we have the FIRST chunk ready
+    # to ensure perfect synchronization.
+    
+    first_chunk = True
+    audio_started = None  # when the first audio byte went out
+    pcm_bytes = 0
+    
+    chunks = tts_bytes_stream(text)
+    while True:
+        with tracing.span("tts chunk wait", "tts"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        if first_chunk:
+            if turn is not None:
+                turn.mark("tts_first")
+            # Sync: OLED text sent exactly when audio starts
+            try:
+                conn.sendall((text + "\n").encode("utf-8"))
+                send_line(conn, "__speaking_on__")
+            except OSError:
+                pass
+            first_chunk = False
+        
+        # Send chunk header + chunk
+        pcm_bytes += len(chunk)
+        payload = encoder.encode(chunk)
+        if payload and not send_audio_chunk(conn, payload):
+            break
+        if payload and audio_started is None:
+            audio_started = time.monotonic()
+            if turn is not None:
+                turn.mark("audio_first", audio_started)
+    
+    if not first_chunk:
+        tail = encoder.flush()
+        if tail:
+            send_audio_chunk(conn, tail)
+        send_line(conn, "__speaking_off__")
+        if turn is not None and audio_started is not None:
+            # the device plays in real time; it is done when the audio runs out
+            duration_s = pcm_bytes / (TTS_PCM_RATE * TTS_PCM_BYTES)
+            turn.mark("playback_end", max(time.monotonic(), audio_started + duration_s))
+    else:
+        # If no audio was generated (e.g. error), still show text
+        try:
+            conn.sendall((text + "\n").encode("utf-8"))
+        except OSError:
+            pass
 
 
 # ====================================================================================================
@@ -700,7 +1078,7 @@ def youtube_toggle_play_pause() -> bool:
 })();
 """
     res = chrome_execute_js(js)
-    print("YT TOGGLE:", res)
+    LOG.debug("YT toggle", result=res)
     return any(x in (res or "") for x in ("PLAY", "PAUSE"))
 
 
@@ -713,7 +1091,18 @@ def mac_music_play_playlist(playlist_name: str, shuffle: bool = True) -> bool:
     if not name:
         return False
 
-    safe = _as_escape(name)
+    # spoken name -> exact playlist from the local index; the old by-name
+    # query is only used until the index has loaded
+    if PLAYLISTS.loaded:
+        found = PLAYLISTS.resolve(name)
+        if found is None:
+            LOG.info("playlist: nothing close", name=repr(name))
+            return False
+        LOG.info("playlist resolved", heard=repr(name), playlist=repr(found.name))
+        which = f'first playlist whose persistent ID is "{_as_escape(found.pid)}"'
+    else:
+        which = f'first playlist whose name is "{_as_escape(name)}"'
+
     script = f"""
     tell application "Music"
         activate
@@ -721,7 +1110,7 @@ def mac_music_play_playlist(playlist_name: str, shuffle: bool = True) -> bool:
         set shuffling to {"true" if shuffle else "false"}
         set shuffle enabled to shuffling
         try
-            set pl to first playlist whose name is "{safe}"
+            set pl to {which}
             play pl
             return "OK"
         on error errMsg number errNum
@@ -732,7 +1121,7 @@ def mac_music_play_playlist(playlist_name: str, shuffle: bool = True) -> bool:
 
     out = run_osascript_out(script)
     if out.startswith("ERR"):
-        print("MUSIC PLAYLIST ERR:", out)
+        LOG.warning("playlist error", out=out)
         return False
 
     if out == "OK":
@@ -743,29 +1132,12 @@ def mac_music_play_playlist(playlist_name: str, shuffle: bool = True) -> bool:
 
 
 def mac_music_list_playlists(filter_text: str = "") -> str:
-    ft = (filter_text or "").strip()
-    safe = _as_escape(ft)
-
-    script = f"""
-    tell application "Music"
-        set outText to ""
-        try
-            if "{safe}" is "" then
-                set pls to playlists
-            else
-                set pls to (every playlist whose name contains "{safe}")
-            end if
-
-            repeat with p in pls
-                set outText to outText & (name of p) & "\\n"
-            end repeat
-            return outText
-        on error errMsg number errNum
-            return "ERR " & errNum & " " & errMsg
-        end try
-    end tell
-    """
-    return run_osascript_out(script)
+    if not PLAYLISTS.loaded:
+        try:
+            PLAYLISTS.refresh()
+        except Exception as e:
+            return f"ERR {e}"
+    return "".join(name + "\n" for name in PLAYLISTS.names(filter_text))
 
 
 # ====================================================================================================
@@ -796,27 +1168,27 @@ def play_from_youtube_video(query: str) -> bool:
 })();
 """
 
-    # Wait for page to load and first render to appear
-    res = "NO_VIDEO_RENDERER"
-    deadline = time.time() + 8.0
-    while time.time() < deadline:
+    # Wait for page to load and first render to appear, click it right away
+    def click_first():
         res = chrome_execute_js(js_click_first)
-        print("YT CLICK ATTEMPT:", res)
-        if "CLICKED_FIRST" in (res or ""):
-            break
-        time.sleep(0.5)
+        return "CLICKED_FIRST" in (res or "")
 
-    if "CLICKED_FIRST" not in (res or ""):
+    if not readiness.wait_until(click_first, 8.0, "yt results").ok:
+        LOG.info("YT click: no video renderer")
         return False
 
-    time.sleep(1.5) # small buffer for the video page to start loading
+    # Wait until the click has opened the video and start it: each poll asks
+    # for the tab's URL and runs the play script in one round trip
+    def watching():
+        u, playing = yt_watch_state()
+        return u if (playing or "music.youtube.com" in u) else ""
+
+    u = readiness.wait_until(watching, 7.0, "yt play").value or ""
 
     # Check if no errors with re-directing to youtube.music
-    u = chrome_active_url()
     if "music.youtube.com" in u:
-        print("Redirected to YTM, trying fallback video...")
+        LOG.info("redirected to YouTube Music, trying the next video")
         chrome_execute_js("history.back(); 'BACK';")
-        time.sleep(1.0)
 
         js_click_second = r"""
 (() => {
@@ -830,11 +1202,15 @@ def play_from_youtube_video(query: str) -> bool:
   return "CLICKED_SECOND";
 })();
 """
-        res2 = chrome_execute_js(js_click_second)
-        print("YT FALLBACK CLICK:", res2)
-        time.sleep(2.0)
+        # the results page has to come back before the second video can be clicked
+        def click_second():
+            return "CLICKED_SECOND" in (chrome_execute_js(js_click_second) or "")
+
+        u = ""
+        if readiness.wait_until(click_second, 3.0, "yt fallback").ok:
+            u = readiness.wait_until(watching, 7.0, "yt play").value or ""
 
-    ok = yt_force_play()
+    ok = "/watch" in u
     if ok:
         global ACTIVE_PLAYER
         ACTIVE_PLAYER = "youtube"
@@ -861,28 +1237,36 @@ def chrome_open_url(url: str, new_tab: bool = True) -> bool:
     return run_osascript(script)
 
 
-def chrome_active_url() -> str:
-    script = r"""
+CHROME_ACTIVE_URL_SCRIPT = r"""
     tell application "Google Chrome"
         if (count of windows) = 0 then return ""
         return URL of active tab of front window
     end tell
     """
-    return (run_osascript_out(script) or "").strip()
 
 
-def yt_force_play() -> bool:
-    js = r"""
+def chrome_active_url() -> str:
+    return (run_osascript_out(CHROME_ACTIVE_URL_SCRIPT) or "").strip()
+
+
+# starts the video, on a watch page only (the results page has preview players)
+YT_PLAY_ON_WATCH_JS = r"""
 (() => {
+  if (!location.pathname.startsWith('/watch')) return "NOT_WATCH";
   const v = document.querySelector('video');
   if (!v) return "NO_VIDEO";
   if (v.paused) { v.play(); return "PLAY"; }
   return "ALREADY_PLAYING";
 })();
 """
-    res = chrome_execute_js(js)
-    print("YT FORCE PLAY:", res)
-    return "PLAY" in (res or "") or "ALREADY_PLAYING" in (res or "")
+
+
+def yt_watch_state() -> tuple[str, bool]:
+    """(active tab URL, whether it is a watch page now playing), in one round trip."""
+    url, play = run_osascript_batch([CHROME_ACTIVE_URL_SCRIPT, chrome_js_script(YT_PLAY_ON_WATCH_JS)])
+    res = play.out or ""
+    LOG.debug("YT watch state", url=url.out, result=res)
+    return (url.out or "").strip(), play.ok and res in ("PLAY", "ALREADY_PLAYING")
 
 
 # ====================================================================================================
@@ -890,349 +1274,674 @@ def yt_force_play() -> bool:
 # ====================================================================================================
 
 
+# Every command is one registration on ROUTER (see command_router.py).
+# Handlers get the Match and the connection and return the reply to speak.
+# Actions are wrapped in lambdas so they are looked up at call time.
+
+
+def _simple(action, ok: str, fail: str):
+    # commands that are a single action returning bool
+    return lambda m, conn: ok if action() else fail
+
+
+def _resolve_app(target: str, ru_aliases: bool) -> str | None:
+    if ru_aliases:
+        target = RU_APP_ALIASES.get(target, target)
+    app = APP_ALIASES.get(target)
+    if app is not None or not target:
+        return app
+
+    # not an exact alias: the closest one, if close enough
+    whole = vocab_scan(target).whole
+    hit = whole.get("app") or (whole.get("app_ru") if ru_aliases else None)
+    return APP_ALIASES[hit.value] if hit is not None else None
+
+
+def _app_command(action, ok: str, fail: str, missing: str, ru_aliases: bool = False):
+    def run(m, conn):
+        app_key = _resolve_app(m.arg, ru_aliases)
+        if not app_key:
+            return missing
+        return ok if action(app_key) else fail
+
+    return run
+
+
+def _weather_command(ack: str):
+    def run(m, conn):
+        speak(conn, ack)  # Early feedback
+        return get_weather_wttr(m.raw_arg, lang_of(conn))
+
+    return run
+
+
+def _playlist_command(ack: str, ok: str, fail: str):
+    def run(m, conn):
+        speak(conn, ack)  # Early feedback
+        return ok if mac_music_play_playlist(m.raw_arg, shuffle=True) else fail
+
+    return run
+
+
+def _youtube_command(ack: str, ok: str, fail: str):
+    def run(m, conn):
+        speak(conn, ack)  # Early feedback
+        return ok if play_from_youtube_video(m.raw_arg) else fail
+
+    return run
+
+
+def _search_command(ack: str, ok: str, fail: str):
+    def run(m, conn):
+        speak(conn, ack)  # Early feedback
+        return ok if mac_search_web(m.raw_arg) else fail
+
+    return run
+
+
+def _type_command(ok: str, fail: str):
+    return lambda m, conn: ok if mac_type_text(m.raw_arg) else fail
+
+
+def _key_command(aliases: dict, ok: str, fail: str, missing: str):
+    def run(m, conn):
+        key_name = aliases.get(m.arg)
+        if not key_name:
+            return missing
+        return ok if mac_press_key(key_name) else fail
+
+    return run
+
+
+ROUTER = command_router.CommandRouter()
+
+# ---- EN commands ----
+ROUTER.prefix(["weather"], _weather_command("Checking weather."), tag="weather", optional_arg=True)
+ROUTER.prefix(
+    ["open playlist"],
+    _playlist_command("Opening playlist.", "Done.", "No results in Apple Music."),
+    tag="playlist",
+)
+ROUTER.prefix(
+    ["open"],
+    _app_command(lambda app: mac_open_app(app), "Opened.", "I could not open it.", "That app is not in my allowed list."),
+    tag="app",
+    vocab=APP_ALIASES,
+)
+ROUTER.prefix(
+    ["switch to"],
+    _app_command(lambda app: mac_open_app(app), "Switched.", "I could not switch.", "That app is not in my allowed list."),
+    tag="app",
+    vocab=APP_ALIASES,
+)
+ROUTER.prefix(
+    ["search for"], _search_command("Searching.", "Done.", "I could not open the browser."), tag="search"
+)
+ROUTER.prefix(["turn on", "launch", "play"], _youtube_command("Okay.", "Done.", "Failed."), tag="youtube")
+ROUTER.prefix(
+    ["type"], _type_command("Typed.", "I could not type. Check Accessibility permissions.")
+)
+ROUTER.prefix(
+    ["press"],
+    _key_command(
+        KEY_ALIASES_EN,
+        "Done.",
+        "I could not press the key.",
+        "Allowed keys: enter, tab, escape, space, backspace.",
+    ),
+    vocab=KEY_ALIASES_EN,
+)
+ROUTER.exact(
+    ["volume up", "louder"],
+    _simple(lambda: mac_volume(delta=6), "Volume up.", "I could not change volume."),
+)
+ROUTER.exact(
+    ["volume down", "quieter"],
+    _simple(lambda: mac_volume(delta=-6), "Volume down.", "I could not change volume."),
+)
+ROUTER.exact(["mute"], _simple(lambda: mac_volume(mute=True), "Muted.", "I could not mute."))
+ROUTER.exact(
+    ["play", "pause", "post", "stop", "play/pause"],
+    _simple(lambda: mac_media("playpause"), "OK.", "I could not control media."),
+)
+ROUTER.exact(
+    ["close tab", "close the tab", "close this tab"],
+    _simple(lambda: chrome_close_tab(), "Closed tab.", "I could not close the tab."),
+)
+ROUTER.exact(
+    ["next track", "next"], _simple(lambda: mac_media("next"), "Next.", "I could not control media.")
+)
+ROUTER.exact(
+    ["previous track", "previous", "back"],
+    _simple(lambda: mac_media("previous"), "Previous.", "I could not control media."),
+)
+ROUTER.exact(
+    ["screenshot", "take screenshot"],
+    _simple(lambda: mac_screenshot(), "Screenshot saved.", "I could not take a screenshot."),
+)
+ROUTER.exact(["close chrome tab"], _simple(lambda: chrome_close_tab(), "ok", "failed"))
+ROUTER.exact(["close window", "close chrome window"], _simple(lambda: chrome_close_window(), "ok", "failed"))
+ROUTER.exact(
+    ["close chrome", "close google", "close google chrome"],
+    _simple(lambda: chrome_close_all_tabs(), "ok", "failed"),
+)
+ROUTER.prefix(
+    ["close"],
+    _app_command(lambda app: mac_quit_app(app), "closed", "failed to close.", "this app is not in list.", ru_aliases=True),
+    tag="app",
+    vocab=[*APP_ALIASES, *RU_APP_ALIASES],
+)
+ROUTER.prefix(
+    ["quit"],
+    _app_command(lambda app: mac_quit_app(app), "Quit.", "I could not quit it.", "That app is not in my allowed list."),
+    tag="app",
+    vocab=APP_ALIASES,
+)
+
+# ---- RU commands -----------------------------------------
+ROUTER.prefix(["погода"], _weather_command("Сейчас узнаю."), tag="weather", optional_arg=True)
+ROUTER.prefix(["включи"], _youtube_command("Хорошо.", "Готово.", "Не получилось."), tag="youtube")
+ROUTER.prefix(["поставь"], _youtube_command("Окей.", "Готово.", "Не получилось."), tag="youtube")
+ROUTER.prefix(
+    ["открой плейлист"],
+    _playlist_command("Включаю.", "Готово.", "Не нашёл плейлист в Apple Music."),
+    tag="playlist",
+)
+ROUTER.prefix(
+    ["открой"],
+    _app_command(lambda app: mac_open_app(app), "Открыл.", "Не получилось.", "Приложение не найдено.", ru_aliases=True),
+    tag="app",
+    vocab=[*RU_APP_ALIASES, *APP_ALIASES],
+)
+ROUTER.prefix(
+    ["переключись на"],
+    _app_command(
+        lambda app: mac_open_app(app), "Переключил.", "Не получилось.", "Этого приложения нет в списке.", ru_aliases=True
+    ),
+    tag="app",
+    vocab=[*RU_APP_ALIASES, *APP_ALIASES],
+)
+ROUTER.prefix(["поиск"], _search_command("Ищу.", "Готово.", "Не получилось."), tag="search")
+ROUTER.prefix(["напечатай"], _type_command("Напечатал.", "Не могу печатать."))
+ROUTER.prefix(
+    ["нажми"],
+    _key_command(KEY_ALIASES_RU, "Готово.", "Не получилось.", "Клавиша не поддерживается."),
+    vocab=KEY_ALIASES_RU,
+)
+ROUTER.exact(["громче", "погромче"], _simple(lambda: mac_volume(delta=6), "Громче.", "Не получилось."))
+ROUTER.exact(["тише", "потише"], _simple(lambda: mac_volume(delta=-40), "Тише.", "Не получилось."))
+ROUTER.exact(["без звука", "мут"], _simple(lambda: mac_volume(mute=True), "Без звука.", "Не получилось."))
+ROUTER.exact(
+    ["плей", "играй", "пауза", "плей пауза", "включи"],
+    _simple(lambda: mac_media("playpause"), "Ок", "Не получилось."),
+)
+ROUTER.exact(
+    ["следующий трек", "следующая", "дальше"],
+    _simple(lambda: mac_media("next"), "Следующий.", "Не получилось."),
+)
+ROUTER.exact(
+    ["предыдущий трек", "предыдущая", "назад"],
+    _simple(lambda: mac_media("previous"), "Предыдущий.", "Не получилось."),
+)
+ROUTER.exact(["скриншот", "сделай скриншот"], _simple(lambda: mac_screenshot(), "Скриншот сохранён.", "Не получилось."))
+ROUTER.exact(
+    ["закрой вкладку", "закрой эту вкладку", "закрой таб", "закрой вкладку в хроме", "закрой вкладку хром"],
+    _simple(lambda: chrome_close_tab(), "Закрыл.", "Не получилось."),
+)
+ROUTER.exact(
+    ["закрой окно", "закрой окно хром", "закрой окно в хроме"],
+    _simple(lambda: chrome_close_window(), "Закрыл.", "Не получилось."),
+)
+ROUTER.exact(
+    ["закрой хром", "закрой хром полностью", "закрой все вкладки", "выйди из хрома"],
+    _simple(lambda: chrome_close_all_tabs(), "Ок.", "Не получилось."),
+)
+ROUTER.prefix(
+    ["закрой"],
+    _app_command(lambda app: mac_quit_app(app), "Закрыл.", "Не получилось.", "Не получилось.", ru_aliases=True),
+    tag="app",
+    vocab=[*RU_APP_ALIASES, *APP_ALIASES],
+)
+
+
+# ===== INTENTS =====
+# Commands phrased differently from the table above ("could you open telegram",
+# "make it louder", "сделай погромче") are classified locally (intent.py)
+# against every complete command in ROUTER plus INTENT_EXAMPLES, and run as
+# that command instead of costing an LLM round trip.
+INTENTS_ENABLED = True
+INTENT_MIN_SCORE = 0.6  # cosine similarity to the closest example
+INTENT_MARGIN = 0.1  # ...and this much closer than any other command
+INTENT_MAX_WORDS = 6  # longer utterances are questions, not commands
+
+# politeness around a command; only stripped at the start and the end
+INTENT_FILLER = {
+    "could", "can", "would", "will", "you", "please", "pls", "kindly", "just", "now", "hey",
+    "ok", "okay", "for", "me", "пожалуйста", "можешь", "ты", "мне", "ну", "давай", "ка",
+    "плиз", "быстро", "сейчас", "будь", "добр",
+}
+# "don't close chrome" and "how do i open notes" are not commands
+INTENT_NEGATIONS = {"не", "нет", "don't", "dont", "not", "never", "никогда"}
+INTENT_QUESTIONS = {
+    "how", "why", "what", "when", "where", "who", "which", "is", "are", "does", "do", "did",
+    "what's", "whats", "how's", "hows", "who's", "whos", "where's", "wheres", "when's", "why's",
+    "как", "почему", "зачем", "что", "когда", "где", "кто", "какой", "сколько",
+}
+
+# words a paraphrase may add without them being an argument the command loses
+INTENT_NOT_ARGS = {"the", "a", "an", "go", "to", "up", "bit", "little", "over", "key", "today", "сегодня", "немного", "чуть"}
+
+# paraphrase -> command it means (must be a command ROUTER matches)
+INTENT_EXAMPLES = {
+    "turn it up": "volume up",
+    "turn the volume up": "volume up",
+    "make it louder": "volume up",
+    "turn it down": "volume down",
+    "turn the volume down": "volume down",
+    "make it quieter": "volume down",
+    "turn off the sound": "mute",
+    "skip this song": "next track",
+    "skip": "next track",
+    "next song": "next track",
+    "previous song": "previous track",
+    "take a screenshot": "screenshot",
+    "make a screenshot": "screenshot",
+    "what's the weather": "weather",
+    "what's the weather like": "weather",
+    "сделай громче": "громче",
+    "сделай музыку громче": "громче",
+    "прибавь звук": "громче",
+    "сделай тише": "тише",
+    "убавь звук": "тише",
+    "выключи звук": "без звука",
+    "следующая песня": "следующий трек",
+    "следующую песню": "следующий трек",
+    "переключи трек": "следующий трек",
+    "предыдущая песня": "предыдущий трек",
+    "предыдущую песню": "предыдущий трек",
+    "поставь на паузу": "пауза",
+    "сделай снимок экрана": "скриншот",
+    "какая погода": "погода",
+    "какая сейчас погода": "погода",
+}
+
+
+def _intent_label(command: str) -> str:
+    # phrases that run the same handler on the same argument are one intent
+    m = ROUTER.match(command)
+    key = (m.route.handler, m.arg)
+    return _INTENT_LABELS.setdefault(key, command)
+
+
+def _add_intent(phrase: str, command: str):
+    label = _intent_label(command)
+    INTENTS.add(phrase, label)
+    words = tokens(normalize_text(phrase))
+    _INTENT_WORDS.setdefault(label, set()).update(words)
+
+
+_INTENT_LABELS = {}
+_INTENT_WORDS = {}  # label -> every word of its examples
+INTENTS = intent.IntentClassifier()
+for _p in ROUTER.phrases():
+    _add_intent(_p, _p)
+for _p, _cmd in INTENT_EXAMPLES.items():
+    _add_intent(_p, _cmd)
+
+
+def _known_word(word: str, known: set) -> bool:
+    # "погромче" has "громче" in it, "песню" starts like "песня"
+    return any(word == k or (len(k) >= 4 and (k in word or word[:4] == k[:4])) for k in known)
+
+
+@functools.lru_cache(maxsize=512)
+def intent_command(norm: str) -> str:
+    """
+    The command a non-matching utterance most likely means, as text ROUTER
+    matches, or "" if it should go to the LLM.
+    """
+    if not INTENTS_ENABLED:
+        return ""
+    words = tokens(norm)
+    while words and words[0] in INTENT_FILLER:
+        words = words[1:]
+    while words and words[-1] in INTENT_FILLER:
+        words = words[:-1]
+    core = " ".join(words)
+    if not core:
+        return ""
+    if core in INTENT_EXAMPLES:
+        return INTENT_EXAMPLES[core]
+    if core != norm and _runnable(ROUTER.match(core)):
+        return core  # "could you turn on lofi beats" -> "turn on lofi beats"
+    if words[0] in INTENT_QUESTIONS or INTENT_NEGATIONS.intersection(words):
+        return ""
+    # filler inside the command only dilutes the match: "открой пожалуйста телеграм"
+    bare = [w for w in words if w not in INTENT_FILLER] or words
+    if len(bare) > INTENT_MAX_WORDS:
+        return ""
+    m = INTENTS.classify(" ".join(bare))
+    if m is None or m.score < INTENT_MIN_SCORE or m.margin < INTENT_MARGIN:
+        return ""
+    # the n-gram match barely sees the verb ("open the window" is close to
+    # "close chrome window"), so every word must be one this command's own
+    # examples use...
+    known = _INTENT_WORDS[m.label]
+    skip = INTENT_NOT_ARGS if len(bare) > 2 else ()  # "go back": "go" is half of it
+    unknown = [i for i, w in enumerate(bare) if w not in skip and not _known_word(w, known)]
+    if not unknown:
+        return m.label
+    # ...or the command's own first word is said, and what follows it that its
+    # examples lack is an argument ("какая погода в москве" -> "погода в москве")
+    head = next((i for i, w in enumerate(bare) if _known_word(w, {m.label.split()[0]})), None)
+    if head is None or unknown[0] < head:
+        return ""  # "open the window", "i like the weather", "go back", "stop it"
+    command = f"{m.label} {' '.join(bare[i] for i in unknown)}"
+    routed = ROUTER.match(command)
+    return command if routed is not None and routed.arg and _runnable(routed) else ""
+
+
+def _runnable(m) -> bool:
+    """False for no match, and for "open <x>" / "press <x>" where x is not a known app or key."""
+    if m is None:
+        return False
+    if m.route.tag == "app":
+        return _resolve_app(m.arg, ru_aliases=True) is not None
+    return not m.route.vocab or m.arg in m.route.vocab
+
+
+def command_match(norm: str, raw_text: str = ""):
+    """
+    The router match for `norm`, or for the command it paraphrases when the
+    router has nothing runnable ("open the terminal", "could you open notes").
+    None means the utterance goes to the LLM.
+    """
+    m = ROUTER.match(norm, raw_text)
+    if _runnable(m):
+        return m
+    command = intent_command(norm)
+    if command:
+        return ROUTER.match(command)
+    return m
+
+
+def looks_like_command(norm: str) -> bool:
+    """
+    True if `norm` is already a complete command, so a short pause means the
+    user is done (the endpointer then uses its shorter command window).
+    """
+    m = ROUTER.match(strip_leading_wake(norm))
+    if not _runnable(m):
+        return False
+    if m.route.tag == "app":
+        return True
+    # argument-taking commands ("type ...", "turn on ...") may still be mid-sentence
+    return m.arg == ""
+
+
+def llm_candidate(norm: str) -> str:
+    """
+    The text an awake FINAL equal to `norm` would send to generate_reply(),
+    or "" if it would be handled before reaching the LLM.
+    """
+    t = strip_leading_wake(norm)
+    if not t or detect_sleep(t):
+        return ""
+    if lang_switch_target(t) is not None:
+        return ""
+    if command_match(t) is not None:
+        return ""
+    return t
+
+
+# words each model can spell; phrases with anything else are left out of its grammar
+GRAMMAR_WORD_RE = {"en": re.compile(r"[a-z]+( [a-z]+)*"), "ru": re.compile(r"[а-яё]+( [а-яё]+)*")}
+_COMMAND_GRAMMARS = {}
+
+
+def command_phrases(lang: str) -> list:
+    """Every complete command (and sleep word) in `lang` that a grammar can hold."""
+    pattern = GRAMMAR_WORD_RE[lang]
+    phrases = set(ROUTER.phrases()) | SLEEP_WORDS_EN | SLEEP_WORDS_RU
+    return sorted(p for p in phrases if pattern.fullmatch(p))
+
+
+def command_grammar(lang: str) -> str:
+    """Vosk grammar (JSON list) for the command recognizer, built once per language."""
+    if lang not in _COMMAND_GRAMMARS:
+        _COMMAND_GRAMMARS[lang] = json.dumps(
+            command_phrases(lang) + ["[unk]"], ensure_ascii=False
+        )
+    return _COMMAND_GRAMMARS[lang]
+
+
+def make_command_recognizer(model, lang: str):
+    r = KaldiRecognizer(model, SAMPLE_RATE, command_grammar(lang))
+    r.SetWords(True)  # per-word confidences in Result()
+    return r
+
+
+def command_grammar_hit(res: dict) -> str:
+    """
+    The command in a grammar-recognizer result, or "" unless it is one whole
+    command heard with confidence (anything with [unk] never matches).
+    """
+    text = normalize_text(res.get("text", ""))
+    words = res.get("result") or []
+    if not text or not words or "[unk]" in text:
+        return ""
+    if min(w.get("conf", 0.0) for w in words) < COMMAND_GRAMMAR_MIN_CONF:
+        return ""
+    if ROUTER.match(text) is None and not detect_sleep(text):
+        return ""
+    return text
+
+
 def parse_and_execute_command(user_text: str, conn: socket.socket) -> str | None:
     """
     Returns a short assistant message if a command was executed.
     Returns None if this is not a command (so it should go to GPT).
     Safe: whitelist only.
     """
-    t = normalize_text(user_text)
-
-    # ---- EN commands ----
-    if t == "weather" or t.startswith("weather "):
-        loc = user_text[len("weather") :].strip()
-        speak(conn, "Checking weather.") # Early feedback
-        return get_weather_wttr(loc, current_lang)
-
-    if t.startswith("open playlist ") and len(t) > len("open playlist "):
-        pl = t[len("open playlist ") :].strip()
-        speak(conn, "Opening playlist.") # Early feedback
-        ok = mac_music_play_playlist(pl, shuffle=True)
-        return "Done." if ok else "No results in Apple Music."
-
-    if t.startswith("open "):
-        target = t[len("open ") :].strip()
-        app_key = APP_ALIASES.get(target)
-        if app_key:
-            ok = mac_open_app(app_key)
-            return "Opened." if ok else "I could not open it."
-        return "That app is not in my allowed list."
-
-    if t.startswith("switch to "):
-        target = t[len("switch to ") :].strip()
-        app_key = APP_ALIASES.get(target)
-        if app_key:
-            ok = mac_open_app(app_key)
-            return "Switched." if ok else "I could not switch."
-        return "That app is not in my allowed list."
-
-    if t.startswith("search for "):
-        q = t[len("search for ") :].strip()
-        if q:
-            speak(conn, "Searching.") # Early feedback
-            ok = mac_search_web(q)
-            return "Done." if ok else "I could not open the browser."
-        return "Say the query."
-
-    if t.startswith("turn on ") and len(t) > len("turn on "):
-        q = t[len("turn on ") :].strip()
-        speak(conn, "Okay.") # Early feedback
-        ok = play_from_youtube_video(q)
-        return "Done." if ok else "Failed."
-
-    if t.startswith("type "):
-        content = user_text.strip()[len("type ") :].strip()  
-        if content:
-            ok = mac_type_text(content)
-            return (
-                "Typed." if ok else "I could not type. Check Accessibility permissions."
-            )
-        return "Say what to type."
-
-    if t.startswith("press "):
-        key = t[len("press ") :].strip()
-        key_name = KEY_ALIASES_EN.get(key)
-        if key_name:
-            ok = mac_press_key(key_name)
-            return "Done." if ok else "I could not press the key."
-        return "Allowed keys: enter, tab, escape, space, backspace."
-
-    if t in ("volume up", "louder"):
-        ok = mac_volume(delta=6)
-        return "Volume up." if ok else "I could not change volume."
-
-    if t in ("volume down", "quieter"):
-        ok = mac_volume(delta=-6)
-        return "Volume down." if ok else "I could not change volume."
-
-    if t == "mute":
-        ok = mac_volume(mute=True)
-        return "Muted." if ok else "I could not mute."
-
-    if t in ("play", "pause", "post", "stop", "play/pause"):
-        ok = mac_media("playpause")
-        return "OK." if ok else "I could not control media."
-
-    if t in ("close tab", "close the tab", "close this tab"):
-        ok = chrome_close_tab()
-        return "Closed tab." if ok else "I could not close the tab."
-
-    if t in ("next track", "next"):
-        ok = mac_media("next")
-        return "Next." if ok else "I could not control media."
-
-    if t in ("previous track", "previous", "back"):
-        ok = mac_media("previous")
-        return "Previous." if ok else "I could not control media."
-
-    if t in ("screenshot", "take screenshot"):
-        ok = mac_screenshot()
-        return "Screenshot saved." if ok else "I could not take a screenshot."
-
-    if t.startswith("close "):
-        # --- RU: close Chrome tab (must be BEFORE "закрой <app>") ---
-        if t in (
-            "close tab",
-            "закрой эту вкладку",
-            "закрой таб",
-            "закрой вкладку в хроме",
-            "close chrome tab",
-        ):
-            ok = chrome_close_tab()
-            return "ok" if ok else "failed"
-
-        if t in (
-            "close window",
-            "close chrome window",
-        ):
-            ok = chrome_close_window()
-            return "ok" if ok else "failed"
-
-        if t in (
-            "close chrome",
-            "close google",
-            "close google chrome",
-        ):
-            ok = chrome_close_all_tabs()
-            return "ok" if ok else "failed"
-
-        target = t[len("close ") :].strip()
-        target = RU_APP_ALIASES.get(target, target)
-        app_key = APP_ALIASES.get(target)
-        if app_key:
-            ok = mac_quit_app(app_key)
-            return "closed" if ok else "failed to close."
-        return "this app is not in list."
-
-    if t.startswith("quit "):
-        target = t[len("quit ") :].strip()
-        app_key = APP_ALIASES.get(target)
-        if app_key:
-            ok = mac_quit_app(app_key)
-            return "Quit." if ok else "I could not quit it."
-        return "That app is not in my allowed list."
-
-    if t.startswith("launch ") and len(t) > len("launch "):
-        q = user_text[len("launch ") :].strip()
-        speak(conn, "Okay.") # Early feedback
-        ok = play_from_youtube_video(q)
-        return "Done." if ok else "Failed."
-
-    if t.startswith("play ") and len(t) > len("play "):
-        q = user_text[len("play ") :].strip()
-        speak(conn, "Okay.") # Early feedback
-        ok = play_from_youtube_video(q)
-        return "Done." if ok else "Failed."
-
-    # Note: "turn on" already handled above for EN
-
-    # ---- RU commands -----------------------------------------
-
-    if t == "погода" or t.startswith("погода "):
-        loc = user_text[len("погода") :].strip()
-        speak(conn, "Сейчас узнаю.") # Early feedback
-        return get_weather_wttr(loc, current_lang)
-
-    if t.startswith("включи ") and len(t) > len("включи "):
-        q = user_text[len("включи ") :].strip()
-        speak(conn, "Хорошо.") # Early feedback
-        ok = play_from_youtube_video(q)
-        return "Готово." if ok else "Не получилось."
-
-    if t.startswith("поставь ") and len(t) > len("поставь "):
-        q = user_text[len("поставь ") :].strip()
-        speak(conn, "Окей.") # Early feedback
-        ok = play_from_youtube_video(q)
-        return "Готово." if ok else "Не получилось."
-
-    if t.startswith("открой плейлист ") and len(t) > len("открой плейлист "):
-        pl = user_text.strip()[len("открой плейлист ") :].strip()
-        speak(conn, "Включаю.") # Early feedback
-        ok = mac_music_play_playlist(pl, shuffle=True)
-        return (
-            "Готово."
-            if ok
-            else "Не нашёл плейлист в Apple Music."
-        )
+    return ROUTER.dispatch(normalize_text(user_text), (user_text or "").strip(), conn)
 
-    if t.startswith("открой "):
-        target = t[len("открой ") :].strip()
-        target = RU_APP_ALIASES.get(target, target)
-        app_key = APP_ALIASES.get(target)
-        if app_key:
-            ok = mac_open_app(app_key)
-            return "Открыл." if ok else "Не получилось."
-        return "Приложение не найдено."
-
-    if t.startswith("переключись на "):
-        target = t[len("переключись на ") :].strip()
-        target = RU_APP_ALIASES.get(target, target)
-        app_key = APP_ALIASES.get(target)
-        if app_key:
-            ok = mac_open_app(app_key)
-            return "Переключил." if ok else "Не получилось."
-        return "Этого приложения нет в списке."
-
-    if t.startswith("поиск "):
-        q = user_text.strip()[len("поиск ") :].strip()
-        if q:
-            speak(conn, "Ищу.") # Early feedback
-            ok = mac_search_web(q)
-            return "Готово." if ok else "Не получилось."
-        return "Скажи запрос."
-
-    if t.startswith("напечатай "):
-        content = user_text.strip()[len("напечатай ") :].strip()
-        if content:
-            ok = mac_type_text(content)
-            return "Напечатал." if ok else "Не могу печатать."
-        return "Скажи, что напечатать."
-
-    if t.startswith("нажми "):
-        key = t[len("нажми ") :].strip()
-        key_name = KEY_ALIASES_RU.get(key)
-        if key_name:
-            ok = mac_press_key(key_name)
-            return "Готово." if ok else "Не получилось."
-        return "Клавиша не поддерживается."
-
-    if t in ("громче", "погромче"):
-        ok = mac_volume(delta=6)
-        return "Громче." if ok else "Не получилось."
-
-    if t in ("тише", "потише"):
-        ok = mac_volume(delta=-40)
-        return "Тише." if ok else "Не получилось."
-
-    if t in ("без звука", "мут"):
-        ok = mac_volume(mute=True)
-        return "Без звука." if ok else "Не получилось."
-
-    if t in ("плей", "играй", "пауза", "плей пауза", "включи"):
-        ok = mac_media("playpause")
-        return "Ок" if ok else "Не получилось."
-
-    if t in ("следующий трек", "следующая", "дальше"):
-        ok = mac_media("next")
-        return "Следующий." if ok else "Не получилось."
-
-    if t in ("предыдущий трек", "предыдущая", "назад"):
-        ok = mac_media("previous")
-        return "Предыдущий." if ok else "Не получилось."
-
-    if t in ("скриншот", "сделай скриншот"):
-        ok = mac_screenshot()
-        return "Скриншот сохранён." if ok else "Не получилось."
-
-    if t.startswith("закрой "):
-        # --- RU: close Chrome tab (must be BEFORE "закрой <app>") ---
-        if t in (
-            "закрой вкладку",
-            "закрой эту вкладку",
-            "закрой таб",
-            "закрой вкладку в хроме",
-            "закрой вкладку хром",
-        ):
-            ok = chrome_close_tab()
-            return "Закрыл." if ok else "Не получилось."
-
-        if t in ("закрой окно", "закрой окно хром", "закрой окно в хроме"):
-            ok = chrome_close_window()
-            return "Закрыл." if ok else "Не получилось."
-
-        if t in (
-            "закрой хром",
-            "закрой хром полностью",
-            "закрой все вкладки",
-            "выйди из хрома",
-        ):
-            ok = chrome_close_all_tabs()
-            return "Ок." if ok else "Не получилось."
-
-        target = t[len("закрой ") :].strip()
-        target = RU_APP_ALIASES.get(target, target)
-        app_key = APP_ALIASES.get(target)
-        if app_key:
-            ok = mac_quit_app(app_key)
-            return "Закрыл." if ok else "Не получилось."
-        return "Не получилось."
 
-    return None
+def start_command(user_text: str, conn: socket.socket, turn=None) -> bool:
+    """
+    Like parse_and_execute_command(), but runs the command on COMMANDS and
+    speaks its reply when it finishes. Returns False if this is not a command.
+    """
+    norm = normalize_text(user_text)
+    m = command_match(norm, (user_text or "").strip())
+    if m is None:
+        return False
+    if m.text != norm:
+        LOG.info("intent", heard=repr(norm), command=repr(m.text))
+    TURNS.routed(turn, "command")
+
+    ru = lang_of(conn) == "ru"
+    job = COMMANDS.submit(
+        conn,
+        m.text,
+        (lambda: m.text) if DRY_RUN else (lambda: m.route.handler(m, conn)),
+        COMMAND_DEADLINE_S.get(m.route.tag, COMMAND_DEADLINE_S[""]),
+        on_done=lambda reply: speak(conn, reply, turn),
+        on_timeout=lambda: speak(conn, "Не успел." if ru else "That took too long."),
+    )
+    if job is None:
+        speak(conn, "Я занят." if ru else "I'm busy, try again.")
+    return True
 
 
 def handle_client(conn: socket.socket, addr):
-    global is_awake, skip_next_final_after_wake
-
-    print(f"Client {addr} connected")
+    LOG.info("client connected", addr=addr)
     listening_led_on = False
 
-    set_awake(conn, False)
+    device = f"?@{addr[0]}"  # until HELLO names it
+    speech = speculator = trace = recorder = None
+    cpu = stats.StageCPU()
+    tail = "recv"  # stage the rest of the previous iteration is charged to
 
     try:
+        hello, pending = read_hello(conn)
+        hello["tts_codec"] = protocol.negotiate_codec(hello["tts"], TTS_CODECS)
+        DEVICE_INFO[conn] = hello
+        speech = SPEAK_QUEUES[conn] = queue.Queue(maxsize=10)
+        threading.Thread(target=speak_worker, args=(speech,), daemon=True, name="speak").start()
+        device = f"{hello['device']}@{addr[0]}"  # metrics label
+        log.set_context(device=device)
+        conv = CONVERSATIONS[conn] = Conversation(device, LAST_LANG.get(device, DEFAULT_LANG))
+        LOG.info("HELLO", format=hello["format"], rate=hello["rate"], tts=hello["tts_codec"])
+        if hello["tts_codec"] != "PCM16":
+            # old firmware never offers a codec, so it never sees this line
+            send_line(conn, f"__codec__ {hello['tts_codec']}")
+
+        # upstream audio -> PCM16 at the model rate (format and rate declared in HELLO)
+        decoder = audio_codec.make_decoder(hello["format"])
+        resampler = resample.make_resampler(hello["rate"], SAMPLE_RATE)
+
+        endpoint = endpointer.Endpointer(
+            SAMPLE_RATE, ENDPOINT_SILENCE_MS, ENDPOINT_COMMAND_SILENCE_MS
+        )
+        have_partial = False
+        speculator = speculation.Speculator(
+            SPECULATION_EXECUTOR, functools.partial(speculative_reply, conv), SPECULATE_STABLE_MS
+        )
+
+        set_awake(conn, False)
+
+        trace = tracing.Session(device) if tracing.ENABLED else None
+        tracing.set_current(trace.context() if trace else None)
+
+        if RECORD:
+            recorder = recording.Recorder(
+                recording.new_path(RECORD_DIR, device), protocol.format_hello(hello), conv.lang
+            )
+
         while True:
-            data = conn.recv(1024)
+            cpu.lap(tail)
+            if trace:
+                trace.listen()
+            profiling.tick()
+            with tracing.span("recv", "io") as sp:
+                data = pending or conn.recv(1024)
+                sp.set(bytes=len(data))
+            pending = b""
             if not data:
                 break
+            idle = not (have_partial or endpoint.speech_ms or speech.unfinished_tasks or COMMANDS.busy(conn))
+            if DRAINING.is_set() and idle:
+                LOG.info("worker draining, closing the idle session")
+                break
+            if recorder:
+                recorder.write(data)
+            cpu.lap("recv")
+            tail = "decode"
 
             data = handle_lang_markers(conn, data)
             if not data:
                 continue
 
-            if rec.AcceptWaveform(data):
+            data = resampler.process_bytes(decoder.decode(data))
+            if not data:
+                continue
+            cpu.count("audio_s", len(data) / (2.0 * SAMPLE_RATE))
+            cpu.lap("decode")
+
+            speech_over = endpoint.feed(data)
+            cpu.lap("endpoint")
+
+            rec, cmd_rec = RECOGNIZERS[conn]
+            command = ""
+            if cmd_rec is not None and conv.awake:
+                with tracing.span("AcceptWaveform", "asr", recognizer="grammar"):
+                    cmd_done = cmd_rec.AcceptWaveform(data)
+                if cmd_done:
+                    command = command_grammar_hit(json.loads(cmd_rec.Result()))
+                elif speech_over and have_partial:
+                    with tracing.span("FinalResult", "asr", recognizer="grammar"):
+                        command = command_grammar_hit(json.loads(cmd_rec.FinalResult()))
+                cpu.lap("asr_grammar")
+
+            if command:
+                # the restricted recognizer is sure; drop the free-form hypothesis
+                rec.Reset()
+                res = {"text": command}
+                final_source = "grammar"
+            else:
+                with tracing.span("AcceptWaveform", "asr", recognizer="free", bytes=len(data)):
+                    done = rec.AcceptWaveform(data)
+                if done:
+                    res = json.loads(rec.Result())
+                    final_source = "vosk"
+                elif speech_over and have_partial:
+                    # our VAD saw the trailing silence first; don't wait for Vosk
+                    with tracing.span("FinalResult", "asr", recognizer="free"):
+                        res = json.loads(rec.FinalResult())
+                    final_source = "endpointer"
+                else:
+                    res = None
+                cpu.lap("asr_free")
+
+            if res is not None:
+                tail = "route"
+                if cmd_rec is not None and final_source != "grammar":
+                    cmd_rec.Reset()  # start the next utterance clean on both
+                speech_ago_ms = None
+                if endpoint.speech_end is not None:
+                    speech_ago_ms = endpoint.now_ms - endpoint.speech_end
+                    ENDPOINT_LATENCY[final_source].observe(speech_ago_ms)
+                endpoint.reset()
+                have_partial = False
+
                 if listening_led_on:
                     send_line(conn, "__listening_off__")
                     listening_led_on = False
 
-                res = json.loads(rec.Result())
                 text = (res.get("text", "") or "").strip()
                 if not text:
                     continue
 
+                cpu.count("finals")
                 norm = normalize_text(text)
-                print(f"[{current_lang}] FINAL: {norm}")
+                LOG.info("FINAL", lang=conv.lang, text=norm)
+                turn = TURNS.begin(conn, device, speech_ago_ms)
+                if trace:
+                    trace.final(norm)
+                    tracing.instant("FINAL", "asr", source=final_source, text=norm, turn_id=turn.id)
+
+                # commit a matching speculative reply, drop anything else
+                spec = speculator.take(
+                    llm_candidate(norm) if conv.awake else "", endpoint.now_ms
+                )
 
                 # Sleeping: only wake word
-                if not is_awake:
+                if not conv.awake:
                     if detect_wake(norm):
+                        TURNS.routed(turn, "wake")
                         set_awake(conn, True)
-                        ack = "Да?" if current_lang == "ru" else "Yes?"
+                        ack = "Да?" if conv.lang == "ru" else "Yes?"
                         speak(conn, ack)
+                    else:
+                        TURNS.routed(turn, "ignored")
                     continue
 
                 # Awake: suppress leftover final right after wake
-                if skip_next_final_after_wake:
+                if conv.skip_next_final_after_wake:
                     remainder = strip_leading_wake(norm)
                     if remainder == "":
-                        skip_next_final_after_wake = False
+                        conv.skip_next_final_after_wake = False
+                        TURNS.routed(turn, "ignored")
                         continue
-                    skip_next_final_after_wake = False
+                    conv.skip_next_final_after_wake = False
                     norm = remainder
                     text = remainder
 
                 # Awake: sleep command
                 if detect_sleep(norm):
+                    TURNS.routed(turn, "sleep")
                     set_awake(conn, False)
-                    ack = "Сплю." if current_lang == "ru" else "Going to sleep."
+                    ack = "Сплю." if conv.lang == "ru" else "Going to sleep."
                     speak(conn, ack)
                     continue
 
@@ -1242,14 +1951,18 @@ def handle_client(conn: socket.socket, addr):
                     text = stripped
                     norm = normalize_text(stripped)
                 elif stripped == "":
-                    ack = "Да?" if current_lang == "ru" else "Yes?"
+                    TURNS.routed(turn, "wake")
+                    ack = "Да?" if conv.lang == "ru" else "Yes?"
                     speak(conn, ack)
                     continue
 
                 # ---- Voice language switch (works while awake) ----
                 norm2 = normalize_text(text)
+                switch_to = lang_switch_target(norm2)
+                if switch_to is not None:
+                    TURNS.routed(turn, "lang")
 
-                if norm2 in LANG_EN_WORDS or norm2 in LANG_EN_WORDS_RU:
+                if switch_to == "en":
                     ok = set_language(conn, "en")
                     speak(
                         conn,
@@ -1257,7 +1970,7 @@ def handle_client(conn: socket.socket, addr):
                     )
                     continue
 
-                if norm2 in LANG_RU_WORDS:
+                if switch_to == "ru":
                     ok = set_language(conn, "ru")
                     speak(
                         conn,
@@ -1269,29 +1982,39 @@ def handle_client(conn: socket.socket, addr):
                     )
                     continue
 
-                # Try safe command execution
-                cmd_result = parse_and_execute_command(text, conn)
-                if cmd_result is not None:
-                    speak(conn, cmd_result)
+                # barge-in: whatever the user asked before is no longer wanted
+                COMMANDS.cancel(conn, "barge-in")
+
+                # Try safe command execution (in the background)
+                if start_command(text, conn, turn):
                     continue
 
                 # Otherwise, normal GPT reply
-                reply = generate_reply(text)
-                speak(conn, reply)
+                if spec is not None and spec[1] == len(conv.history):
+                    TURNS.routed(turn, "llm_speculated")
+                    reply = spec[0]
+                    conv.history.append({"role": "user", "content": text})
+                else:
+                    TURNS.routed(turn, "llm")
+                    reply = generate_reply(conv, text, turn)
+                speak(conn, reply, turn)
 
             else:
+                tail = "partial"
                 pres = json.loads(rec.PartialResult())
                 ptext = (pres.get("partial", "") or "").strip()
                 if not ptext:
                     continue
 
                 pnorm = normalize_text(ptext)
+                have_partial = True
+                endpoint.command_mode = conv.awake and looks_like_command(pnorm)
 
                 # sleeping: detect wake early, no LED spam
-                if not is_awake:
+                if not conv.awake:
                     if detect_wake(pnorm):
                         set_awake(conn, True)
-                        ack = "Да?" if current_lang == "ru" else "Yes?"
+                        ack = "Да?" if conv.lang == "ru" else "Yes?"
                         speak(conn, ack)
                     continue
 
@@ -1299,31 +2022,153 @@ def handle_client(conn: socket.socket, addr):
                     send_line(conn, "__listening_on__")
                     listening_led_on = True
 
-                print(f"[{current_lang}] PARTIAL: {pnorm}", end="\r")
+                if SPECULATE:
+                    speculator.on_partial(llm_candidate(pnorm), endpoint.now_ms)
+
+                if LOG_PARTIALS:
+                    LOG.debug("PARTIAL", every_s=LOG_PARTIAL_EVERY_S, lang=conv.lang, text=pnorm)
 
     finally:
+        cpu.lap(tail)
+        STAGE_CPU.merge(cpu)
+        if recorder:
+            recorder.close()
+            LOG.info(f"RECORD: {recorder.path}")
+        COMMANDS.cancel(conn, "disconnected")
+        SPEAK_QUEUES.pop(conn, None)
+        if speech is not None:
+            _drain_speech(speech)
+            speech.put(None)
+        RECOGNIZERS.pop(conn, None)
+        CONVERSATIONS.pop(conn, None)
+        TURNS.end(conn)
+        tracing.set_current(None)
+        if trace:
+            trace.close()
+            LOG.info(f"TRACE: {len(trace.written)} turn file(s) in {TRACE_DIR}/")
+        DEVICE_INFO.pop(conn, None)
         conn.close()
-        print("\nClient disconnected")
-
+        LOG.info("client disconnected")
+        if speculator is not None:  # else the session ended before it started
+            speculator.cancel()
+            reports = [hist.render(f"end of speech -> FINAL ({source})") for source, hist in ENDPOINT_LATENCY.items()]
+            reports += [speculator.report(), COMMANDS.report(), readiness.report(), WEATHER.report(), TURNS.report(device)]
+            reports.append(cpu.render("handle_client CPU", cpu.counts.get("audio_s", 0.0)))
+            LOG.info("session stats\n" + "\n".join(reports))
+        log.clear_context()
+
+
+def collect_metrics() -> str:
+    """Prometheus text for METRICS_PORT."""
+    lines = TURNS.prometheus()
+    lines += metrics.histogram_lines(
+        "minigpt_endpoint_seconds",
+        "End of speech to FINAL, by which side produced the FINAL.",
+        (({"source": src}, h) for src, h in ENDPOINT_LATENCY.items()),
+    )
+    lines += metrics.counter_lines(
+        "process_cpu_seconds_total", "User and system CPU time of the server process.", [({}, time.process_time())]
+    )
+    lines += metrics.gauge_lines(
+        "minigpt_sessions_active", "Connected devices.", [({}, sum(t.is_alive() for t in SESSIONS))]
+    )
+    lines += metrics.counter_lines("minigpt_sessions_total", "Connections accepted.", [({}, ACCEPTED)])
+    seconds, counts = STAGE_CPU.snapshot()
+    lines += metrics.counter_lines(
+        "minigpt_stage_cpu_seconds_total",
+        "handle_client CPU time by stage, finished sessions.",
+        (({"stage": stage}, s) for stage, s in seconds.items()),
+    )
+    lines += metrics.counter_lines(
+        "minigpt_audio_seconds_total", "Audio decoded, finished sessions.", [({}, counts.get("audio_s", 0.0))]
+    )
+    return "\n".join(lines) + "\n"
 
-def mac_quit_app(app_name: str) -> bool:
-    script = f'tell application "{app_name}" to quit'
-    return run_osascript(script)
 
+def worker_load() -> dict:
+    """A worker's load, as the supervisor logs it."""
+    seconds, counts = STAGE_CPU.snapshot()
+    return {
+        "active": sum(t.is_alive() for t in SESSIONS), "sessions": ACCEPTED,
+        "cpu_s": round(time.process_time(), 1), "audio_s": round(counts.get("audio_s", 0.0), 1),
+        "finals": counts.get("finals", 0),
+    }
 
-def main():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((HOST, PORT))
-        s.listen(1)
-        print(f"Server listening on {HOST}:{PORT}")
-        threading.Thread(target=speak_worker, daemon=True).start()
 
-        while True:
+def start(ports: bool = True):
+    """Models and background services. ports: also the profiling and metrics ports."""
+    tracing.ENABLED = TRACE
+    tracing.OUT_DIR = TRACE_DIR
+    load_models()
+    profiling.OUT_DIR = PROFILE_DIR
+    profiling.install_signals()
+    if ports and PROFILE_PORT:
+        profiling.ControlServer(PROFILE_HOST, PROFILE_PORT).start()
+    if ports and METRICS_PORT:
+        metrics.MetricsServer(collect_metrics, METRICS_HOST, METRICS_PORT).start()
+    if WEATHER_PREFETCH:
+        WEATHER.start_prefetch()
+    PLAYLISTS.start()
+
+
+def listen(reuse_port: bool = False) -> socket.socket:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    s.bind((HOST, PORT))
+    s.listen(LISTEN_BACKLOG)
+    LOG.info(f"server listening on {HOST}:{PORT}")
+    return s
+
+
+def serve(s: socket.socket, stopping: threading.Event | None = None):
+    """
+    Accept loop, one handle_client thread per connection. With `stopping`
+    (a worker), returns once it is set and every session has closed
+    (handle_client closes idle ones while DRAINING) or WORKER_DRAIN_S passed.
+    """
+    global ACCEPTED
+    s.settimeout(None if stopping is None else 0.5)
+    while stopping is None or not stopping.is_set():
+        try:
             conn, addr = s.accept()
-            threading.Thread(
-                target=handle_client, args=(conn, addr), daemon=True
-            ).start()
+        except socket.timeout:
+            continue
+        t = threading.Thread(target=handle_client, args=(conn, addr), daemon=True)
+        t.start()
+        SESSIONS[:] = [x for x in SESSIONS if x.is_alive()] + [t]
+        ACCEPTED += 1
+
+    s.close()
+    DRAINING.set()
+    active = [t for t in SESSIONS if t.is_alive()]
+    LOG.info("draining", sessions=len(active))
+    deadline = time.monotonic() + WORKER_DRAIN_S
+    for t in active:
+        t.join(max(0.0, deadline - time.monotonic()))
+    LOG.info("drained", left=sum(t.is_alive() for t in active))
+
+
+def serve_worker(slot: int, stopping: threading.Event, ready):
+    """One of WORKERS processes (see supervisor.worker_main)."""
+    log.configure(LOG_LEVEL, LOG_FORMAT, LOG_FILE)
+    start(ports=False)
+    with listen(reuse_port=True) as s:
+        ready()
+        serve(s, stopping)
+
+
+def main():
+    log.configure(LOG_LEVEL, LOG_FORMAT, LOG_FILE)
+    if WORKERS > 1:
+        supervisor.Supervisor(
+            WORKERS, serve_worker, worker_load, collect_metrics, WORKER_DRAIN_S, WORKER_STATS_S
+        ).run(METRICS_HOST, METRICS_PORT)
+        return
+    start()
+    with listen() as s:
+        serve(s)
 
 
 if __name__ == "__main__":
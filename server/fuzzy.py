@@ -0,0 +1,303 @@
+"""
+Approximate string matching for spoken names.
+
+NgramIndex maps names to values and finds the closest names to a query:
+character trigrams through an inverted index pick a handful of candidates,
+then edit distance ranks them. A lookup touches only the posting lists of the
+query's trigrams, not every name, so it stays in the microseconds for a few
+thousand names.
+
+PhoneticIndex is for short, fixed vocabularies (wake words, app names) where
+mis-hearings sound alike rather than look alike: "джервис" / "jarvis",
+"телеграм" / "telegram". Entries and queries are reduced to a phonetic key
+(see phonetic()); keys within edit distance 1-2 are found through a
+precomputed table of deletions, so a lookup is a few dict probes.
+"""
+
+import heapq
+import re
+from collections import Counter
+from itertools import chain
+from typing import Any, NamedTuple
+
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+
+def normalize(s: str) -> str:
+    """Lowercase, ё -> е, punctuation to spaces, single spaces."""
+    s = (s or "").lower().replace("ё", "е").replace("_", " ")
+    return " ".join(_NON_WORD_RE.sub(" ", s).split())
+
+
+def trigrams(s: str) -> set:
+    s = f" {s} "
+    return {s[i : i + 3] for i in range(len(s) - 2)}
+
+
+def edit_distance(a: str, b: str) -> int:
+    """
+    Levenshtein distance (insert, delete, substitute all cost 1).
+    Bit-parallel (Myers/Hyyrö): one pass over `b` with `a` packed into an int,
+    instead of a len(a) x len(b) table.
+    """
+    if not a or not b:
+        return len(a) + len(b)
+    peq = {}
+    for i, c in enumerate(a):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    m = len(a)
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for c in b:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & mask
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv
+    return score
+
+
+def similarity(a: str, b: str) -> float:
+    """1.0 for equal strings, 0.0 for nothing in common (edit distance based)."""
+    if not a and not b:
+        return 1.0
+    return 1.0 - edit_distance(a, b) / max(len(a), len(b))
+
+
+class FuzzyMatch(NamedTuple):
+    score: float  # 0..1
+    key: str  # normalized name that matched
+    value: Any
+
+
+class NgramIndex:
+    CANDIDATES = 8  # trigram winners that get the (slower) edit-distance check
+
+    def __init__(self):
+        self._values = {}  # normalized key -> value
+        self._grams = {}  # normalized key -> its trigrams
+        self._postings = {}  # trigram -> set of keys
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __contains__(self, name: str) -> bool:
+        return normalize(name) in self._values
+
+    def add(self, name: str, value: Any = None):
+        key = normalize(name)
+        if not key:
+            return
+        if key in self._values:
+            self._values[key] = value
+            return
+        grams = trigrams(key)
+        self._values[key] = value
+        self._grams[key] = grams
+        for g in grams:
+            self._postings.setdefault(g, set()).add(key)
+
+    def remove(self, name: str):
+        key = normalize(name)
+        if key not in self._values:
+            return
+        del self._values[key]
+        for g in self._grams.pop(key):
+            keys = self._postings.get(g)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[g]
+
+    def keys(self):
+        return self._values.keys()
+
+    def search(self, query: str, limit: int = 1, min_score: float = 0.0) -> list:
+        """Best matches for `query`, highest score first."""
+        q = normalize(query)
+        if not q:
+            return []
+        if q in self._values:
+            return [FuzzyMatch(1.0, q, self._values[q])]
+
+        qgrams = trigrams(q)
+        postings = self._postings
+        shared = Counter(chain.from_iterable(postings[g] for g in qgrams if g in postings))
+        if not shared:
+            return []
+
+        # Dice coefficient over trigrams picks the candidates (names sharing
+        # under half as many trigrams as the best one can't win)...
+        nq, grams = len(qgrams), self._grams
+        cut = max(shared.values()) // 2
+        dice = {key: 2.0 * n / (nq + len(grams[key])) for key, n in shared.items() if n > cut}
+        candidates = heapq.nlargest(max(limit, self.CANDIDATES), dice, key=dice.get)
+
+        # ...edit distance settles the order between them
+        out = []
+        for key in candidates:
+            score = 0.5 * dice[key] + 0.5 * similarity(q, key)
+            if score >= min_score:
+                out.append(FuzzyMatch(score, key, self._values[key]))
+        out.sort(key=lambda m: m.score, reverse=True)
+        return out[:limit]
+
+    def best(self, query: str, min_score: float = 0.0) -> FuzzyMatch | None:
+        found = self.search(query, 1, min_score)
+        return found[0] if found else None
+
+
+# ---- phonetic keys ----
+
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z",
+    "и": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p",
+    "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "ts", "ч": "ch",
+    "ш": "sh", "щ": "sh", "ъ": "", "ы": "i", "ь": "", "э": "e", "ю": "u", "я": "a",
+}
+_TRANSLIT_TABLE = str.maketrans(_TRANSLIT)
+
+# longest first; voiced/unvoiced pairs collapse (d/t, g/k, z/s, b/p, v/f)
+_SOUNDS = (
+    ("dzh", "j"), ("zh", "j"), ("dj", "j"), ("ch", "c"), ("sh", "s"), ("ph", "f"),
+    ("th", "t"), ("ck", "k"), ("ts", "s"), ("x", "ks"), ("q", "k"), ("w", "v"),
+    ("c", "k"), ("g", "k"), ("d", "t"), ("z", "s"), ("b", "p"), ("v", "f"), ("h", ""),
+)
+_SOUND_RE = re.compile("|".join(a for a, _ in _SOUNDS))
+_SOUND_MAP = dict(_SOUNDS)
+_VOWELS_RE = re.compile(r"[aeiouy]+")
+
+
+def translit(s: str) -> str:
+    """Cyrillic -> Latin letters, spaces dropped."""
+    return normalize(s).translate(_TRANSLIT_TABLE).replace(" ", "")
+
+
+def phonetic(s: str) -> str:
+    """
+    Rough sound key: transliterate, merge similar consonants, drop vowels
+    (a leading vowel becomes "a"), collapse repeats.
+    "джарвис", "jarvis", "жарвис" -> "jrfs"; "телеграмм", "telegram" -> "tlkrm".
+    """
+    t = translit(s)
+    if not t:
+        return ""
+    lead = "a" if t[0] in "aeiouy" else ""
+    t = _VOWELS_RE.sub("", _SOUND_RE.sub(lambda m: _SOUND_MAP[m.group()], t))
+    out = lead
+    for ch in t:
+        if not out or out[-1] != ch:
+            out += ch
+    return out
+
+
+def _deletes(key: str, depth: int) -> set:
+    out, frontier = {key}, {key}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1 :] for w in frontier for i in range(len(w))}
+        out |= frontier
+    return out
+
+
+class VocabHit(NamedTuple):
+    score: float  # 0..1
+    kind: str  # vocabulary the entry belongs to ("wake", "app", ...)
+    value: Any
+    phrase: str  # the entry as it was added
+
+
+_VOWELS = set("aeiouy")
+
+
+def _added_ending(query: str, entry: str) -> bool:
+    """
+    Whether (transliterated) `query` is `entry` with an ending added. The
+    phonetic key drops vowels, so "ассистенту" has the key of "assistant".
+    """
+    if len(query) <= len(entry):
+        return False
+    if query.startswith(entry):
+        return query[len(entry) :] != entry[-1]  # "telegramm" is just a doubled letter
+    return query[-1] in _VOWELS and entry[-1] not in _VOWELS
+
+
+class PhoneticIndex:
+    MIN_FUZZY_KEY = 4  # shorter keys ("спи" -> "sp") only match exactly
+    LONG_KEY = 7  # keys this long may be 2 edits away instead of 1
+
+    def __init__(self):
+        self._exact = {}  # normalized phrase -> [VocabHit]
+        self._keys = {}  # phonetic key -> [VocabHit]
+        self._deletes = {}  # key with 1-2 letters deleted -> set of keys
+        self._translit = {}  # phrase -> translit, for scoring
+        self._longest = 0  # longest key; much longer queries can't be close to anything
+
+    def _max_edits(self, key: str) -> int:
+        if len(key) < self.MIN_FUZZY_KEY:
+            return 0
+        return 2 if len(key) >= self.LONG_KEY else 1
+
+    def add(self, phrase: str, kind: str, value: Any = None):
+        norm = normalize(phrase)
+        key = phonetic(norm)
+        if not key:
+            return
+        hit = VocabHit(1.0, kind, value, norm)
+        self._exact.setdefault(norm, []).append(hit)
+        self._keys.setdefault(key, []).append(hit)
+        self._translit[norm] = translit(norm)
+        self._longest = max(self._longest, len(key))
+        for d in _deletes(key, self._max_edits(key)):
+            self._deletes.setdefault(d, set()).add(key)
+
+    def lookup(self, phrase: str) -> list:
+        """Entries that `phrase` may be a mis-hearing of, best first."""
+        norm = normalize(phrase)
+        exact = self._exact.get(norm)
+        if exact:
+            return list(exact)
+
+        key = phonetic(norm)
+        edits = self._max_edits(key)
+        if len(key) > self._longest + edits:
+            return []
+        candidates = set()
+        for d in _deletes(key, edits):
+            candidates |= self._deletes.get(d, set())
+
+        q = translit(norm)
+        out = []
+        for k in candidates:
+            dist = edit_distance(key, k)
+            # the shorter key decides how far apart they may be
+            shorter = min(key, k, key=len)
+            if dist > self._max_edits(shorter):
+                continue
+            # sounding alike counts a bit less than being spelled alike, and
+            # not at all for very short keys ("спит" and "спать" are both "spt")
+            key_sim = 0.0
+            if len(shorter) >= self.MIN_FUZZY_KEY:
+                key_sim = 0.95 * (1.0 - dist / max(len(key), len(k)))
+            for hit in self._keys[k]:
+                t = self._translit[hit.phrase]
+                if _added_ending(q, t):
+                    continue  # another word: "ассистенту", "terminals"
+                score = max(similarity(q, t), key_sim)
+                out.append(hit._replace(score=score))
+        out.sort(key=lambda h: h.score, reverse=True)
+        return out
+
+    def best(self, phrase: str, kind: str, min_score: float) -> VocabHit | None:
+        for hit in self.lookup(phrase):
+            if hit.kind == kind and hit.score >= min_score:
+                return hit
+        return None
@@ -0,0 +1,109 @@
+"""
+Local intent classifier for commands phrased differently from the router table.
+
+Every example phrase is turned into a vector of hashed character n-grams
+(2-4 letters, word boundaries included), weighted by tf-idf and normalized.
+classify() builds the same vector for the utterance and takes the cosine
+similarity against all examples with one numpy product, so "could you open
+telegram" lands on "open telegram" in well under a millisecond, without an
+LLM round trip.
+
+Only the query's non-zero n-grams are looked up: the example matrix is stored
+n-gram-major, so a query touches a few dozen rows instead of the whole matrix.
+"""
+
+import functools
+import zlib
+from collections import Counter
+from typing import NamedTuple
+
+import numpy as np
+
+DIM = 1 << 12  # hashed feature space; collisions only blur, they don't break
+NGRAMS = (2, 3, 4)
+TOP = 8  # best examples looked at when computing the margin
+
+
+def ngrams(text: str) -> Counter:
+    """Character n-grams of `text` with a space on both sides of every word."""
+    s = f" {' '.join(text.split())} "
+    return Counter(s[i : i + n] for n in NGRAMS for i in range(len(s) - n + 1))
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _slot(gram: str) -> int:
+    # crc32 rather than hash(): the same slot in every process
+    return zlib.crc32(gram.encode("utf-8")) & (DIM - 1)
+
+
+class IntentMatch(NamedTuple):
+    score: float  # cosine similarity to the closest example, 0..1
+    label: str  # what that example stands for (a router command)
+    example: str
+    margin: float  # score minus the best example with a different label
+
+
+class IntentClassifier:
+    def __init__(self):
+        self._examples = []  # (text, label)
+        self._matrix = None  # DIM x n_examples, built on first classify()
+        self._idf = None
+
+    def __len__(self) -> int:
+        return len(self._examples)
+
+    def add(self, example: str, label: str):
+        example = " ".join(example.lower().split())
+        if example:
+            self._examples.append((example, label))
+            self._matrix = None
+
+    def _vector(self, grams: Counter) -> tuple[np.ndarray, np.ndarray]:
+        """(slots, weights) of a normalized tf-idf vector."""
+        n = len(grams)
+        slots = np.fromiter(map(_slot, grams), dtype=np.intp, count=n)
+        tf = np.fromiter(grams.values(), dtype=np.float32, count=n)
+        weights = (1.0 + np.log(tf)) * self._idf[slots]
+        # n-grams hashed to the same slot add up
+        slots, inverse = np.unique(slots, return_inverse=True)
+        weights = np.bincount(inverse, weights=weights).astype(np.float32)
+        norm = float(np.linalg.norm(weights))
+        return slots, weights / norm if norm else weights
+
+    def _build(self):
+        grams = [ngrams(text) for text, _ in self._examples]
+        df = np.zeros(DIM, dtype=np.float32)
+        for g in grams:
+            df[list({_slot(x) for x in g})] += 1.0
+        n = len(grams)
+        # smoothed idf; n-grams no example has get the highest weight, so
+        # words the commands don't contain count against a match
+        self._idf = np.log((1.0 + n) / (1.0 + df)) + 1.0
+        matrix = np.zeros((DIM, n), dtype=np.float32)
+        for j, g in enumerate(grams):
+            slots, weights = self._vector(g)
+            matrix[slots, j] = weights
+        self._matrix = matrix
+
+    def classify(self, text: str) -> IntentMatch | None:
+        """Closest example to `text`, or None if nothing shares an n-gram with it."""
+        if not self._examples:
+            return None
+        if self._matrix is None:
+            self._build()
+        grams = ngrams(text.lower())
+        if not grams:
+            return None
+        slots, weights = self._vector(grams)
+        scores = weights @ self._matrix[slots]  # cosine against every example
+
+        k = min(TOP, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        best = int(top[0])
+        score = float(scores[best])
+        if score <= 0.0:
+            return None
+        example, label = self._examples[best]
+        runner_up = next((float(scores[j]) for j in top[1:] if self._examples[j][1] != label), 0.0)
+        return IntentMatch(score, label, example, score - runner_up)
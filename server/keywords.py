@@ -0,0 +1,94 @@
+"""
+Single-pass keyword spotting over the control vocabularies.
+
+The wake, sleep, language and app-name lists used to be checked one by one,
+each check re-tokenizing the utterance and building its own set. Spotter
+compiles every phrase of every vocabulary into one Aho-Corasick automaton
+over words, so one walk over the tokens finds all phrases (multi-word ones
+included, overlaps too) with their positions.
+"""
+
+import re
+from typing import Any, NamedTuple
+
+_TOKEN_RE = re.compile(r"[^\s,.!?:;-]+")
+
+
+def tokenize(s: str) -> list:
+    """Words of `s`, split on whitespace and , . ! ? : ; - (text is expected lowercased)."""
+    return _TOKEN_RE.findall(s)
+
+
+def _key(token: str) -> str:
+    return token.replace("ё", "е")
+
+
+class Spot(NamedTuple):
+    start: int  # first token of the phrase
+    end: int  # one past its last token
+    kind: str  # vocabulary ("wake", "app", ...)
+    value: Any
+    phrase: str  # the phrase as it was added
+
+
+class Spotter:
+    def __init__(self):
+        self._goto = [{}]  # state -> {token: state}
+        self._out = [[]]  # state -> [(length, kind, value, phrase)] ending here
+        self._fail = [0]
+        self._built = True
+        self.longest = 0  # most tokens in one phrase
+
+    def add(self, phrase: str, kind: str, value: Any = None):
+        words = [_key(t) for t in tokenize(phrase.lower())]
+        if not words:
+            return
+        state = 0
+        for w in words:
+            nxt = self._goto[state].get(w)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][w] = nxt
+                self._goto.append({})
+                self._out.append([])
+                self._fail.append(0)
+            state = nxt
+        self._out[state].append((len(words), kind, value, " ".join(words)))
+        self.longest = max(self.longest, len(words))
+        self._built = False
+
+    def _build(self):
+        # breadth-first: a state's failure link is the longest proper suffix
+        # of its path that is also a path from the root
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = list(goto[0].values())
+        for s in queue:
+            fail[s] = 0
+        for s in queue:
+            for w, nxt in goto[s].items():
+                queue.append(nxt)
+                f = fail[s]
+                while f and w not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(w, 0)
+        # suffix outputs are appended once here instead of followed at scan time
+        for s in queue:
+            if out[fail[s]]:
+                out[s] = out[s] + [o for o in out[fail[s]] if o not in out[s]]
+        self._built = True
+
+    def scan(self, tokens) -> list:
+        """Every phrase found in `tokens`, ordered by where it ends."""
+        if not self._built:
+            self._build()
+        goto, fail, out = self._goto, self._fail, self._out
+        spots = []
+        state = 0
+        for i, tok in enumerate(tokens):
+            w = _key(tok)
+            while state and w not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(w, 0)
+            for n, kind, value, phrase in out[state]:
+                spots.append(Spot(i + 1 - n, i + 1, kind, value, phrase))
+        return spots
@@ -0,0 +1,267 @@
+# Fleet load generator. Run:
+#   python server/loadgen.py [--devices 100] [--seconds 120] [--host 127.0.0.1] [--port 6000]
+#       [--format PCM16|ULAW|ADPCM] [--metrics http://127.0.0.1:9108/metrics] wake.wav clip1.wav clip2.wav ...
+# Every virtual device behaves like esp32/firmware.ino: HELLO line, then mic
+# audio in 512-sample blocks at real-time pace, upload paused from
+# __speaking_on__ until the reply has played (its __audio_len__ audio at 24 kHz).
+# It says the first clip (the wake word) once, then one of the others per turn,
+# each followed by silence, and waits for the answer (or TURN_TIMEOUT_S).
+# Clips are 16-bit mono WAV at any rate; silence is streamed in between.
+#
+# Reports, over all devices, the time from end of speech to: the FINAL being
+# acknowledged (__listening_off__ / __awake__), the reply text, the first audio
+# byte and the end of playback; the audio a device had to throw away because
+# the socket did not take it within MIC_BUFFER_MS (the firmware's I2S DMA
+# buffer); and the server's CPU from its /metrics endpoint.
+#
+# Run the server with DRY_RUN = True (commands are routed, not run) and
+# OPENAI_BASE_URL pointing at mock_openai.py, so hundreds of devices neither
+# open apps nor spend API credit.
+
+import random
+import socket
+import sys
+import threading
+import time
+import urllib.request
+import wave
+
+import audio_codec
+import protocol
+import resample
+
+RATE = 16000
+BLOCK_SAMPLES = 512  # firmware SAMPLES_PER_BLOCK
+BLOCK_S = BLOCK_SAMPLES / RATE
+MIC_BUFFER_MS = 64.0  # DMA buffers (8 x 64 samples) + the block being read
+GAP_MS = 1000.0  # silence after an utterance
+TURN_TIMEOUT_S = 15.0
+CONNECT_SPREAD_S = 5.0  # devices connect spread over this, not all at once
+TTS_RATE = 24000
+TTS_OFFER = "ADPCM,ULAW,PCM16"
+SAMPLES_PER_BYTE = {"PCM16": 0.5, "ULAW": 1.0, "ADPCM": 2.0}  # downstream codecs
+
+STAGES = ("ack", "reply", "audio_first", "played")
+
+
+def load_clip(path: str) -> bytes:
+    with wave.open(path, "rb") as w:
+        if w.getsampwidth() != 2 or w.getnchannels() != 1:
+            raise SystemExit(f"{path}: need 16-bit mono")
+        rate, pcm = w.getframerate(), w.readframes(w.getnframes())
+    return resample.make_resampler(rate, RATE).process_bytes(pcm)
+
+
+class Device(threading.Thread):
+    def __init__(self, idx: int, host: str, port: int, fmt: str, clips: list, seconds: float, start_delay: float):
+        super().__init__(daemon=True, name=f"sim{idx:03d}")
+        self.host, self.port, self.fmt = host, port, fmt
+        self.clips = clips
+        self.seconds = seconds
+        self.start_delay = start_delay
+        self.rng = random.Random(idx)
+        self.encoder = audio_codec.make_encoder(fmt)
+        self.latency = {s: [] for s in STAGES}  # ms after end of speech
+        self.turns = 0
+        self.timeouts = 0
+        self.sent_s = 0.0
+        self.dropped_s = 0.0
+        self.error = ""
+        self._lock = threading.Lock()
+        self._speech_end = None  # when the current turn's speech was sent
+        self._seen = set()  # stages of the current turn already recorded
+        self._answered = threading.Event()
+        self._paused_until = 0.0  # upload paused (reply playing) until this monotonic time
+        self._speaking = False
+        self._codec = "PCM16"
+        self._audio_first = None
+        self._audio_samples = 0.0
+        self._next = 0.0  # when the next mic block is due
+
+    # ---- server -> device ----
+
+    def _mark(self, stage: str, at: float):
+        with self._lock:
+            if self._speech_end is None or stage in self._seen:
+                return
+            self._seen.add(stage)
+            self.latency[stage].append((at - self._speech_end) * 1000.0)
+            if stage == "played":
+                self._answered.set()
+
+    def _read(self, sock: socket.socket):
+        f = sock.makefile("rb")
+        try:
+            while True:
+                raw = f.readline()
+                if not raw:
+                    return
+                now = time.monotonic()
+                line = raw.decode("utf-8", "replace").strip()
+                if line.startswith("__audio_len__"):
+                    n = int(line.split()[1])
+                    if len(f.read(n)) < n:
+                        return
+                    if self._audio_first is None:
+                        self._audio_first = now
+                        self._mark("audio_first", now)
+                    self._audio_samples += n * SAMPLES_PER_BYTE.get(self._codec, 0.5)
+                    self._paused_until = max(self._paused_until, self._audio_first + self._audio_samples / TTS_RATE)
+                elif line == "__speaking_on__":
+                    self._speaking = True
+                    self._audio_first, self._audio_samples = None, 0.0
+                elif line == "__speaking_off__":
+                    self._speaking = False
+                    # the firmware keeps the upload paused until its speaker is done
+                    end = max(now, self._paused_until)
+                    self._paused_until = end
+                    self._mark("played", end)
+                elif line in ("__listening_off__", "__awake__", "__sleeping__"):
+                    self._mark("ack", now)
+                elif line.startswith("__codec__"):
+                    self._codec = line.split()[-1]
+                elif line and not line.startswith("__") and line not in ("LANG_RU_OK", "LANG_EN_OK"):
+                    self._mark("reply", now)
+        except (OSError, ValueError):
+            return
+
+    # ---- device -> server ----
+
+    def _stream(self, sock: socket.socket, pcm: bytes):
+        """Sends `pcm` in mic blocks at real-time pace, like the I2S loop."""
+        step = BLOCK_SAMPLES * 2
+        for i in range(0, len(pcm), step):
+            delay = self._next - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.monotonic()
+            due, self._next = self._next, self._next + BLOCK_S
+            if self._speaking or now < self._paused_until:
+                continue  # the firmware doesn't read the mic while it talks
+            if now - due > MIC_BUFFER_MS / 1000.0:
+                self.dropped_s += BLOCK_S  # the DMA buffer overflowed meanwhile
+                continue
+            payload = self.encoder.encode(pcm[i : i + step])
+            if payload:
+                sock.sendall(payload)
+            self.sent_s += BLOCK_S
+
+    def _turn(self, sock: socket.socket, clip: bytes, silence: bytes):
+        with self._lock:
+            self._speech_end = None
+            self._seen = set()
+            self._answered.clear()
+        self._stream(sock, clip)
+        with self._lock:
+            self._speech_end = time.monotonic()
+        self.turns += 1
+        deadline = self._speech_end + TURN_TIMEOUT_S
+        while not self._answered.is_set() and time.monotonic() < deadline:
+            self._stream(sock, silence)
+        if not self._answered.is_set():
+            self.timeouts += 1
+
+    def run(self):
+        time.sleep(self.start_delay)
+        hello = {"device": self.name, "format": self.fmt, "rate": RATE, "tts": TTS_OFFER.split(",")}
+        silence = bytes(int(RATE * GAP_MS / 1000.0) * 2)
+        try:
+            with socket.create_connection((self.host, self.port), timeout=10) as sock:
+                sock.settimeout(None)
+                sock.sendall((protocol.format_hello(hello) + "\n").encode("utf-8"))
+                threading.Thread(target=self._read, args=(sock,), daemon=True, name=f"{self.name}-rx").start()
+                end = time.monotonic() + self.seconds
+                self._next = time.monotonic()
+                self._turn(sock, self.clips[0], silence)  # wake word
+                while time.monotonic() < end:
+                    self._turn(sock, self.rng.choice(self.clips[1:] or self.clips), silence)
+        except OSError as e:
+            self.error = str(e)
+
+
+# ---- report ----
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+def server_cpu(url: str) -> float | None:
+    """process_cpu_seconds_total from the server's /metrics, None if unreachable."""
+    try:
+        with urllib.request.urlopen(url, timeout=2) as r:
+            for line in r.read().decode("utf-8").splitlines():
+                if line.startswith("process_cpu_seconds_total"):
+                    return float(line.split()[-1])
+    except (OSError, ValueError):
+        return None
+    return None
+
+
+def report(devices: list, wall: float, cpu_s: float | None):
+    turns = sum(d.turns for d in devices)
+    timeouts = sum(d.timeouts for d in devices)
+    errors = [d for d in devices if d.error]
+    print(f"{len(devices)} devices, {wall:.0f}s: {turns} turns, {timeouts} unanswered, {len(errors)} connection errors")
+    for d in errors[:5]:
+        print(f"  {d.name}: {d.error}")
+    print(f"{'end of speech ->':<18} {'n':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}  (ms)")
+    for stage in STAGES:
+        values = [v for d in devices for v in d.latency[stage]]
+        print(
+            f"  {stage:<16} {len(values):>6} {percentile(values, 50):8.0f} {percentile(values, 90):8.0f} "
+            f"{percentile(values, 99):8.0f} {max(values, default=float('nan')):8.0f}"
+        )
+    sent = sum(d.sent_s for d in devices)
+    dropped = sum(d.dropped_s for d in devices)
+    dropping = sum(1 for d in devices if d.dropped_s)
+    print(
+        f"mic audio: {sent:.0f}s sent, {dropped:.1f}s dropped "
+        f"({dropped * 100.0 / (sent + dropped) if sent + dropped else 0.0:.2f}%) on {dropping} device(s)"
+    )
+    worst = sorted(devices, key=lambda d: -percentile(d.latency["audio_first"], 90) if d.latency["audio_first"] else 0)
+    print("slowest devices (p90 to first audio): " + ", ".join(
+        f"{d.name} {percentile(d.latency['audio_first'], 90):.0f}ms" for d in worst[:5] if d.latency["audio_first"]
+    ))
+    if cpu_s is not None:
+        print(f"server CPU: {cpu_s:.1f}s in {wall:.0f}s = {cpu_s * 100.0 / wall:.0f}% of one core")
+
+
+def main():
+    args = sys.argv[1:]
+
+    def opt(name, default):
+        if name not in args:
+            return default
+        i = args.index(name)
+        value = args[i + 1]
+        del args[i : i + 2]
+        return type(default)(value)
+
+    n = opt("--devices", 100)
+    seconds = opt("--seconds", 120.0)
+    host = opt("--host", "127.0.0.1")
+    port = opt("--port", 6000)
+    fmt = opt("--format", "PCM16").upper()
+    metrics_url = opt("--metrics", "http://127.0.0.1:9108/metrics")
+    if not args:
+        raise SystemExit("usage: python server/loadgen.py [options] wake.wav clip1.wav ... (see the top of the file)")
+    clips = [load_clip(p) for p in args]
+
+    cpu0 = server_cpu(metrics_url)
+    devices = [Device(i, host, port, fmt, clips, seconds, i * CONNECT_SPREAD_S / n) for i in range(n)]
+    t0 = time.monotonic()
+    for d in devices:
+        d.start()
+    for d in devices:
+        d.join()
+    wall = time.monotonic() - t0
+    cpu1 = server_cpu(metrics_url)
+    report(devices, wall, cpu1 - cpu0 if cpu0 is not None and cpu1 is not None else None)
+
+
+if __name__ == "__main__":
+    main()
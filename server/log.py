@@ -0,0 +1,212 @@
+"""
+Structured logging off the audio thread.
+
+print() on the hot path (every PARTIAL, every TTS chunk) is a synchronous
+write; when stdout is a slow pipe or journald it stalls handle_client. Here a
+call only checks the level, applies rate limiting and puts a tuple on a
+queue; a background thread formats and writes, one flush per batch.
+
+    LOG = log.get("final")
+    LOG.info("FINAL", text=norm)                     # fields become key=value
+    LOG.debug("PARTIAL", every_s=0.5, text=pnorm)    # at most one per 0.5 s per device, rest counted
+    log.set_context(device="ESP32@10.0.0.5")        # added to every line from this thread
+
+If the queue is full, lines are dropped and counted rather than blocking the
+caller.
+"""
+
+import atexit
+import json
+import queue
+import sys
+import threading
+import time
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+_NAMES = {v: k for k, v in LEVELS.items()}
+
+MAX_QUEUE = 10000
+MAX_LIMIT_KEYS = 1000
+
+_level = INFO
+_format = "text"  # or "json"
+_stream = sys.stdout
+_queue = queue.Queue(maxsize=MAX_QUEUE)
+_local = threading.local()
+_lock = threading.Lock()
+_last = {}  # rate-limit key -> (last emitted monotonic, suppressed since)
+_process = {}  # set_process_context()
+_writer = None
+dropped = 0
+
+
+def configure(level: str = "INFO", fmt: str = "text", path: str = ""):
+    """Sets the minimum level, "text" or "json" output, and a file to append to (default stdout)."""
+    global _level, _format, _stream
+    _level = LEVELS[level.upper()]
+    _format = fmt
+    if path:
+        _stream = open(path, "a", encoding="utf-8", buffering=1 << 16)
+
+
+def enabled(level: int) -> bool:
+    return level >= _level
+
+
+def set_context(**fields):
+    """Fields added to every line logged from the calling thread (None removes one)."""
+    ctx = dict(getattr(_local, "ctx", {}))
+    for k, v in fields.items():
+        if v is None:
+            ctx.pop(k, None)
+        else:
+            ctx[k] = v
+    _local.ctx = ctx
+
+
+def clear_context():
+    _local.ctx = {}
+
+
+def set_process_context(**fields):
+    """Fields added to every line from this process, any thread (a worker's number, say)."""
+    global _process
+    _process = {**_process, **fields}
+
+
+class Logger:
+    def __init__(self, name: str, fields: dict | None = None):
+        self.name = name
+        self.fields = fields or {}
+
+    def bind(self, **fields) -> "Logger":
+        """A logger that adds `fields` to every line."""
+        return Logger(self.name, {**self.fields, **fields})
+
+    def log(self, level: int, msg: str, every_s: float = 0.0, **fields):
+        if level < _level:
+            return
+        ctx = getattr(_local, "ctx", None)
+        if every_s:
+            # per device, so one device's PARTIALs don't hide another's
+            source = (ctx or {}).get("device") or threading.current_thread().name
+            suppressed = _limit((self.name, msg, source), every_s)
+            if suppressed is None:
+                return
+            if suppressed:
+                fields["suppressed"] = suppressed
+        if ctx or self.fields or _process:
+            fields = {**_process, **(ctx or {}), **self.fields, **fields}
+        _put((time.time(), level, self.name, msg, fields, threading.current_thread().name))
+
+    def debug(self, msg: str, **kw):
+        self.log(DEBUG, msg, **kw)
+
+    def info(self, msg: str, **kw):
+        self.log(INFO, msg, **kw)
+
+    def warning(self, msg: str, **kw):
+        self.log(WARNING, msg, **kw)
+
+    def error(self, msg: str, **kw):
+        self.log(ERROR, msg, **kw)
+
+
+def get(name: str) -> Logger:
+    return Logger(name)
+
+
+def _limit(key, every_s: float) -> int | None:
+    """None = drop this one; otherwise how many were dropped since the last one."""
+    now = time.monotonic()
+    with _lock:
+        last, suppressed = _last.get(key, (0.0, 0))
+        if now - last < every_s:
+            _last[key] = (last, suppressed + 1)
+            return None
+        if len(_last) >= MAX_LIMIT_KEYS:  # devices and threads come and go
+            for k, (t, _) in list(_last.items()):
+                if now - t > every_s:
+                    del _last[k]
+        _last[key] = (now, 0)
+        return suppressed
+
+
+def _put(record):
+    global dropped
+    _start()
+    try:
+        _queue.put_nowait(record)
+    except queue.Full:
+        with _lock:  # several threads may find the queue full at once
+            dropped += 1
+
+
+# ---- writer thread ----
+
+
+def _format_record(record) -> str:
+    ts, level, name, msg, fields, thread = record
+    if _format == "json":
+        out = {"ts": round(ts, 3), "level": _NAMES.get(level, level), "logger": name, "msg": msg, "thread": thread}
+        out.update(fields)
+        return json.dumps(out, ensure_ascii=False, default=str)
+    stamp = time.strftime("%H:%M:%S", time.localtime(ts)) + f".{int(ts % 1 * 1000):03d}"
+    line = f"{stamp} {_NAMES.get(level, level):<7} {name:<9} {msg}"
+    if fields:
+        line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+    return line
+
+
+def _write_loop():
+    reported = 0
+    while True:
+        batch = [_queue.get()]
+        try:
+            while len(batch) < 512:
+                batch.append(_queue.get_nowait())
+        except queue.Empty:
+            pass
+        lines = []
+        for record in batch:
+            if record is None:
+                continue
+            try:
+                lines.append(_format_record(record))
+            except Exception as e:
+                lines.append(f"log: could not format {record[3]!r}: {e}")
+        if dropped != reported:
+            lines.append(f"log: {dropped - reported} line(s) dropped, queue full")
+            reported = dropped
+        try:
+            if lines:
+                _stream.write("\n".join(lines) + "\n")
+                _stream.flush()
+        except (OSError, ValueError):
+            pass
+        for _ in batch:
+            _queue.task_done()
+
+
+def _start():
+    global _writer
+    if _writer is not None:
+        return
+    with _lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, daemon=True, name="log-writer")
+            _writer.start()
+
+
+def flush(timeout_s: float = 2.0):
+    """Waits (up to timeout_s) until everything queued so far is written."""
+    if _writer is None:
+        return
+    deadline = time.monotonic() + timeout_s
+    _queue.put(None)  # wakes the writer even if nothing else is queued
+    while _queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+atexit.register(flush)
@@ -0,0 +1,129 @@
+"""
+Prometheus text-format metrics on a local HTTP port.
+
+MetricsServer answers GET /metrics with whatever its `collect` callable
+returns; histogram_lines() turns stats.Histogram objects (ms buckets) into
+Prometheus histogram series (seconds, cumulative buckets). Point a Prometheus
+scrape job, or just curl, at http://127.0.0.1:<port>/metrics.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import log
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LOG = log.get("metrics")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels.items():
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def histogram_lines(name: str, help_text: str, series) -> list:
+    """series: iterable of (labels dict, stats.Histogram)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, hist in series:
+        counts, count, total = hist.snapshot()
+        seen = 0
+        for bound, c in zip(hist.buckets, counts):
+            seen += c
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': f'{bound / 1000.0:g}'})} {seen}")
+        lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {total / 1000.0:.6f}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+    return lines
+
+
+def counter_lines(name: str, help_text: str, series) -> list:
+    """series: iterable of (labels dict, value)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    lines += [f"{name}{_labels(labels)} {value}" for labels, value in series]
+    return lines
+
+
+def gauge_lines(name: str, help_text: str, series) -> list:
+    """series: iterable of (labels dict, value)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    lines += [f"{name}{_labels(labels)} {value}" for labels, value in series]
+    return lines
+
+
+def merged_lines(series) -> list:
+    """
+    Several processes' exposition texts as one, every sample with extra
+    labels. series: iterable of (labels dict, text). Each family keeps the
+    HELP/TYPE lines of the first text that has it.
+    """
+    families = {}  # name -> ({"HELP": line, "TYPE": line}, samples)
+    for labels, text in series:
+        extra = _labels(labels)[1:-1]
+        family = None
+        for line in text.splitlines():
+            if line.startswith("#"):
+                parts = line.split(None, 3)
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    family = families.setdefault(parts[2], ({}, []))
+                    family[0].setdefault(parts[1], line)
+                continue
+            if not line or family is None:
+                continue
+            series_name, value = line.rsplit(" ", 1)
+            if extra:
+                if series_name.endswith("}"):
+                    series_name = series_name[:-1] + "," + extra + "}"
+                else:
+                    series_name += "{" + extra + "}"
+            family[1].append(f"{series_name} {value}")
+    lines = []
+    for head, samples in families.values():
+        lines += [head[k] for k in ("HELP", "TYPE") if k in head] + samples
+    return lines
+
+
+class MetricsServer:
+    def __init__(self, collect, host: str = "127.0.0.1", port: int = 9108):
+        self.collect = collect  # () -> exposition text
+        self.host = host
+        self.port = port
+        self._server = None
+
+    def start(self):
+        collect = self.collect
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                try:
+                    body = collect().encode("utf-8")
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_port  # port 0 = any free port
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="metrics").start()
+        LOG.info(f"metrics on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,130 @@
+# Stand-in for the OpenAI API, so load tests (loadgen.py) cost nothing and
+# don't depend on OpenAI's latency on the day.
+#
+#   python server/mock_openai.py [--port 8099] [--first-token-ms 300] [--tts-first-ms 250]
+#
+# then set OPENAI_BASE_URL = "http://127.0.0.1:8099/v1" in final.py.
+# Serves the two calls final.py makes:
+#   POST /v1/chat/completions (stream=True)  a short reply, one word per SSE chunk
+#   POST /v1/audio/speech (response_format=pcm)  24 kHz PCM16, SPEECH_MS_PER_CHAR
+#       of quiet noise per input character, streamed at playback speed x TTS_SPEEDUP
+# Latencies are fixed plus up to --jitter-ms of random extra.
+
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PORT = 8099
+FIRST_TOKEN_MS = 300.0
+TOKEN_MS = 15.0
+TTS_FIRST_MS = 250.0
+JITTER_MS = 100.0
+SPEECH_MS_PER_CHAR = 60.0
+TTS_RATE = 24000
+TTS_SPEEDUP = 4.0  # OpenAI sends audio faster than it plays
+CHUNK = 4096
+
+stats = {"chat": 0, "speech": 0}
+_lock = threading.Lock()
+
+
+def _sleep_ms(ms: float):
+    time.sleep((ms + random.uniform(0.0, JITTER_MS)) / 1000.0)
+
+
+def _count(kind: str):
+    with _lock:
+        stats[kind] += 1
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.endswith("/chat/completions"):
+            self.chat(body)
+        elif self.path.endswith("/audio/speech"):
+            self.speech(body)
+        else:
+            self.send_error(404)
+
+    def chat(self, body: dict):
+        _count("chat")
+        question = str((body.get("messages") or [{}])[-1].get("content", ""))
+        words = f"Mock reply to {question[:40]}".split()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        _sleep_ms(FIRST_TOKEN_MS)
+        for i, w in enumerate(words):
+            if i:
+                time.sleep(TOKEN_MS / 1000.0)
+            chunk = {
+                "id": "mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "delta": {"content": (" " if i else "") + w}, "finish_reason": None}],
+            }
+            self.event(json.dumps(chunk))
+        self.event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def event(self, data: str):
+        payload = f"data: {data}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+        self.wfile.flush()
+
+    def speech(self, body: dict):
+        _count("speech")
+        n = int(len(str(body.get("input", ""))) * SPEECH_MS_PER_CHAR / 1000.0 * TTS_RATE) * 2
+        audio = bytes(random.getrandbits(8) & 0x07 for _ in range(min(n, 4096))) * (n // 4096 + 1)
+        audio = audio[:n]
+        _sleep_ms(TTS_FIRST_MS)
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/pcm")
+        self.send_header("Content-Length", str(len(audio)))
+        self.end_headers()
+        per_chunk_s = CHUNK / (TTS_RATE * 2) / TTS_SPEEDUP
+        for i in range(0, len(audio), CHUNK):
+            self.wfile.write(audio[i : i + CHUNK])
+            self.wfile.flush()
+            time.sleep(per_chunk_s)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port: int = PORT) -> ThreadingHTTPServer:
+    """Starts the mock on a background thread (port 0 = any free port)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="mock-openai").start()
+    return server
+
+
+def main():
+    global FIRST_TOKEN_MS, TTS_FIRST_MS, JITTER_MS
+    args = sys.argv[1:]
+
+    def opt(name, default):
+        return float(args[args.index(name) + 1]) if name in args else default
+
+    FIRST_TOKEN_MS = opt("--first-token-ms", FIRST_TOKEN_MS)
+    TTS_FIRST_MS = opt("--tts-first-ms", TTS_FIRST_MS)
+    JITTER_MS = opt("--jitter-ms", JITTER_MS)
+    server = serve(int(opt("--port", PORT)))
+    print(f"mock OpenAI on http://127.0.0.1:{server.server_port}/v1")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"chat={stats['chat']} speech={stats['speech']}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Local index of Apple Music playlists.
+
+mac_music_play_playlist() used to ask Music for `first playlist whose name
+is "<what Vosk heard>"`, so any mis-hearing failed. PlaylistIndex loads every
+playlist (persistent ID + name) once, keeps it fresh in the background and
+resolves a spoken name locally with fuzzy.NgramIndex. Only the final "play
+this ID" goes to Music.
+
+The library is any callable returning [(persistent_id, name), ...], or
+None when it can't say right now: music_library() asks Music through
+AppleScript, and only if Music is already running (asking would launch it);
+tools pass a fake one.
+"""
+
+import threading
+import time
+from typing import NamedTuple
+
+import fuzzy
+import log
+
+REFRESH_S = 300.0
+MIN_SCORE = 0.55  # below this a spoken name does not count as a playlist
+
+LOG = log.get("playlists")
+
+
+class Playlist(NamedTuple):
+    pid: str  # Music persistent ID
+    name: str
+
+
+# name and ID lists come back in the same order; two bulk reads are far
+# faster than a loop over the playlists. `tell` would launch Music, so a
+# server start (or a refresh after the user quit it) checks first.
+NOT_RUNNING = "NOT RUNNING"
+LIBRARY_SCRIPT = f"""
+if application "Music" is not running then return "{NOT_RUNNING}"
+tell application "Music"
+    set ids to persistent ID of every playlist
+    set names to name of every playlist
+end tell
+set out to ""
+repeat with i from 1 to count of ids
+    set out to out & (item i of ids) & tab & (item i of names) & linefeed
+end repeat
+return out
+"""
+
+
+def music_library(run_script) -> list | None:
+    """
+    Playlists in the Music app, None if it isn't running.
+    run_script(script) -> ActionResult (automation.py).
+    """
+    r = run_script(LIBRARY_SCRIPT)
+    if not r.ok:
+        raise OSError(f"Music: {r.out}")
+    if r.out.strip() == NOT_RUNNING:
+        return None
+    out = []
+    for line in r.out.splitlines():
+        pid, _, name = line.partition("\t")
+        if pid and name:
+            out.append((pid, name))
+    return out
+
+
+class PlaylistIndex:
+    def __init__(self, library, refresh_s: float = REFRESH_S, min_score: float = MIN_SCORE):
+        self.library = library
+        self.refresh_s = refresh_s
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        self._index = fuzzy.NgramIndex()  # name -> Playlist
+        self._by_pid = {}  # pid -> Playlist
+        self._by_key = {}  # normalized name -> pids (names need not be unique)
+        self.loaded = False
+        self.refreshes = 0
+        self.last_refresh_ms = 0.0
+
+    def refresh(self) -> tuple[int, int]:
+        """
+        Re-reads the library and applies only what changed. Returns (added,
+        removed); (0, 0) and nothing changes if the library is unavailable.
+        """
+        t0 = time.monotonic()
+        library = self.library()
+        if library is None:
+            return 0, 0  # what was loaded stays (Music quit: its playlists didn't change)
+        fresh = {pid: Playlist(pid, name) for pid, name in library}
+
+        with self._lock:
+            gone = [p for pid, p in self._by_pid.items() if fresh.get(pid) != p]
+            new = [p for pid, p in fresh.items() if self._by_pid.get(pid) != p]
+            for p in gone:
+                del self._by_pid[p.pid]
+                key = fuzzy.normalize(p.name)
+                same = self._by_key[key]
+                same.discard(p.pid)
+                if same:
+                    # another playlist with the same name takes over the index entry
+                    self._index.add(key, self._by_pid[next(iter(same))])
+                else:
+                    del self._by_key[key]
+                    self._index.remove(key)
+            for p in new:
+                self._by_pid[p.pid] = p
+                self._by_key.setdefault(fuzzy.normalize(p.name), set()).add(p.pid)
+                self._index.add(p.name, p)
+            self.loaded = True
+
+        self.refreshes += 1
+        self.last_refresh_ms = (time.monotonic() - t0) * 1000.0
+        return len(new), len(gone)
+
+    def start(self):
+        """Loads the library in the background and refreshes it every refresh_s."""
+
+        def loop():
+            while True:
+                try:
+                    added, removed = self.refresh()
+                    if added or removed:
+                        LOG.info(f"playlists: +{added} -{removed}, {len(self)} total", ms=f"{self.last_refresh_ms:.0f}")
+                except Exception as e:
+                    LOG.warning("playlists refresh error", error=e)
+                time.sleep(self.refresh_s)
+
+        threading.Thread(target=loop, daemon=True, name="playlists").start()
+
+    def __len__(self) -> int:
+        return len(self._by_pid)
+
+    def resolve(self, spoken: str) -> Playlist | None:
+        """The playlist the user most likely meant, or None."""
+        with self._lock:
+            m = self._index.best(spoken, self.min_score)
+        return m.value if m is not None else None
+
+    def names(self, contains: str = "") -> list:
+        needle = fuzzy.normalize(contains)
+        with self._lock:
+            playlists = list(self._by_pid.values())
+        return sorted(p.name for p in playlists if needle in fuzzy.normalize(p.name))
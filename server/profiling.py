@@ -0,0 +1,364 @@
+"""
+On-demand profiling of the running server, results written to files.
+
+A line-based control socket on localhost (PROFILE_PORT in final.py):
+
+    echo "sample 10" | nc 127.0.0.1 9109
+
+    stacks              every thread's current stack
+    sample N [MS]       sampling profiler over all threads for N s (a sample every MS ms):
+                        collapsed stacks (.folded, for speedscope or flamegraph.pl) + a top list
+    cprofile N          cProfile for N s (.pstats + a text summary sorted by cumulative time)
+    mem start [FRAMES]  start tracemalloc
+    mem snap            snapshot: top allocations, and the diff against the previous snapshot
+    mem stop            stop tracemalloc
+    status
+
+Each command answers with the path(s) it wrote. Signals do the same without a
+socket: SIGUSR1 dumps stacks, SIGUSR2 samples for SIGNAL_SAMPLE_S seconds.
+
+cProfile hooks only the thread that enables it before Python 3.12. There,
+long-running loops call tick(): while a cProfile window is open, each thread
+enables its own profiler on its next tick, hands the stats in on the first
+tick after the window, and the files contain every thread that ticked.
+From 3.12 on one profiler sees all threads and tick() does nothing.
+"""
+
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import signal
+import socketserver
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+import log
+
+OUT_DIR = "profiles"
+SAMPLE_MS = 10.0
+SIGNAL_SAMPLE_S = 10.0
+MAX_SECONDS = 600.0
+TOP = 40
+HAND_IN_S = 1.0  # how long a cProfile window waits for threads to hand their stats in
+
+LOG = log.get("profiling")
+
+_ALL_THREADS = sys.version_info >= (3, 12)
+_busy = threading.Lock()  # one sample/cprofile run at a time
+_local = threading.local()
+_window = None  # open per-thread cProfile window (before 3.12)
+_last_snapshot = None
+_seq = itertools.count(1)  # two files of one kind in the same millisecond still differ
+
+
+def _path(kind: str, ext: str) -> str:
+    os.makedirs(OUT_DIR, exist_ok=True)
+    now = time.time()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f".{int(now * 1000) % 1000:03d}"
+    return os.path.join(OUT_DIR, f"{kind}-{stamp}-{os.getpid()}-{next(_seq)}.{ext}")
+
+
+def _thread_names() -> dict:
+    return {t.ident: t.name for t in threading.enumerate()}
+
+
+def _label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# ---- stacks ----
+
+
+def dump_stacks() -> str:
+    names = _thread_names()
+    out = []
+    for ident, frame in sys._current_frames().items():
+        out.append(f"--- thread {names.get(ident, '?')} ({ident})")
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"  {code.co_filename}:{frame.f_lineno} in {code.co_name}")
+            frame = frame.f_back
+        out.extend(reversed(stack))
+        out.append("")
+    path = _path("stacks", "txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(out))
+    return path
+
+
+# ---- sampling profiler ----
+
+
+def sample(seconds: float, interval_ms: float = SAMPLE_MS) -> tuple[str, str]:
+    """Samples every thread's stack for `seconds`. Returns (.folded path, summary path)."""
+    seconds = min(seconds, MAX_SECONDS)
+    me = threading.get_ident()
+    stacks = Counter()
+    n = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = _thread_names()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            stacks[tuple(reversed(stack))] += 1
+        n += 1
+        time.sleep(interval_ms / 1000.0)
+
+    folded = _path("sample", "folded")
+    with open(folded, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(";".join(s.replace(";", ",") for s in stack) + f" {count}\n")
+
+    own, total = Counter(), Counter()
+    for stack, count in stacks.items():
+        own[(stack[0], stack[-1])] += count
+        for fn in set(stack[1:]):
+            total[(stack[0], fn)] += count
+    lines = [f"{n} samples every {interval_ms:g}ms over {seconds:g}s", "", "self (thread, function):"]
+    lines += [f"  {c * 100.0 / n:5.1f}%  {t}  {fn}" for (t, fn), c in own.most_common(TOP)]
+    lines += ["", "total (thread, function):"]
+    lines += [f"  {c * 100.0 / n:5.1f}%  {t}  {fn}" for (t, fn), c in total.most_common(TOP)]
+    summary = _path("sample", "txt")
+    with open(summary, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return folded, summary
+
+
+# ---- cProfile ----
+
+
+class _Window:
+    def __init__(self):
+        self.open = True
+        self.stats = []  # (thread name, pstats-ready Profile)
+        self.joined = 0
+        self.lock = threading.Lock()
+
+
+def tick():
+    """Called from long-running loops; see the module docstring."""
+    if _ALL_THREADS:
+        return
+    mine = getattr(_local, "profile", None)
+    if mine is None:
+        w = _window
+        if w is None or not w.open:
+            return
+        p = cProfile.Profile()
+        _local.profile = (w, p)
+        with w.lock:
+            w.joined += 1
+        p.enable()
+        return
+    w, p = mine
+    if w.open:
+        return
+    p.disable()
+    _local.profile = None
+    with w.lock:
+        w.stats.append((threading.current_thread().name, p))
+
+
+def cprofile(seconds: float) -> tuple[str, str]:
+    """cProfile for `seconds`. Returns (.pstats path, summary path)."""
+    global _window
+    seconds = min(seconds, MAX_SECONDS)
+    note = ""
+    if _ALL_THREADS:
+        p = cProfile.Profile()
+        p.enable()
+        time.sleep(seconds)
+        p.disable()
+        stats = pstats.Stats(p)
+    else:
+        w = _window = _Window()
+        time.sleep(seconds)
+        w.open = False
+        _window = None
+        deadline = time.monotonic() + HAND_IN_S
+        while len(w.stats) < w.joined and time.monotonic() < deadline:
+            time.sleep(0.02)
+        with w.lock:
+            handed = list(w.stats)
+            missing = w.joined - len(handed)
+        if not handed:
+            raise RuntimeError("no thread called tick() during the window")
+        stats = pstats.Stats(handed[0][1])
+        for _, p in handed[1:]:
+            stats.add(p)
+        note = f"threads: {', '.join(name for name, _ in handed)}"
+        if missing:
+            note += f" ({missing} more did not hand in within {HAND_IN_S:g}s)"
+
+    raw = _path("cprofile", "pstats")
+    stats.dump_stats(raw)
+    text = io.StringIO()
+    if note:
+        text.write(note + "\n")
+    stats.stream = text
+    stats.sort_stats("cumulative").print_stats(TOP)
+    summary = _path("cprofile", "txt")
+    with open(summary, "w", encoding="utf-8") as f:
+        f.write(text.getvalue())
+    return raw, summary
+
+
+# ---- tracemalloc ----
+
+
+_MEM_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+]
+
+
+def mem_start(frames: int = 1) -> str:
+    global _last_snapshot
+    if tracemalloc.is_tracing():
+        return "tracemalloc already on"
+    tracemalloc.start(frames)
+    _last_snapshot = None
+    return f"tracemalloc on ({frames} frame(s))"
+
+
+def mem_stop() -> str:
+    global _last_snapshot
+    tracemalloc.stop()
+    _last_snapshot = None
+    return "tracemalloc off"
+
+
+def mem_snapshot() -> str:
+    """Top allocations now, and the growth since the previous snapshot. Returns the path."""
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is off (mem start)")
+    snap = tracemalloc.take_snapshot().filter_traces(_MEM_FILTERS)
+    key = "traceback" if tracemalloc.get_traceback_limit() > 1 else "lineno"
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"traced {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB", "", "top allocations:"]
+    for stat in snap.statistics(key)[:TOP]:
+        lines.append(f"  {stat}")
+        if key == "traceback":
+            lines += [f"      {line}" for line in stat.traceback.format()]
+    if _last_snapshot is not None:
+        lines += ["", "since the previous snapshot:"]
+        lines += [f"  {stat}" for stat in snap.compare_to(_last_snapshot, key)[:TOP]]
+    _last_snapshot = snap
+    path = _path("mem", "txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    snap.dump(path[:-4] + ".snap")  # tracemalloc.Snapshot.load() for offline analysis
+    return path
+
+
+# ---- control ----
+
+
+def _exclusive(fn, *args):
+    if not _busy.acquire(blocking=False):
+        raise RuntimeError("another profile is running")
+    try:
+        return fn(*args)
+    finally:
+        _busy.release()
+
+
+def run_command(line: str) -> str:
+    """Runs one control command; returns the reply."""
+    words = line.split()
+    if not words:
+        return ""
+    cmd, args = words[0].lower(), words[1:]
+    try:
+        if cmd == "stacks":
+            return dump_stacks()
+        if cmd == "sample":
+            return " ".join(_exclusive(sample, *map(float, args[:2] or ["10"])))
+        if cmd == "cprofile":
+            return " ".join(_exclusive(cprofile, float(args[0] if args else 10)))
+        if cmd == "mem":
+            sub = args[0] if args else "snap"
+            if sub == "start":
+                return mem_start(int(args[1]) if len(args) > 1 else 1)
+            if sub == "stop":
+                return mem_stop()
+            if sub == "snap":
+                return mem_snapshot()
+        if cmd == "status":
+            return (
+                f"pid {os.getpid()}, {threading.active_count()} threads, "
+                f"profile {'running' if _busy.locked() else 'idle'}, "
+                f"tracemalloc {'on' if tracemalloc.is_tracing() else 'off'}"
+            )
+        return "commands: stacks | sample N [MS] | cprofile N | mem start [FRAMES] | mem snap | mem stop | status"
+    except (ValueError, RuntimeError, OSError) as e:
+        return f"error: {e}"
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ControlServer:
+    """The control socket; one thread per connection, so a long sample doesn't block `stacks`."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9109):
+        self.host = host
+        self.port = port
+        self._server = None
+
+    def start(self):
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for raw in self.rfile:
+                    line = raw.decode("utf-8", "replace").strip()
+                    if not line:
+                        continue
+                    LOG.info("profile command", command=line)
+                    reply = run_command(line)
+                    LOG.info("profile done", command=line, reply=reply)
+                    self.wfile.write(reply.encode("utf-8") + b"\n")
+
+        self._server = _TCPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]  # port 0 = any free port
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="profiling").start()
+        LOG.info(f"profiling control on {self.host}:{self.port}")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def install_signals():
+    """SIGUSR1: dump stacks, SIGUSR2: sample for SIGNAL_SAMPLE_S. Call from the main thread."""
+    if not hasattr(signal, "SIGUSR1"):
+        return
+
+    def in_background(line):
+        def handler(signum, frame):
+            def run():
+                LOG.info("profile signal", command=line, reply=run_command(line))
+
+            threading.Thread(target=run, daemon=True, name="profiling").start()
+
+        return handler
+
+    signal.signal(signal.SIGUSR1, in_background("stacks"))
+    signal.signal(signal.SIGUSR2, in_background(f"sample {SIGNAL_SAMPLE_S:g}"))
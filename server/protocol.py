@@ -0,0 +1,71 @@
+"""
+ESP32 handshake.
+
+The firmware opens every connection with one text line:
+
+    HELLO ESP32 PCM16 16000 TTS=ADPCM,ULAW,PCM16
+
+Positional fields: device name, upstream audio format, upstream sample rate.
+Optional KEY=VALUE fields follow. TTS lists the downstream codecs the device
+can decode, most preferred first. Old firmware sends no TTS field and gets
+raw PCM16, exactly as before.
+"""
+
+from audio_codec import CODECS
+
+# device sample rates the ingest resampler accepts
+MIN_RATE = 8000
+MAX_RATE = 96000
+
+DEFAULT_HELLO = {
+    "device": "ESP32",
+    "format": "PCM16",
+    "rate": 16000,
+    "tts": ["PCM16"],
+}
+
+
+def parse_hello(line: str) -> dict:
+    """
+    Parses a HELLO line into a dict (see DEFAULT_HELLO for keys).
+    Unknown or malformed fields fall back to the defaults.
+    """
+    info = {k: (list(v) if isinstance(v, list) else v) for k, v in DEFAULT_HELLO.items()}
+
+    parts = (line or "").strip().split()
+    if not parts or parts[0].upper() != "HELLO":
+        return info
+
+    positional = [p for p in parts[1:] if "=" not in p]
+    options = dict(p.split("=", 1) for p in parts[1:] if "=" in p)
+
+    if len(positional) > 0:
+        info["device"] = positional[0]
+    if len(positional) > 1 and positional[1].upper() in CODECS:
+        info["format"] = positional[1].upper()
+    if len(positional) > 2 and positional[2].isdigit():
+        rate = int(positional[2])
+        if MIN_RATE <= rate <= MAX_RATE:
+            info["rate"] = rate
+
+    tts = [c.strip().upper() for c in options.get("TTS", "").split(",") if c.strip()]
+    if tts:
+        info["tts"] = tts
+
+    return info
+
+
+def format_hello(info: dict) -> str:
+    """The HELLO line for parsed `info` (parse_hello(format_hello(info)) == info)."""
+    return f"HELLO {info['device']} {info['format']} {info['rate']} TTS={','.join(info['tts'])}"
+
+
+def negotiate_codec(offered: list, allowed: tuple) -> str:
+    """
+    Picks the first codec the device offered that the server allows.
+    Falls back to PCM16, which every device understands.
+    """
+    for c in offered or ():
+        if c in allowed and c in CODECS:
+            return c
+    return "PCM16"
@@ -0,0 +1,90 @@
+"""
+Waiting for something outside the server to become ready (a page to render,
+a video element to appear) without fixed sleeps.
+
+wait_until() calls check() right away, then again after 50 ms, 80 ms, 128 ms...
+(capped at max_delay) until it returns something truthy or the deadline
+passes. Fast targets are seen within one short step; slow ones are not
+polled hundreds of times. Sleeps go through command_exec.sleep(), so a
+cancelled command stops waiting at once.
+
+Every named wait records how long it took; report() prints them on disconnect.
+"""
+
+import threading
+import time
+from typing import Any, NamedTuple
+
+import command_exec
+import log
+import stats
+
+FIRST_DELAY_S = 0.05
+MAX_DELAY_S = 0.4
+BACKOFF = 1.6
+
+LOG = log.get("readiness")
+
+
+class WaitResult(NamedTuple):
+    ok: bool
+    value: Any  # last value check() returned
+    attempts: int
+    elapsed_ms: float
+
+
+_lock = threading.Lock()
+WAIT_TIMES = {}  # name -> Histogram of ms until ready (or until giving up)
+WAIT_COUNTS = {}  # name -> [ready, timed out, attempts]
+
+
+def _record(name: str, r: WaitResult):
+    with _lock:
+        hist = WAIT_TIMES.setdefault(name, stats.Histogram())
+        counts = WAIT_COUNTS.setdefault(name, [0, 0, 0])
+    hist.observe(r.elapsed_ms)
+    with _lock:
+        counts[0 if r.ok else 1] += 1
+        counts[2] += r.attempts
+
+
+def wait_until(
+    check,
+    timeout_s: float,
+    name: str = "",
+    first_delay_s: float = FIRST_DELAY_S,
+    max_delay_s: float = MAX_DELAY_S,
+) -> WaitResult:
+    t0 = time.monotonic()
+    deadline = t0 + timeout_s
+    delay = first_delay_s
+    attempts = 0
+    while True:
+        value = check()
+        attempts += 1
+        now = time.monotonic()
+        if value or now >= deadline:
+            r = WaitResult(bool(value), value, attempts, (now - t0) * 1000.0)
+            break
+        command_exec.sleep(min(delay, deadline - now))
+        delay = min(delay * BACKOFF, max_delay_s)
+
+    if name:
+        _record(name, r)
+        LOG.debug(f"WAIT {name}: {'ready' if r.ok else 'timed out'}", ms=f"{r.elapsed_ms:.0f}", checks=r.attempts)
+    return r
+
+
+def report() -> str:
+    with _lock:
+        names = sorted(WAIT_TIMES)
+    lines = []
+    for name in names:
+        ready, timed_out, attempts = WAIT_COUNTS[name]
+        total = ready + timed_out
+        lines.append(
+            f"wait {name}: ready={ready} timed out={timed_out} "
+            f"checks/wait={attempts / total if total else 0:.1f}"
+        )
+        lines.append(WAIT_TIMES[name].render(f"wait {name}"))
+    return "\n".join(lines)
@@ -0,0 +1,66 @@
+"""
+Raw device sessions on disk, for replay.py.
+
+A recording is what handle_client read from the socket after the HELLO line,
+byte for byte (audio and the __lang_xx__ markers in between), with the time
+each recv() returned:
+
+    {"hello": "HELLO ESP32 PCM16 16000 TTS=ADPCM", "lang": "ru", "started": 1760000000.0}\\n
+    then per recv: <float64 seconds since start> <uint32 length> <bytes>   (little-endian)
+"""
+
+import json
+import os
+import re
+import struct
+import time
+from typing import NamedTuple
+
+_RECORD = struct.Struct("<dI")
+_SAFE_RE = re.compile(r"[^\w.@-]+")
+
+
+class Recording(NamedTuple):
+    header: dict  # hello line, language at the start, wall-clock start
+    chunks: list  # [(seconds since start, bytes)]
+
+    @property
+    def duration_s(self) -> float:
+        return self.chunks[-1][0] if self.chunks else 0.0
+
+
+class Recorder:
+    def __init__(self, path: str, hello_line: str, lang: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._f = open(path, "wb", buffering=1 << 16)
+        self._t0 = time.monotonic()
+        header = {"hello": hello_line, "lang": lang, "started": time.time()}
+        self._f.write(json.dumps(header).encode("utf-8") + b"\n")
+
+    def write(self, data: bytes):
+        if data:
+            self._f.write(_RECORD.pack(time.monotonic() - self._t0, len(data)))
+            self._f.write(data)
+
+    def close(self):
+        self._f.close()
+
+
+def new_path(out_dir: str, device: str) -> str:
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(out_dir, f"{_SAFE_RE.sub('_', device)}-{stamp}.rec")
+
+
+def load(path: str) -> Recording:
+    with open(path, "rb") as f:
+        header = json.loads(f.readline())
+        body = f.read()
+    chunks = []
+    i = 0
+    while i + _RECORD.size <= len(body):
+        t, n = _RECORD.unpack_from(body, i)
+        i += _RECORD.size
+        chunks.append((t, body[i : i + n]))
+        i += n
+    return Recording(header, chunks)
@@ -0,0 +1,101 @@
+# Session replay. Run: python server/replay.py [--realtime] [--live] [-v] recordings/*.rec
+# Feeds sessions recorded with RECORD = True (final.py) back through
+# final.handle_client() over a socket pair, so they take the same path as a
+# live device: HELLO, decoder, resampler, endpointer, both recognizers and
+# routing. By default as fast as handle_client reads (--realtime keeps the
+# recorded timing) and with DRY_RUN and OFFLINE on (--live runs the commands,
+# calls GPT and synthesizes replies).
+# Prints, per recording and in total: audio length, wall time, real-time factor
+# (wall / audio and CPU / audio), finals per second and CPU per stage, so
+# recognizer and model changes can be compared on the same audio.
+# Imports final.py and loads its Vosk models (MODEL_RU / MODEL_EN).
+
+import socket
+import sys
+import threading
+import time
+
+import final
+import log
+import recording
+import stats
+
+
+def drain(sock: socket.socket):
+    """Reads (and drops) what the server sends, so its sends never block."""
+    try:
+        while sock.recv(4096):
+            pass
+    except OSError:
+        pass
+
+
+def since(before: tuple, after: tuple) -> stats.StageCPU:
+    """What STAGE_CPU gained between two snapshots."""
+    d = stats.StageCPU()
+    d.seconds = {k: v - before[0].get(k, 0.0) for k, v in after[0].items()}
+    d.counts = {k: v - before[1].get(k, 0) for k, v in after[1].items()}
+    return d
+
+
+def replay(rec: recording.Recording, realtime: bool) -> tuple[float, stats.StageCPU]:
+    """Runs one recording through handle_client. Returns (wall seconds, CPU by stage)."""
+    final.DEFAULT_LANG = rec.header.get("lang", final.DEFAULT_LANG)  # a new connection starts in it
+    final.LAST_LANG.clear()
+    before = final.STAGE_CPU.snapshot()
+    server, device = socket.socketpair()
+    handler = threading.Thread(target=final.handle_client, args=(server, ("replay", 0)), name="handle_client")
+    drainer = threading.Thread(target=drain, args=(device,), daemon=True)
+
+    t0 = time.perf_counter()
+    handler.start()
+    drainer.start()
+    device.sendall(rec.header["hello"].encode("utf-8") + b"\n")
+    for t, data in rec.chunks:
+        if realtime:
+            delay = t0 + t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        device.sendall(data)
+    device.shutdown(socket.SHUT_WR)
+    handler.join()
+    wall = time.perf_counter() - t0
+    device.close()
+    return wall, since(before, final.STAGE_CPU.snapshot())
+
+
+def summary(title: str, wall: float, cpu: stats.StageCPU) -> str:
+    audio = cpu.counts.get("audio_s", 0.0)
+    finals = cpu.counts.get("finals", 0)
+    head = f"{title}: {audio:.1f}s audio in {wall:.2f}s wall"
+    if audio:
+        head += f", RTF {wall / audio:.3f} wall"
+    head += f", {finals:g} finals ({finals / wall if wall else 0.0:.2f}/s)"
+    return head + "\n" + cpu.render("  CPU", audio)
+
+
+def main():
+    args = sys.argv[1:]
+    paths = [a for a in args if not a.startswith("-")]
+    if not paths:
+        raise SystemExit("usage: python server/replay.py [--realtime] [--live] [-v] recordings/*.rec")
+    realtime = "--realtime" in args
+    final.DRY_RUN = final.OFFLINE = "--live" not in args
+    log.configure("INFO" if "-v" in args else "WARNING")
+
+    final.load_models()
+    total = stats.StageCPU()
+    total_wall = 0.0
+    for path in paths:
+        rec = recording.load(path)
+        wall, cpu = replay(rec, realtime)
+        total.merge(cpu)
+        total_wall += wall
+        print(summary(path, wall, cpu))
+    if len(paths) > 1:
+        print(summary(f"total ({len(paths)} sessions)", total_wall, total))
+    log.flush()
+
+
+if __name__ == "__main__":
+    main()
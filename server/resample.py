@@ -0,0 +1,93 @@
+"""
+Polyphase resampler for the ingest path.
+
+Converts device audio (8 / 22.05 / 44.1 / 48 kHz ...) to the Vosk model rate.
+For in_rate -> out_rate the ratio is reduced to L/M (upsample by L, keep every
+M-th sample). One windowed-sinc prototype filter is split into L phases, and
+every output sample is a short dot product with the phase it lands on.
+A whole chunk is one gather + one einsum.
+
+Filter history and the fractional output position carry over between
+chunks, so feeding audio in 1 KB pieces gives the same result as feeding it
+all at once. Input may be (n,) for one stream or (streams, n) for a batch of
+streams that share the same rate pair.
+"""
+
+from math import gcd
+
+import numpy as np
+
+ZERO_CROSSINGS = 16  # filter length, in zero crossings of the sinc
+KAISER_BETA = 8.0
+
+
+def taps_per_phase(up: int, down: int, zero_crossings: int = ZERO_CROSSINGS) -> int:
+    # decimation needs a longer filter (in input samples) than interpolation
+    return -(-zero_crossings * max(up, down) // up)
+
+
+def design_filter(up: int, down: int, taps: int) -> np.ndarray:
+    """
+    Returns the polyphase filter bank, shape (up, taps).
+    bank[p, k] multiplies input sample (q - k) for an output at phase p.
+    """
+    n = up * taps
+    # cutoff at the lower of the two Nyquist rates, a little inside it
+    fc = 0.5 / max(up, down) * 0.92
+    t = np.arange(n) - (n - 1) / 2
+    h = 2 * fc * np.sinc(2 * fc * t) * np.kaiser(n, KAISER_BETA)
+    h *= up / h.sum()
+    return h.reshape(taps, up).T.astype(np.float32)
+
+
+class Resampler:
+    def __init__(self, in_rate: int, out_rate: int, streams: int = 1):
+        g = gcd(in_rate, out_rate)
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.up = out_rate // g
+        self.down = in_rate // g
+        self.taps = taps_per_phase(self.up, self.down)
+        self.bank = design_filter(self.up, self.down, self.taps)
+        self._history = np.zeros((streams, self.taps - 1), dtype=np.float32)
+        self._t = 0  # next output position, in upsampled units from chunk start
+        self._tail = b""
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        """Resamples one chunk. x: (n,) or (streams, n). Returns float32."""
+        single = x.ndim == 1
+        x = np.atleast_2d(x).astype(np.float32, copy=False)
+        n = x.shape[1]
+
+        buf = np.concatenate([self._history, x], axis=1)
+        self._history = buf[:, -(self.taps - 1) :]
+
+        # outputs whose newest input sample falls inside this chunk
+        count = max(0, -(-(n * self.up - self._t) // self.down))
+        t = self._t + self.down * np.arange(count)
+        q, phase = np.divmod(t, self.up)
+        self._t += count * self.down - n * self.up
+
+        idx = q[:, None] + (self.taps - 1) - np.arange(self.taps)[None, :]
+        y = np.einsum("sck,ck->sc", buf[:, idx], self.bank[phase])
+        return y[0] if single else y
+
+    def process_bytes(self, pcm: bytes) -> bytes:
+        """PCM16 bytes in, PCM16 bytes out (single stream)."""
+        pcm = self._tail + pcm
+        even = len(pcm) & ~1
+        self._tail = pcm[even:]
+        x = np.frombuffer(pcm[:even], dtype="<i2")
+        y = self.process(x)
+        return np.clip(np.rint(y), -32768, 32767).astype("<i2").tobytes()
+
+
+class Passthrough:
+    def process_bytes(self, pcm: bytes) -> bytes:
+        return pcm
+
+
+def make_resampler(in_rate: int, out_rate: int):
+    if in_rate == out_rate:
+        return Passthrough()
+    return Resampler(in_rate, out_rate)
@@ -0,0 +1,126 @@
+"""
+Single-producer / single-consumer byte ring in shared memory.
+
+Moves a session's audio from the process that reads the socket to the
+process that decodes it without pickling it: the writer copies PCM into the
+ring once, the reader decodes it in place, and all that crosses the process
+boundary is an 8-byte notification per write, and a reader that fell behind
+takes all pending ones in one read().
+
+    ring = RingWriter()                            # front-end, one per session
+    proc = Process(target=decode, args=ring.reader_args())
+    ring.write(pcm)                                # False: ring full, chunk dropped
+
+    reader = RingReader(*args)                     # decode process
+    while (view := reader.read()) is not None:     # None: writer closed
+        feed(view)                                 # memoryview into the ring
+        reader.release(len(view))
+
+Only the writer moves head and only the reader moves tail (both byte counts
+since the start, so head - tail is unread), so neither needs a lock. tail
+lives in the shared header. head travels in the notification, and the reader
+never takes it from memory: a pipe write and read are system calls, which
+order the copied bytes before the head that announces them on any CPU. The
+reader stores tail only after it is done with the bytes, so a stale tail
+makes the writer see less free space, never more.
+"""
+
+import multiprocessing
+import os
+import struct
+from multiprocessing import shared_memory
+
+RING_BYTES = 1 << 18  # 8 s of 16 kHz PCM16
+HEADER = 64  # tail (u64) at 0, rest padding (own cache line)
+_U64 = struct.Struct("<Q")
+
+
+class RingWriter:
+    def __init__(self, size: int = RING_BYTES):
+        self.size = size
+        self.shm = shared_memory.SharedMemory(create=True, size=HEADER + size)
+        self.buf = self.shm.buf
+        _U64.pack_into(self.buf, 0, 0)
+        self._notify_r, self._notify = multiprocessing.Pipe(duplex=False)
+        self.head = 0
+        self.dropped = 0  # bytes refused because the ring was full
+
+    def reader_args(self) -> tuple:
+        """What RingReader() needs, picklable for a multiprocessing.Process."""
+        return self.shm.name, self.size, self._notify_r
+
+    def free(self) -> int:
+        return self.size - (self.head - _U64.unpack_from(self.buf, 0)[0])
+
+    def write(self, data) -> bool:
+        """Copies `data` in and notifies the reader; False (nothing written) if it doesn't fit."""
+        n = len(data)
+        if n > self.free():
+            self.dropped += n
+            return False
+        pos = self.head % self.size
+        first = min(n, self.size - pos)
+        self.buf[HEADER + pos : HEADER + pos + first] = data[:first]
+        if first < n:
+            self.buf[HEADER : HEADER + n - first] = data[first:]
+        self.head += n
+        os.write(self._notify.fileno(), _U64.pack(self.head))  # < PIPE_BUF: never split
+        return True
+
+    def close(self):
+        """
+        Tells the reader there is no more (after what it hasn't read yet) and
+        unlinks the ring; a reader that has attached keeps its mapping.
+        """
+        self._notify.close()  # the reader's read() sees EOF
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class RingReader:
+    def __init__(self, name: str, size: int, notify):
+        self.size = size
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.buf = self.shm.buf
+        self._notify = notify
+        self.head = 0
+        self.tail = 0
+        self.eof = False
+
+    def _wait(self, timeout: float | None) -> bool:
+        """Takes every pending notification (the last one has the newest head); False on timeout."""
+        if timeout is not None and not self._notify.poll(timeout):
+            return False
+        msg = os.read(self._notify.fileno(), 8 * 512)  # whole notifications only, they are written whole
+        if not msg:
+            self.eof = True
+        else:
+            self.head = _U64.unpack_from(msg, len(msg) - 8)[0]
+        return True
+
+    def read(self, timeout: float | None = None):
+        """
+        A memoryview of the next unread bytes, in place (up to the end of
+        the ring; the rest comes on the next call). Valid until release();
+        copy it to keep it. b"" on timeout, None once the writer closed and
+        everything was read.
+        """
+        while self.head == self.tail:
+            if self.eof:
+                return None
+            if not self._wait(timeout):
+                return b""
+        pos = self.tail % self.size
+        n = min(self.head - self.tail, self.size - pos)
+        return self.buf[HEADER + pos : HEADER + pos + n]
+
+    def release(self, n: int):
+        """Hands `n` bytes (from the last read()) back to the writer."""
+        self.tail += n
+        _U64.pack_into(self.buf, 0, self.tail)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        self._notify.close()
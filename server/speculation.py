@@ -0,0 +1,102 @@
+"""
+Speculative work on stable partial transcripts.
+
+Partials often contain the whole utterance well before Vosk (or the
+endpointer) produces the FINAL. Once a partial has not changed for
+`stable_ms`, the Speculator starts `start_fn(text)` in the background.
+When the FINAL arrives, take() hands back the running future if the text
+matches (commit) and drops it otherwise (cancel).
+
+Only side-effect-free work belongs here (LLM request, TTS prefetch); commands
+still run only after the FINAL.
+"""
+
+import time
+
+import stats
+import tracing
+
+STABLE_MS = 250
+
+
+class Speculator:
+    def __init__(self, executor, start_fn, stable_ms: int = STABLE_MS):
+        self.executor = executor
+        self.start_fn = start_fn
+        self.stable_ms = stable_ms
+
+        self._text = ""
+        self._since = 0.0
+        self._future = None
+        self._future_text = ""
+        self._started_at = 0.0  # audio ms when the speculation started
+
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved = stats.Histogram()  # ms of work already done when FINAL came
+
+    def on_partial(self, text: str, now_ms: float):
+        """Call for every partial that could become a speculative request."""
+        if text != self._text:
+            self._text = text
+            self._since = now_ms
+            return
+        if not text or (self._future is not None and self._future_text == text):
+            return
+        if now_ms - self._since < self.stable_ms:
+            return
+
+        self.cancel()
+        started_wall = time.monotonic()
+
+        def run():
+            result = self.start_fn(text)
+            return result, (time.monotonic() - started_wall) * 1000.0
+
+        # traced with the utterance it speculates on; a dropped request does not hold the turn back
+        self._future = self.executor.submit(tracing.wrap(run, hold=False))
+        self._future_text = text
+        self._started_at = now_ms
+        self.started += 1
+
+    def take(self, text: str, now_ms: float):
+        """
+        Returns the speculative result for `text` (blocking until it is done),
+        or None if nothing matching was started.
+        """
+        fut, fut_text = self._future, self._future_text
+        self._future, self._future_text, self._text = None, "", ""
+        if fut is None:
+            return None
+
+        if fut_text != text:
+            fut.cancel()
+            self.misses += 1
+            return None
+
+        try:
+            result, took_ms = fut.result()
+        except Exception:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        # the head start only helps up to the time the work actually took
+        self.saved.observe(min(now_ms - self._started_at, took_ms))
+        return result
+
+    def cancel(self):
+        if self._future is not None:
+            self._future.cancel()
+            self.misses += 1
+        self._future, self._future_text = None, ""
+
+    def report(self) -> str:
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return (
+            f"speculation: started={self.started} hits={self.hits} "
+            f"misses={self.misses} hit rate={rate:.0f}%\n"
+            + self.saved.render("speculation latency saved")
+        )
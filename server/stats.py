@@ -0,0 +1,109 @@
+"""
+Small in-process latency statistics.
+"""
+
+import bisect
+import threading
+import time
+
+# upper bounds in ms; the last bucket is open-ended
+DEFAULT_BUCKETS_MS = (25, 50, 100, 200, 300, 400, 600, 800, 1000, 1500, 2000, 3000, 5000)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self) -> tuple[list, int, float]:
+        """(per-bucket counts, count, sum), read together."""
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile (0..100)."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = p / 100.0 * self.count
+            seen = 0
+            for i, c in enumerate(self.counts):
+                seen += c
+                if seen >= rank and c:
+                    return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def render(self, title: str, width: int = 30) -> str:
+        with self._lock:
+            counts = list(self.counts)
+        top = max(counts) or 1
+        lines = [
+            f"{title}: n={self.count} mean={self.mean():.0f}ms "
+            f"p50<={self.percentile(50):g}ms p90<={self.percentile(90):g}ms"
+        ]
+        lo = 0
+        for i, c in enumerate(counts):
+            hi = f"{self.buckets[i]}" if i < len(self.buckets) else "inf"
+            bar = "#" * round(c / top * width)
+            lines.append(f"  {lo:>5}-{hi:<5} {c:>5} {bar}")
+            lo = self.buckets[i] if i < len(self.buckets) else lo
+        return "\n".join(lines)
+
+
+class StageCPU:
+    """
+    CPU time of one thread split into stages: lap(stage) charges the thread's
+    CPU time since the previous lap to `stage`. Counts (audio seconds,
+    finals, ...) ride along; merge() adds another StageCPU into this one.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+        self._t = time.thread_time()
+        self._lock = threading.Lock()
+
+    def lap(self, stage: str):
+        now = time.thread_time()
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + now - self._t
+        self._t = now
+
+    def count(self, name: str, n: float = 1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def merge(self, other: "StageCPU"):
+        with self._lock:
+            for k, v in other.seconds.items():
+                self.seconds[k] = self.seconds.get(k, 0.0) + v
+            for k, v in other.counts.items():
+                self.counts[k] = self.counts.get(k, 0) + v
+
+    def snapshot(self) -> tuple[dict, dict]:
+        """(seconds per stage, counts), copied together."""
+        with self._lock:
+            return dict(self.seconds), dict(self.counts)
+
+    def render(self, title: str, audio_s: float = 0.0) -> str:
+        seconds, counts = self.snapshot()
+        total = sum(seconds.values())
+        head = f"{title}: {total * 1000.0:.0f}ms CPU"
+        if audio_s:
+            head += f" for {audio_s:.1f}s of audio (RTF {total / audio_s:.3f})"
+        lines = [head]
+        for stage, s in sorted(seconds.items(), key=lambda kv: -kv[1]):
+            lines.append(f"  {stage:<12} {s * 1000.0:9.1f}ms {s * 100.0 / total if total else 0.0:5.1f}%")
+        if counts:
+            lines.append("  " + " ".join(f"{k}={v:g}" for k, v in counts.items()))
+        return "\n".join(lines)
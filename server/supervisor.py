@@ -0,0 +1,295 @@
+"""
+Several server processes on one port, under a supervisor.
+
+One process decodes every device's audio under one GIL. With WORKERS > 1 in
+final.py, main() hands over to Supervisor.run() instead: it starts WORKERS
+processes (multiprocessing, spawn), each of which loads its own models, binds
+the same port with SO_REUSEPORT and keeps its own sessions; the kernel spreads
+new connections over them (Linux; macOS accepts the option but hands every
+connection to one socket). Workers share nothing but the on-disk caches
+(disk_cache.py). The supervisor loads no models.
+
+    kill -HUP <supervisor>     rolling restart: per slot, a new worker starts, and once
+                               it is listening the old one stops accepting and closes
+                               each session when it is idle (up to drain_s)
+    kill -TERM <supervisor>    (or Ctrl-C) the same drain for every worker, then exit
+    kill -USR1/-USR2           forwarded to every worker (profiling.install_signals)
+
+A worker that dies is started again, after a growing delay if it keeps dying
+early. Every stats_s each worker sends its load and its metrics text over a
+pipe; the supervisor logs the load and serves all workers' metrics on one
+/metrics, labelled worker="<slot>" and pid.
+"""
+
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import threading
+import time
+
+import log
+import metrics
+
+DRAIN_S = 30.0
+STATS_S = 10.0
+READY_TIMEOUT_S = 300.0  # a new worker loads its models before it listens
+KILL_GRACE_S = 5.0  # after drain_s, SIGKILL
+RESPAWN_MIN_S = 1.0
+RESPAWN_MAX_S = 60.0
+HEALTHY_S = 60.0  # a worker that ran this long is restarted without delay
+SUMMARY_S = 60.0  # load summary in the log every this many seconds
+
+LOG = log.get("supervisor")
+
+
+def worker_main(slot: int, conn, serve, load, collect, stats_s: float):
+    """
+    Body of a worker process. serve(slot, stopping, ready) loads what it
+    needs, calls ready() once it listens, and returns after `stopping` is set
+    and its sessions are done. load() -> dict and collect() -> metrics text
+    are sent to the supervisor every stats_s.
+    """
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C hits the whole group; the supervisor decides
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    log.set_process_context(worker=slot)
+    lock = threading.Lock()
+
+    def send(msg: dict):
+        try:
+            with lock:
+                conn.send(msg)
+        except (OSError, ValueError):
+            stopping.set()  # the supervisor is gone
+
+    def report():
+        while not stopping.wait(stats_s):
+            send({"load": load(), "metrics": collect()})
+
+    threading.Thread(target=report, daemon=True, name="worker-stats").start()
+    try:
+        serve(slot, stopping, lambda: send({"ready": True}))
+    finally:
+        send({"load": load(), "metrics": collect()})
+        log.flush()
+
+
+class _Worker:
+    def __init__(self, slot: int, process, conn):
+        self.slot = slot
+        self.process = process
+        self.conn = conn  # None once the pipe is closed
+        self.started = time.monotonic()
+        self.ready = False
+        self.stop_deadline = None  # set once asked to stop
+        self.load = {}
+        self.metrics = ""
+
+    @property
+    def stopping(self) -> bool:
+        return self.stop_deadline is not None
+
+
+class Supervisor:
+    def __init__(self, workers: int, serve, load, collect, drain_s: float = DRAIN_S, stats_s: float = STATS_S):
+        self.workers = workers
+        self.serve, self.load, self.collect = serve, load, collect  # see worker_main
+        self.drain_s = drain_s
+        self.stats_s = stats_s
+        self.procs = []
+        self.respawns = 0
+        self._ctx = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()  # procs, for the metrics thread
+        self._delay = {}  # slot -> current respawn delay
+        self._respawn_at = {}  # slot -> monotonic time
+        self._pending = []  # slots still to replace (rolling restart)
+        self._replacing = None  # (old workers, new worker, since)
+        self._stop = False
+
+    # ---- processes ----
+
+    def _spawn(self, slot: int) -> _Worker:
+        ours, theirs = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=worker_main,
+            args=(slot, theirs, self.serve, self.load, self.collect, self.stats_s),
+            name=f"worker{slot}",
+            daemon=True,
+        )
+        process.start()
+        theirs.close()
+        w = _Worker(slot, process, ours)
+        with self._lock:
+            self.procs.append(w)
+        LOG.info("worker started", worker=slot, pid=process.pid)
+        return w
+
+    def _terminate(self, w: _Worker):
+        if w.stopping:
+            return
+        w.stop_deadline = time.monotonic() + self.drain_s + KILL_GRACE_S
+        LOG.info("stopping worker", worker=w.slot, pid=w.process.pid)
+        if w.process.is_alive():
+            w.process.terminate()  # SIGTERM: drain
+
+    def _live(self, slot: int) -> list:
+        return [w for w in self.procs if w.slot == slot and not w.stopping]
+
+    def _receive(self, w: _Worker):
+        try:
+            while w.conn is not None and w.conn.poll():
+                msg = w.conn.recv()
+                if msg.get("ready") and not w.ready:
+                    w.ready = True
+                    LOG.info("worker ready", worker=w.slot, pid=w.process.pid,
+                             after_s=round(time.monotonic() - w.started, 1))
+                if "load" in msg:
+                    w.load, w.metrics = msg["load"], msg["metrics"]
+        except (EOFError, OSError):
+            w.conn.close()
+            w.conn = None
+
+    def _exited(self, w: _Worker):
+        self._receive(w)
+        w.process.join()
+        if w.conn is not None:
+            w.conn.close()
+            w.conn = None
+        with self._lock:
+            self.procs.remove(w)
+        up_s = time.monotonic() - w.started
+        if w.stopping or self._stop:
+            LOG.info("worker stopped", worker=w.slot, pid=w.process.pid, exitcode=w.process.exitcode)
+            return
+        LOG.warning("worker died", worker=w.slot, pid=w.process.pid, exitcode=w.process.exitcode,
+                    up_s=round(up_s, 1))
+        if self._live(w.slot):
+            return  # its replacement (or the one it was replacing) carries on
+        if up_s >= HEALTHY_S:
+            delay = RESPAWN_MIN_S
+        else:
+            delay = min(self._delay.get(w.slot, RESPAWN_MIN_S / 2) * 2, RESPAWN_MAX_S)
+        self._delay[w.slot] = delay
+        self._respawn_at[w.slot] = time.monotonic() + delay
+
+    def _poll(self, timeout: float):
+        """Reads worker messages and reaps exited workers, waiting up to timeout."""
+        with self._lock:
+            procs = list(self.procs)
+        by_conn = {w.conn: w for w in procs if w.conn is not None}
+        sentinels = [w.process.sentinel for w in procs]
+        for ready in multiprocessing.connection.wait([*by_conn, *sentinels], timeout):
+            if ready in by_conn:
+                self._receive(by_conn[ready])
+        for w in procs:
+            if not w.process.is_alive():
+                self._exited(w)
+        now = time.monotonic()
+        for w in procs:
+            if w.stopping and now > w.stop_deadline and w.process.is_alive():
+                LOG.warning("worker did not stop in time, killing it", worker=w.slot, pid=w.process.pid)
+                w.process.kill()
+
+    def _respawn(self):
+        now = time.monotonic()
+        for slot, at in list(self._respawn_at.items()):
+            if now >= at:
+                del self._respawn_at[slot]
+                if not self._live(slot):
+                    self.respawns += 1
+                    self._spawn(slot)
+
+    def _restart_step(self):
+        """One step of a rolling restart: replace a slot once its new worker listens."""
+        now = time.monotonic()
+        if self._replacing is None:
+            if not self._pending:
+                return
+            slot = self._pending.pop(0)
+            self._replacing = (self._live(slot), self._spawn(slot), now)
+            return
+        old, new, since = self._replacing
+        if new.ready:
+            for w in old:
+                self._terminate(w)
+            self._replacing = None
+        elif new not in self.procs or now - since > READY_TIMEOUT_S:
+            LOG.error("new worker did not come up, keeping the old one; restart abandoned", worker=new.slot)
+            self._terminate(new)
+            self._pending.clear()
+            self._replacing = None
+
+    # ---- signals ----
+
+    def _on_stop(self, signum, frame):
+        if self._stop:  # second Ctrl-C: don't wait for the drain
+            for w in list(self.procs):
+                w.process.kill()
+        self._stop = True
+
+    def _on_hup(self, signum, frame):
+        LOG.info("rolling restart")
+        self._pending = list(range(self.workers))
+
+    def _forward(self, signum, frame):
+        for w in list(self.procs):
+            if w.process.is_alive():
+                os.kill(w.process.pid, signum)
+
+    # ---- report ----
+
+    def summary(self) -> str:
+        with self._lock:
+            procs = sorted(self.procs, key=lambda w: (w.slot, w.started))
+        parts = []
+        for w in procs:
+            state = "stopping" if w.stopping else "ready" if w.ready else "starting"
+            load = " ".join(f"{k}={v:g}" if isinstance(v, (int, float)) else f"{k}={v}" for k, v in w.load.items())
+            parts.append(f"  worker {w.slot} pid={w.process.pid} {state} {load}".rstrip())
+        return "\n".join([f"workers ({self.respawns} respawned)"] + parts)
+
+    def collect_metrics(self) -> str:
+        """The supervisor's /metrics: worker states and every worker's own metrics."""
+        with self._lock:
+            procs = list(self.procs)
+        labels = lambda w: {"worker": w.slot, "pid": w.process.pid}
+        lines = metrics.gauge_lines(
+            "minigpt_worker_up", "1 while the worker accepts connections, 0 while it starts or drains.",
+            ((labels(w), int(w.ready and not w.stopping)) for w in procs),
+        )
+        lines += metrics.counter_lines(
+            "minigpt_worker_respawns_total", "Workers started again after dying.", [({}, self.respawns)]
+        )
+        lines += metrics.merged_lines((labels(w), w.metrics) for w in procs if w.metrics)
+        return "\n".join(lines) + "\n"
+
+    def run(self, metrics_host: str = "127.0.0.1", metrics_port: int = 0):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_hup)
+        signal.signal(signal.SIGUSR1, self._forward)
+        signal.signal(signal.SIGUSR2, self._forward)
+        LOG.info(f"starting {self.workers} workers")
+        for slot in range(self.workers):
+            self._spawn(slot)
+        if metrics_port:
+            metrics.MetricsServer(self.collect_metrics, metrics_host, metrics_port).start()
+
+        last_summary = time.monotonic()
+        while not self._stop:
+            self._poll(0.5)
+            self._respawn()
+            self._restart_step()
+            if time.monotonic() - last_summary >= SUMMARY_S:
+                last_summary = time.monotonic()
+                LOG.info(self.summary())
+
+        LOG.info(self.summary())
+        LOG.info("stopping workers")
+        for w in list(self.procs):
+            self._terminate(w)
+        while self.procs:
+            self._poll(0.5)
+        log.flush()
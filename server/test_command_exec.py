@@ -0,0 +1,53 @@
+# Run: python -m pytest server/test_command_exec.py
+import threading
+
+import command_exec
+
+
+def run(fn, deadline_s: float):
+    runner = command_exec.CommandRunner()
+    done, timed_out, finished = [], [], threading.Event()
+
+    def on_done(result):
+        done.append(result)
+        finished.set()
+
+    def on_timeout():
+        timed_out.append(True)
+        finished.set()
+
+    runner.submit("device", "test", fn, deadline_s, on_done, on_timeout)
+    assert finished.wait(5)
+    runner.executor.shutdown(wait=True)
+    return runner, done, timed_out
+
+
+def test_sleep_past_deadline_times_out():
+    # the job's own sleep() sees the deadline first, not the timer
+    for _ in range(30):
+        runner, done, timed_out = run(lambda: command_exec.sleep(1.0) or "reply", 0.01)
+        assert timed_out == [True] and done == []
+        assert runner.counts["timeout"] == 1 and runner.counts["done"] == 0
+
+
+def test_finishes_in_time():
+    runner, done, timed_out = run(lambda: "reply", 1.0)
+    assert done == ["reply"] and timed_out == []
+    assert runner.counts["done"] == 1
+
+
+def test_cancelled_is_not_a_timeout():
+    started = threading.Event()
+    runner = command_exec.CommandRunner()
+    calls = []
+
+    def fn():
+        started.set()
+        command_exec.sleep(1.0)
+        return "reply"
+
+    runner.submit("device", "test", fn, 0.5, calls.append, lambda: calls.append("timeout"))
+    assert started.wait(5)
+    runner.cancel("device")
+    runner.executor.shutdown(wait=True)
+    assert calls == [] and runner.counts["cancelled"] == 1 and runner.counts["timeout"] == 0
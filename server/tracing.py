@@ -0,0 +1,310 @@
+"""
+Optional per-turn traces in Chrome trace-event format.
+
+With tracing on, spans (recv batches, AcceptWaveform, commands, OpenAI
+requests, TTS cache lookups, socket sends, ...) are recorded with the session
+as the process and the real thread as the thread, and every turn is written
+to its own JSON file. Open it in chrome://tracing or https://ui.perfetto.dev
+to see which wait dominated one slow turn.
+
+Spans find their session and turn through the calling thread:
+
+    session = tracing.Session("ESP32@10.0.0.5")   # one per connection
+    tracing.set_current(session.context())         # handle_client's thread
+    with tracing.span("recv"): ...
+    n = session.final("turn on travis scott")      # utterance heard
+    ctx = tracing.capture()                        # hand work to another thread
+    ...  with tracing.bind(ctx): ...               # (worker) spans go to turn n
+
+handle_client calls session.listen() before reading more audio, so audio for
+the next utterance goes to the next turn. A turn's file is written once
+handle_client has moved on and nothing captured for the turn is still
+running (commands, queued speech), or when the session closes.
+
+With tracing off, span() returns a shared no-op context manager.
+"""
+
+import contextlib
+import itertools
+import json
+import os
+import re
+import threading
+import time
+
+ENABLED = False
+OUT_DIR = "traces"
+MAX_EVENTS_PER_TURN = 50000  # a turn that never ends can't eat all memory
+
+_local = threading.local()
+_pids = itertools.count(1)
+_SAFE_RE = re.compile(r"[^\w.@-]+")
+
+
+def _now_us() -> float:
+    return time.perf_counter_ns() / 1000.0
+
+
+class Context:
+    """Where spans of the current thread go: a session and a turn (None = the one being heard)."""
+
+    __slots__ = ("session", "turn", "held")
+
+    def __init__(self, session, turn, held: bool = False):
+        self.session = session
+        self.turn = turn
+        self.held = held  # counts against the turn being written out
+
+
+class Session:
+    def __init__(self, name: str, out_dir: str | None = None):
+        self.pid = next(_pids)
+        self.name = name
+        self.out_dir = out_dir or OUT_DIR
+        self.turn = 1  # the utterance being heard now
+        self._heard = False
+        self._lock = threading.Lock()
+        self._events = {}  # turn -> [event]
+        self._holds = {}  # turn -> spans open + contexts captured
+        self._labels = {}  # turn -> recognized text
+        self._threads = {}  # tid -> thread name
+        self._done = set()  # turns already written; late events are dropped
+        self.written = []  # paths of the files written
+
+    def context(self) -> Context:
+        return Context(self, None)
+
+    def final(self, text: str) -> int:
+        """The utterance being heard is complete. Returns its turn number."""
+        with self._lock:
+            self._labels[self.turn] = text
+            self._heard = True
+            return self.turn
+
+    def listen(self):
+        """About to read audio again: new spans without a turn go to the next one."""
+        if not self._heard:
+            return
+        with self._lock:
+            self._heard = False
+            self.turn += 1
+        self._flush_ready()
+
+    # ---- recording ----
+
+    def _hold(self, turn: int):
+        with self._lock:
+            if turn not in self._done:
+                self._holds[turn] = self._holds.get(turn, 0) + 1
+
+    def _release(self, turn: int):
+        with self._lock:
+            if turn in self._done:
+                return
+            self._holds[turn] = self._holds.get(turn, 0) - 1
+        self._flush_ready()
+
+    def _add(self, turn: int, event: dict):
+        t = threading.current_thread()
+        with self._lock:
+            if turn in self._done:
+                return
+            events = self._events.setdefault(turn, [])
+            if len(events) < MAX_EVENTS_PER_TURN:
+                events.append(event)
+            self._threads.setdefault(t.ident, t.name)
+
+    # ---- output ----
+
+    def _flush_ready(self):
+        with self._lock:
+            # handle_client is done with every turn before the current one
+            ready = [t for t in self._events if t < self.turn and not self._holds.get(t)]
+        for t in sorted(ready):
+            self.write_turn(t)
+
+    def write_turn(self, turn: int) -> str | None:
+        with self._lock:
+            events = self._events.pop(turn, None)
+            label = self._labels.pop(turn, "")
+            self._holds.pop(turn, None)
+            self._done.add(turn)
+            threads = dict(self._threads)
+        if not events:
+            return None
+
+        start = min(e["ts"] for e in events)
+        end = max(e["ts"] + e.get("dur", 0) for e in events)
+        meta = [
+            {"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": self.name}},
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": 0, "args": {"name": "turn"}},
+        ]
+        meta += [
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+            for tid, name in threads.items()
+        ]
+        root = {
+            "name": f"turn {turn}: {label}" if label else f"turn {turn}",
+            "cat": "turn", "ph": "X", "pid": self.pid, "tid": 0,
+            "ts": start, "dur": end - start, "args": {"turn": turn, "text": label},
+        }
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        slug = _SAFE_RE.sub("_", label)[:40].strip("_")
+        path = os.path.join(
+            self.out_dir, f"{_SAFE_RE.sub('_', self.name)}-s{self.pid}-t{turn:04d}{'-' + slug if slug else ''}.json"
+        )
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": meta + [root] + events, "displayTimeUnit": "ms"}, f)
+        self.written.append(path)
+        return path
+
+    def close(self):
+        """Writes every turn still in memory."""
+        with self._lock:
+            turns = sorted(self._events)
+        for t in turns:
+            self.write_turn(t)
+
+
+# ---- thread binding ----
+
+
+def current() -> Context | None:
+    return getattr(_local, "ctx", None)
+
+
+def set_current(ctx: Context | None):
+    """Binds the calling thread for good (handle_client's loop); see bind() for a with-block."""
+    _local.ctx = ctx
+
+
+def capture() -> Context | None:
+    """
+    The calling thread's context, pinned to its turn, for work handed to
+    another thread. The turn's file waits until the context is bound and
+    released (or release() is called for work that never runs).
+    """
+    ctx = current()
+    if ctx is None:
+        return None
+    s = ctx.session
+    turn = ctx.turn if ctx.turn is not None else s.turn
+    s._hold(turn)
+    return Context(s, turn, held=True)
+
+
+def pin() -> Context | None:
+    """
+    Like capture(), but the turn's file does not wait for it: for work that
+    may be dropped without ever running (speculative requests).
+    """
+    ctx = current()
+    if ctx is None:
+        return None
+    return Context(ctx.session, ctx.turn if ctx.turn is not None else ctx.session.turn)
+
+
+def release(ctx: Context | None):
+    if ctx is not None and ctx.held:
+        ctx.held = False
+        ctx.session._release(ctx.turn)
+
+
+@contextlib.contextmanager
+def bind(ctx: Context | None):
+    """Spans in the with-block go to `ctx`."""
+    prev = current()
+    _local.ctx = ctx
+    try:
+        yield ctx
+    finally:
+        _local.ctx = prev
+        release(ctx)
+
+
+def wrap(fn, hold: bool = True):
+    """fn bound to the caller's context, to run on another thread (hold: see pin())."""
+    if not ENABLED or current() is None:
+        return fn
+    ctx = capture() if hold else pin()
+
+    def run(*args, **kwargs):
+        with bind(ctx):
+            return fn(*args, **kwargs)
+
+    return run
+
+
+# ---- spans ----
+
+
+class _Span:
+    __slots__ = ("ctx", "turn", "name", "cat", "args", "start")
+
+    def __init__(self, ctx, name, cat, args):
+        self.ctx = ctx
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        s = self.ctx.session
+        self.turn = self.ctx.turn if self.ctx.turn is not None else s.turn
+        s._hold(self.turn)
+        self.start = _now_us()
+        return self
+
+    def set(self, **args):
+        """Adds args known only at the end (bytes read, cache hit, ...)."""
+        self.args.update(args)
+
+    def __exit__(self, *exc):
+        end = _now_us()
+        s = self.ctx.session
+        args = dict(self.args, turn=self.turn)
+        if exc[0] is not None:
+            args["error"] = exc[0].__name__
+        s._add(self.turn, {
+            "name": self.name, "cat": self.cat, "ph": "X", "pid": s.pid,
+            "tid": threading.get_ident(), "ts": self.start, "dur": end - self.start, "args": args,
+        })
+        s._release(self.turn)
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, cat: str = "", **args):
+    """A span on the calling thread's session/turn; a no-op when tracing is off or unbound."""
+    if not ENABLED:
+        return _NULL_SPAN
+    ctx = getattr(_local, "ctx", None)
+    if ctx is None:
+        return _NULL_SPAN
+    return _Span(ctx, name, cat, args)
+
+
+def instant(name: str, cat: str = "", after_ms: float = 0.0, **args):
+    """A zero-length marker (FINAL, route decision) on the current turn, now or `after_ms` from now."""
+    ctx = current() if ENABLED else None
+    if ctx is None:
+        return
+    s = ctx.session
+    turn = ctx.turn if ctx.turn is not None else s.turn
+    s._add(turn, {
+        "name": name, "cat": cat, "ph": "i", "s": "t", "pid": s.pid,
+        "tid": threading.get_ident(), "ts": _now_us() + after_ms * 1000.0, "args": dict(args, turn=turn),
+    })
@@ -0,0 +1,150 @@
+"""
+Per-turn latency: where the time between "user stopped talking" and "reply
+finished playing" goes.
+
+A turn starts at a FINAL. Code along the way marks stages as they happen,
+from whatever thread does the work (handle_client, the command runner,
+speak_worker):
+
+    speech_end -> final -> route -> llm_first -> llm_done -> tts_first
+               -> audio_first -> playback_end
+
+Each mark records how long the stage took since the previous stage this turn
+reached (commands skip the LLM stages) into a histogram per (stage, device),
+plus end of speech -> first audio byte per device. Only the first mark of a
+stage counts, so a command's "Done." after its ack does not move the numbers.
+"""
+
+import itertools
+import threading
+import time
+
+import metrics
+import stats
+import tracing
+
+STAGES = ("final", "route", "llm_first", "llm_done", "tts_first", "audio_first", "playback_end")
+
+
+class Turn:
+    def __init__(self, tracker, turn_id: int, device: str, speech_end: float, final_at: float):
+        self.tracker = tracker
+        self.id = turn_id
+        self.device = device
+        self.route = ""  # "command", "llm", "wake", ... once decided
+        self.speech_end = speech_end
+        self.marks = {"final": final_at}
+        self._lock = threading.Lock()
+
+    def mark(self, stage: str, at: float | None = None) -> bool:
+        """Records `stage` now (or at monotonic time `at`). False if already marked."""
+        if at is None:
+            at = time.monotonic()
+        with self._lock:
+            if stage in self.marks:
+                return False
+            i = STAGES.index(stage)
+            prev = self.speech_end
+            for s in reversed(STAGES[:i]):
+                if s in self.marks:
+                    prev = self.marks[s]
+                    break
+            self.marks[stage] = at
+        tracing.instant(stage, "turn", after_ms=max(0.0, (at - time.monotonic()) * 1000.0), turn_id=self.id)
+        self.tracker._observe(self, stage, (at - prev) * 1000.0)
+        return True
+
+    def since_speech_ms(self, stage: str) -> float | None:
+        t = self.marks.get(stage)
+        return None if t is None else (t - self.speech_end) * 1000.0
+
+
+class TurnTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._current = {}  # owner (conn) -> Turn
+        self.stages = {}  # (stage, device) -> Histogram, ms
+        self.first_audio = {}  # device -> Histogram, end of speech -> first audio byte
+        self.routes = {}  # (route, device) -> turns
+
+    def begin(self, owner, device: str, speech_ago_ms: float | None = None) -> Turn:
+        """A FINAL arrived `speech_ago_ms` after the end of speech (None: unknown)."""
+        now = time.monotonic()
+        speech_end = now - speech_ago_ms / 1000.0 if speech_ago_ms is not None else now
+        turn = Turn(self, next(self._ids), device, speech_end, now)
+        with self._lock:
+            self._current[owner] = turn
+        if speech_ago_ms is not None:
+            self._observe(turn, "final", speech_ago_ms)
+        return turn
+
+    def current(self, owner) -> Turn | None:
+        with self._lock:
+            return self._current.get(owner)
+
+    def end(self, owner):
+        with self._lock:
+            self._current.pop(owner, None)
+
+    def routed(self, turn: Turn | None, route: str):
+        if turn is None:
+            return
+        turn.route = route
+        tracing.instant(f"route: {route}", "turn")
+        if turn.mark("route"):
+            key = (route, turn.device)
+            with self._lock:
+                self.routes[key] = self.routes.get(key, 0) + 1
+
+    def _observe(self, turn: Turn, stage: str, ms: float):
+        with self._lock:
+            hist = self.stages.get((stage, turn.device))
+            if hist is None:
+                hist = self.stages[(stage, turn.device)] = stats.Histogram()
+            first = None
+            if stage == "audio_first":
+                first = self.first_audio.get(turn.device)
+                if first is None:
+                    first = self.first_audio[turn.device] = stats.Histogram()
+        hist.observe(ms)
+        if first is not None:
+            first.observe(turn.since_speech_ms("audio_first"))
+
+    def prometheus(self) -> list:
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda kv: (STAGES.index(kv[0][0]), kv[0][1]))
+            first = sorted(self.first_audio.items())
+            routes = sorted(self.routes.items())
+        return [
+            *metrics.histogram_lines(
+                "minigpt_turn_stage_seconds",
+                "Time spent in each stage of a turn (since the previous stage reached).",
+                (({"stage": s, "device": d}, h) for (s, d), h in stages),
+            ),
+            *metrics.histogram_lines(
+                "minigpt_turn_first_audio_seconds",
+                "End of speech to the first reply audio byte sent to the device.",
+                (({"device": d}, h) for d, h in first),
+            ),
+            *metrics.counter_lines(
+                "minigpt_turns_total",
+                "Turns by how they were handled.",
+                (({"route": r, "device": d}, n) for (r, d), n in routes),
+            ),
+        ]
+
+    def report(self, device: str) -> str:
+        with self._lock:
+            stages = [(s, self.stages.get((s, device))) for s in STAGES]
+            first = self.first_audio.get(device)
+        lines = [f"turn stages ({device}):"]
+        for stage, hist in stages:
+            if hist is not None and hist.count:
+                lines.append(
+                    f"  {stage:<13} n={hist.count:<4} mean={hist.mean():6.0f}ms p50<={hist.percentile(50):g}ms "
+                    f"p90<={hist.percentile(90):g}ms"
+                )
+        if first is not None and first.count:
+            lines.append(first.render(f"end of speech -> first audio ({device})"))
+        return "\n".join(lines)
@@ -0,0 +1,216 @@
+"""
+Weather lookups from wttr.in, shared by final.py and advanced.py.
+
+The old get_weather_wttr() opened a new HTTPS connection for every
+"weather"/"погода" and cached nothing. WeatherService adds:
+
+- a per-location cache (TTL_S; errors are not cached);
+- single-flight: concurrent lookups of the same location share one request;
+- a small pool of keep-alive connections, so a cache miss skips TCP + TLS setup;
+- optional background refresh of the default location (start_prefetch), so
+  the most common question ("погода" with no city) is always a cache hit.
+
+base_url can point at any server that answers GET /<location>?format=3 the
+way wttr.in does (bench_weather.py runs a local one).
+"""
+
+import http.client
+import queue
+import threading
+import time
+import urllib.parse
+
+import log
+import stats
+
+BASE_URL = "https://wttr.in"
+DEFAULT_LOCATION = "Astana"
+TTL_S = 600.0  # wttr.in data itself only changes every ~15 min
+TIMEOUT_S = 5.0
+POOL_SIZE = 2
+
+LOG = log.get("weather")
+
+RU_WORDS = (
+    ("Feels like", "Ощущается как"),
+    ("Clear", "Ясно"),
+    ("Sunny", "Солнечно"),
+    ("Partly cloudy", "Переменная облачность"),
+    ("Cloudy", "Облачно"),
+    ("Overcast", "Пасмурно"),
+    ("Rain", "Дождь"),
+    ("Snow", "Снег"),
+    ("Mist", "Туман"),
+    ("Wind", "Ветер"),
+)
+
+
+def localize(text: str, lang: str) -> str:
+    """Turns the raw wttr.in line into the reply to speak."""
+    if lang == "ru":
+        for en, ru in RU_WORDS:
+            text = text.replace(en, ru)
+        return f"Погода: {text}"
+    return f"Weather: {text}"
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.text = None
+        self.error = None
+
+
+class WeatherService:
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        ttl_s: float = TTL_S,
+        timeout_s: float = TIMEOUT_S,
+        pool_size: int = POOL_SIZE,
+        default_location: str = DEFAULT_LOCATION,
+    ):
+        url = urllib.parse.urlsplit(base_url)
+        self._conn_class = (
+            http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        )
+        self._netloc = url.netloc
+        self._path = url.path.rstrip("/")
+        self.ttl_s = ttl_s
+        self.timeout_s = timeout_s
+        self.default_location = default_location
+
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self._cache = {}  # key -> (fetched_at, text)
+        self._inflight = {}  # key -> _Flight
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetch_latency = stats.Histogram()  # upstream requests only, ms
+
+    # ---- HTTP ----
+
+    def _connect(self):
+        return self._conn_class(self._netloc, timeout=self.timeout_s)
+
+    @staticmethod
+    def _get(conn, path: str):
+        """(response, body); closes conn if the request fails."""
+        try:
+            conn.request("GET", path, headers={"User-Agent": "curl/8", "Connection": "keep-alive"})
+            resp = conn.getresponse()
+            return resp, resp.read().decode("utf-8", errors="ignore").strip()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            raise
+
+    def _request(self, path: str) -> str:
+        try:
+            conn, reused = self._pool.get_nowait(), True
+        except queue.Empty:
+            conn, reused = self._connect(), False
+
+        try:
+            resp, body = self._get(conn, path)
+        except (http.client.HTTPException, OSError) as e:
+            if not reused or isinstance(e, TimeoutError):
+                raise
+            # the server closed an idle pooled connection; retry once on a new
+            # one (not from the pool, whose other connections may be as stale)
+            conn = self._connect()
+            resp, body = self._get(conn, path)
+
+        if resp.status != 200:
+            conn.close()
+            raise OSError(f"HTTP {resp.status}")
+        if resp.will_close:
+            conn.close()
+        else:
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+        return body
+
+    def _fetch(self, location: str) -> str:
+        t0 = time.monotonic()
+        text = self._request(f"{self._path}/{urllib.parse.quote(location)}?format=3")
+        self.fetch_latency.observe((time.monotonic() - t0) * 1000.0)
+        return text
+
+    # ---- cache + single-flight ----
+
+    def lookup(self, location: str = "", max_age_s: float | None = None) -> str:
+        """Raw one-line weather for `location`. Raises on network errors."""
+        location = (location or "").strip() or self.default_location
+        key = location.lower()
+        ttl = self.ttl_s if max_age_s is None else max_age_s
+
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None and time.monotonic() - hit[0] < ttl:
+                self.hits += 1
+                return hit[1]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not flight.done.wait(self.timeout_s * 2):
+                raise OSError("weather lookup timed out")
+            if flight.error is not None:
+                raise flight.error
+            return flight.text
+
+        try:
+            flight.text = self._fetch(location)
+            if flight.text:
+                with self._lock:
+                    self._cache[key] = (time.monotonic(), flight.text)
+            return flight.text
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def reply(self, location: str, lang: str) -> str:
+        """What the assistant says for "weather <location>"."""
+        try:
+            text = self.lookup(location)
+        except Exception as e:
+            LOG.error("weather error", error=e)
+            return "Не удалось получить погоду." if lang == "ru" else "I couldn't fetch the weather right now."
+        if not text:
+            return "Пустой ответ от сервиса погоды."
+        return localize(text, lang)
+
+    # ---- prefetch ----
+
+    def start_prefetch(self, interval_s: float | None = None):
+        """Keeps the default location fresh in the background (refreshes before the TTL runs out)."""
+        interval_s = interval_s or self.ttl_s * 0.8
+
+        def loop():
+            while True:
+                try:
+                    self.lookup(self.default_location, max_age_s=0)
+                except Exception as e:
+                    LOG.warning("weather prefetch error", error=e)
+                time.sleep(interval_s)
+
+        threading.Thread(target=loop, daemon=True, name="weather-prefetch").start()
+
+    def report(self) -> str:
+        return (
+            f"weather: hits={self.hits} misses={self.misses} coalesced={self.coalesced}\n"
+            + self.fetch_latency.render("weather fetch")
+        )